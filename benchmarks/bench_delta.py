@@ -0,0 +1,129 @@
+"""Pack size and delta encoding throughput on a synthetic history.
+
+Builds a throwaway repository whose files are edited a little in every
+commit, then packs it without deltas, with gitlite's delta search and (if git
+is installed) with `git repack -adf` for reference.
+
+    python benchmarks/bench_delta.py [--commits N] [--files N]
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gitlite.repo import GitRepository
+from gitlite.index import read_index, write_index
+from gitlite.staging import add_paths, write_tree_from_index
+from gitlite.objects.commit import GitCommit
+from gitlite.storage import object_write, object_read_raw
+from gitlite.maintenance import collect_reachable, find_deltas, repack
+from gitlite.pack.delta import create_delta
+from gitlite.pack.types import OBJ_BLOB
+
+
+def build_history(repo, commits, files, rng):
+    contents = {f"src/file{i}.txt": [f"line {j} of file {i}\n" for j in range(rng.randint(200, 2000))]
+                for i in range(files)}
+    parent = None
+    for n in range(commits):
+        for name in rng.sample(sorted(contents), max(1, files // 4)):
+            lines = contents[name]
+            for _ in range(rng.randint(1, 5)):
+                pos = rng.randrange(len(lines))
+                if rng.random() < 0.5:
+                    lines[pos] = f"edited in commit {n}\n"
+                else:
+                    lines.insert(pos, f"added in commit {n}\n")
+        for name, lines in contents.items():
+            path = repo.worktree / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("".join(lines))
+
+        index = read_index(repo)
+        add_paths(repo, index, [repo.worktree])
+        tree = write_tree_from_index(repo, index)
+        write_index(repo, index)
+        commit = GitCommit()
+        commit.kvlm[b'tree'] = tree.encode()
+        if parent:
+            commit.kvlm[b'parent'] = parent.encode()
+        commit.kvlm[b'author'] = b'Bench <bench@example.com> 0 +0000'
+        commit.kvlm[b'committer'] = b'Bench <bench@example.com> 0 +0000'
+        commit.kvlm[None] = f"commit {n}\n".encode()
+        parent = object_write(commit, repo)
+
+    with open(repo.gitdir / "refs" / "heads" / "master", "w") as f:
+        f.write(parent + "\n")
+
+
+def pack_size(repo):
+    return sum(p.stat().st_size for p in (repo.gitdir / "objects" / "pack").glob("*.pack"))
+
+
+def set_window(repo, window):
+    with open(repo.gitdir / "config", "a") as f:
+        f.write(f"[pack]\n\twindow = {window}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=40)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_delta_"))
+    try:
+        repo = GitRepository(tmp / "repo", force=True)
+        repo.init()
+        build_history(repo, args.commits, args.files, random.Random(args.seed))
+        objects = collect_reachable(repo)
+        raw = sum(len(object_read_raw(repo, sha)[1]) for sha, _, _ in objects)
+        print(f"{len(objects)} objects, {raw / 1024:.0f} KiB uncompressed")
+
+        # Encoder throughput over consecutive revisions of each blob
+        pairs = []
+        by_name = {}
+        for sha, type_num, name in objects:
+            if type_num == OBJ_BLOB:
+                by_name.setdefault(name, []).append(object_read_raw(repo, sha)[1])
+        for revisions in by_name.values():
+            pairs += zip(revisions, revisions[1:])
+        start = time.perf_counter()
+        encoded = sum(len(create_delta(base, target)) for base, target in pairs)
+        elapsed = time.perf_counter() - start
+        target_bytes = sum(len(target) for _, target in pairs)
+        print(f"create_delta: {len(pairs)} pairs, {target_bytes / elapsed / 1e6:.1f} MB/s, "
+              f"{encoded / target_bytes:.1%} of target size")
+
+        no_delta = tmp / "no-delta"
+        shutil.copytree(repo.gitdir, no_delta / ".git")
+        plain = GitRepository(no_delta, force=True)
+        set_window(plain, 0)
+        repack(plain, all_objects=True, delete_redundant=True)
+        print(f"pack without deltas: {pack_size(plain) / 1024:8.1f} KiB")
+
+        start = time.perf_counter()
+        repack(repo, all_objects=True, delete_redundant=True)
+        elapsed = time.perf_counter() - start
+        deltas = len(find_deltas(repo, objects))
+        print(f"pack with deltas:    {pack_size(repo) / 1024:8.1f} KiB "
+              f"({deltas} deltas, {elapsed:.2f}s)")
+
+        if shutil.which("git"):
+            subprocess.run(["git", "repack", "-adfq"], cwd=repo.worktree, check=True,
+                           env={**os.environ, "GIT_DIR": str(repo.gitdir)})
+            print(f"git repack -adf:     {pack_size(repo) / 1024:8.1f} KiB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
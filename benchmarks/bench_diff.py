@@ -0,0 +1,123 @@
+"""Line diff speed on large files, against difflib.
+
+Generates a few kinds of large text files (source-like code, a lock file
+with many repeated lines, a sorted list with a block moved), edits each, and
+times every gitlite algorithm and difflib's unified_diff, which gitlite used
+before. Hunks are also compared with `git diff --no-index` when git is
+installed.
+
+    python benchmarks/bench_diff.py [--lines N] [--edits N]
+"""
+import argparse
+import difflib
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gitlite.linediff import ALGORITHMS, split_lines, unified_diff
+
+
+def source_file(lines, rng):
+    out = []
+    while len(out) < lines:
+        name = f"func_{len(out)}"
+        out.append(f"def {name}(arg):\n")
+        for i in range(rng.randint(3, 12)):
+            out.append(f"    value = arg * {rng.randint(0, 99)} + {i}\n")
+        out.append("    return value\n")
+        out.append("\n")
+    return out
+
+
+def lock_file(lines, rng):
+    out = []
+    while len(out) < lines:
+        out.append(f'[[package]]\n')
+        out.append(f'name = "pkg-{len(out)}"\n')
+        out.append(f'version = "1.{rng.randint(0, 20)}.0"\n')
+        out.append('source = "registry+https://example.com/index"\n')
+        out.append("\n")
+    return out
+
+
+def sorted_list(lines, rng):
+    return [f"{word:06d}\n" for word in sorted(rng.sample(range(10 * lines), lines))]
+
+
+def edit(lines, edits, rng):
+    lines = list(lines)
+    for n in range(edits):
+        pos = rng.randrange(len(lines))
+        choice = rng.random()
+        if choice < 0.4:
+            lines[pos] = f"    changed {n}\n"
+        elif choice < 0.7:
+            lines.insert(pos, f"    inserted {n}\n")
+        else:
+            del lines[pos:pos + rng.randint(1, 4)]
+    return lines
+
+
+def move_block(lines, rng):
+    lines = list(lines)
+    start = rng.randrange(len(lines) // 2)
+    block = lines[start:start + len(lines) // 10]
+    del lines[start:start + len(block)]
+    lines[len(lines) - len(block):len(lines) - len(block)] = block
+    return lines
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    cases = []
+    for name, make in [("source", source_file), ("lock file", lock_file)]:
+        old = make(args.lines, rng)
+        cases.append((name, old, edit(old, args.edits, rng)))
+    old = sorted_list(args.lines, rng)
+    cases.append(("moved block", old, move_block(old, rng)))
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_diff_"))
+    try:
+        for name, old, new in cases:
+            print(f"{name}: {len(old)} -> {len(new)} lines")
+            _, elapsed = timed(lambda: list(difflib.unified_diff(old, new, "a", "b")))
+            print(f"  {'difflib':<10} {elapsed:7.3f}s")
+
+            (tmp / "a").write_text("".join(old))
+            (tmp / "b").write_text("".join(new))
+            a = split_lines((tmp / "a").read_text())
+            b = split_lines((tmp / "b").read_text())
+            for algorithm in ALGORITHMS:
+                patch, elapsed = timed(lambda: "".join(unified_diff(a, b, "a/a", "b/b", algorithm)))
+                note = ""
+                if shutil.which("git"):
+                    expected = subprocess.run(
+                        ["git", "diff", "--no-index", "--no-color", f"--diff-algorithm={algorithm}", "a", "b"],
+                        cwd=tmp, capture_output=True, text=True).stdout
+                    expected = expected[expected.index("--- "):]
+                    note = "  same as git" if patch == expected else "  DIFFERS from git"
+                print(f"  {algorithm:<10} {elapsed:7.3f}s  {patch.count(chr(10)):6d} lines{note}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
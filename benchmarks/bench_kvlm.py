@@ -0,0 +1,74 @@
+"""Commit and tag header parsing and serialization speed.
+
+Builds commits with a growing number of parent lines, a signed commit with
+a long `gpgsig` continuation block, and annotated tags with messages of
+several sizes, then times kvlm_parse (full and headers only) and
+kvlm_serialize on each.
+
+    python benchmarks/bench_kvlm.py [--repeat N]
+"""
+import argparse
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gitlite.objects.kvlm import kvlm_parse, kvlm_serialize
+
+PERSON = b"Bench <bench@example.com> 1700000000 +0000"
+
+
+def fake_sha(n):
+    return hashlib.sha1(str(n).encode()).hexdigest().encode()
+
+
+def commit(parents, message=b"A commit\n", signature_lines=0):
+    lines = [b"tree " + fake_sha("tree")]
+    lines += [b"parent " + fake_sha(i) for i in range(parents)]
+    lines += [b"author " + PERSON, b"committer " + PERSON]
+    if signature_lines:
+        block = [b"-----BEGIN PGP SIGNATURE-----", b""]
+        block += [b"iQIzBAABCAAdFiEE" + b"x" * 48] * signature_lines
+        block += [b"-----END PGP SIGNATURE-----"]
+        lines.append(b"gpgsig " + b"\n ".join(block))
+    return b"\n".join(lines) + b"\n\n" + message
+
+
+def tag(message):
+    lines = [b"object " + fake_sha("commit"), b"type commit", b"tag v1.0", b"tagger " + PERSON]
+    return b"\n".join(lines) + b"\n\n" + message
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [(f"commit, {n} parents", commit(n)) for n in (1, 16, 256, 4096)]
+    cases.append(("commit, 2000-line gpgsig", commit(1, signature_lines=2000)))
+    cases += [(f"tag, {n // 1024} KiB message", tag(b"line of text\n" * (n // 13))) for n in (1024, 256 * 1024)]
+
+    print(f"{'object':<28} {'bytes':>9} {'parse':>10} {'headers':>10} {'serialize':>10}")
+    for name, raw in cases:
+        kvlm = kvlm_parse(raw)
+        assert kvlm_serialize(kvlm) == raw
+        parse = timed(lambda: kvlm_parse(raw), args.repeat)
+        headers = timed(lambda: kvlm_parse(raw, headers_only=True), args.repeat)
+        serialize = timed(lambda: kvlm_serialize(kvlm), args.repeat)
+        print(f"{name:<28} {len(raw):>9} {parse * 1e6:>8.1f}us {headers * 1e6:>8.1f}us {serialize * 1e6:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
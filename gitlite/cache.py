@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from .pack.types import OBJ_BLOB
+
+DEFAULT_OBJECT_CACHE_SIZE = 32 * 1024 * 1024
+DEFAULT_BLOB_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class _Budget:
+    """One LRU list of objects and the bytes it may hold."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.evictions = 0
+
+    def put(self, sha, type_num, data):
+        old = self.entries.pop(sha, None)
+        if old is not None:
+            self.total_bytes -= len(old[1])
+
+        self.entries[sha] = (type_num, data)
+        self.total_bytes += len(data)
+
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "limit": self.max_bytes,
+        }
+
+
+class ObjectCache:
+    """LRU cache of inflated objects keyed by SHA, bounded by the size of their data.
+
+    Trees, commits and tags share one budget and blobs have their own, so a
+    few large files cannot push out the trees and commits that walks and
+    diffs read over and over. Objects never change, so entries stay valid
+    for the life of the repository. Data is kept as (type_num, bytes) rather
+    than parsed objects, which callers are free to modify. `stats()` reports
+    hits, misses and evictions. Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_OBJECT_CACHE_SIZE, max_blob_bytes=DEFAULT_BLOB_CACHE_SIZE):
+        self.objects = _Budget(max_bytes)
+        self.blobs = _Budget(max_blob_bytes)
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, sha):
+        with self._lock:
+            for budget in (self.objects, self.blobs):
+                entry = budget.entries.get(sha)
+                if entry is not None:
+                    budget.hits += 1
+                    budget.entries.move_to_end(sha)
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, sha, type_num, data):
+        budget = self.blobs if type_num == OBJ_BLOB else self.objects
+        if len(data) > budget.max_bytes:
+            return
+        # Callers may modify the bytearray they were given
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        with self._lock:
+            budget.put(sha, type_num, data)
+
+    def clear(self):
+        with self._lock:
+            for budget in (self.objects, self.blobs):
+                budget.entries.clear()
+                budget.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.objects.hits + self.blobs.hits,
+                "misses": self.misses,
+                "evictions": self.objects.evictions + self.blobs.evictions,
+                "objects": self.objects.stats(),
+                "blobs": self.blobs.stats(),
+            }
@@ -1,32 +1,418 @@
-from .storage import object_read
- 
-def checkout_tree(repo, tree, path):
-    """Restore the working tree from a Tree object."""
-    if not path.exists():
-        path.mkdir(parents=True, exist_ok=True)
-    
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from .config import get_config_int
+from .storage import object_read, object_open, object_locations, object_hash_file, STREAM_CHUNK
+from .index import GitIndexEntry
+from .staging import read_gitignore, is_ignored
+from .diff import diff_tree_to_tree, read_tree_items, is_tree_mode, MODE_GITLINK
+
+# As in git: serial by default, and only worth it for larger checkouts
+DEFAULT_WORKERS = 1
+DEFAULT_PARALLEL_THRESHOLD = 100
+
+
+def _check_name(name):
+    # Security: a tree entry is a single path component
+    if name in ("", ".", "..", ".git") or "/" in name or "\\" in name:
+        raise ValueError(f"Invalid path in tree object: {name}")
+
+
+def _check_dir(repo, path, checked):
+    """Make sure `path` (a directory) does not lead out of the worktree, e.g.
+    through a symlink. Each directory is resolved once."""
+    if path in checked:
+        return
+    try:
+        path.resolve().relative_to(repo.worktree.resolve())
+    except ValueError:
+        raise ValueError(f"Path attempts to escape repository: {path}")
+    checked.add(path)
+
+
+def _make_parent(repo, item_path, checked):
+    # Check the closest directory that exists before creating anything in it
+    existing = item_path.parent
+    while existing not in checked and not existing.is_dir():
+        existing = existing.parent
+    _check_dir(repo, existing, checked)
+    item_path.parent.mkdir(parents=True, exist_ok=True)
+
+
+def _write_blob(repo, sha, item_path):
+    # Stream blobs so large files are never held in memory whole
+    reader = object_open(repo, sha)
+    if reader is None:
+        raise ValueError(f"Missing blob {sha} for {item_path}")
+    if os.path.islink(item_path):
+        # Never write through a symlink left in the worktree
+        os.unlink(item_path)
+    with reader, open(item_path, "wb") as f:
+        shutil.copyfileobj(reader, f, STREAM_CHUNK)
+
+
+def write_blobs(repo, jobs, workers=None):
+    """Write blobs into the working tree. `jobs` is a list of (rel_path, sha)
+    whose parent directories exist; returns the stat of each written file.
+
+    With more than one worker (checkout.workers, below 1 meaning one per CPU)
+    and at least checkout.thresholdForParallelism files, the work is spread
+    over a thread pool; zlib and file I/O release the GIL. Jobs are handed
+    out in runs ordered by pack and offset, so each thread reads its part of
+    a pack front to back and delta chains shared by neighbouring files stay
+    in the delta base cache.
+    """
+    if workers is None:
+        workers = get_config_int(repo, "checkout.workers", DEFAULT_WORKERS)
+        if workers < 1:
+            workers = os.cpu_count() or 1
+    threshold = get_config_int(repo, "checkout.thresholdForParallelism", DEFAULT_PARALLEL_THRESHOLD)
+
+    stats = [None] * len(jobs)
+
+    def write(positions):
+        for i in positions:
+            rel_path, sha = jobs[i]
+            item_path = repo.worktree / rel_path
+            _write_blob(repo, sha, item_path)
+            stats[i] = os.stat(item_path)
+
+    if workers <= 1 or len(jobs) < max(threshold, 2):
+        write(range(len(jobs)))
+        return stats
+
+    order = _pack_order(repo, jobs)
+    # A few runs per worker, so one slow run does not hold up the rest
+    run = max(1, len(order) // (workers * 4))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(write, order[i:i + run]) for i in range(0, len(order), run)]:
+            future.result()
+    return stats
+
+
+def _pack_order(repo, jobs):
+    """Positions in `jobs` sorted by where their objects are stored."""
+    loose, packed, missing = object_locations(repo, [sha for _, sha in jobs])
+    rank = {sha: n for n, sha in enumerate(loose + [sha for _, _, sha in packed] + missing)}
+    return sorted(range(len(jobs)), key=lambda i: rank[jobs[i][1]])
+
+
+def checkout_tree(repo, tree, path, index=None, tree_sha=None):
+    """Restore the working tree from a Tree object.
+
+    The tree is walked first, creating directories, and the files are then
+    written by write_blobs (in parallel if configured).
+
+    If `index` is given, an entry with the written file's stat data is recorded
+    for every blob so later commands can tell the file is unchanged, and
+    `tree_sha` (with the SHAs of subtrees) is recorded in the index cache-tree.
+    Returns the number of index entries below the tree, or None if it could
+    not be cached.
+    """
+    jobs = []
+    cached = []
+    entry_count = _collect_tree(repo, tree, path, tree_sha, jobs, cached, set())
+    stats = write_blobs(repo, [(rel_path, sha) for rel_path, sha, _ in jobs])
+
+    if index is not None:
+        for (rel_path, sha, mode), st in zip(jobs, stats):
+            entry = GitIndexEntry(rel_path, sha, mode)
+            entry.update_stat(st)
+            index.add(entry)
+        # After the entries, which invalidate the trees they are added to
+        for dirs, sha, count in cached:
+            node = index.cache_tree.find(dirs, create=True)
+            node.entry_count = count
+            node.sha = sha
+
+    return entry_count
+
+
+def _collect_tree(repo, tree, path, tree_sha, jobs, cached, checked):
+    """Create the directories of `tree` under `path` and list its blobs in
+    `jobs` as (rel_path, sha, mode). Cacheable trees go to `cached` as
+    (dirs, sha, entry_count). Returns the entry count, or None."""
+    path.mkdir(parents=True, exist_ok=True)
+    _check_dir(repo, path, checked)
+    rel_dir = path.relative_to(repo.worktree).as_posix()
+    prefix = "" if rel_dir == "." else rel_dir + "/"
+
+    entry_count = 0
+
     for item in tree.items:
-        item_name = item['path'].decode()
-
-        # Security: Validate path doesn't escape worktree
-        if '..' in item_name or item_name.startswith('/') or item_name.startswith('\\'):
-            raise ValueError(f"Invalid path in tree object: {item_name}")
-
-        item_path = path / item_name
-
-        # Double-check resolved path is within worktree
-        try:
-            item_path.resolve().relative_to(repo.worktree.resolve())
-        except ValueError:
-            raise ValueError(f"Path attempts to escape repository: {item_name}")
-
-        sha = item['sha']
-        
-        obj = object_read(repo, sha)
-        
-        if obj.fmt == b'tree':
-            checkout_tree(repo, obj, item_path)
-        elif obj.fmt == b'blob':
-            item_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(item_path, "wb") as f:
-                f.write(obj.blobdata)
\ No newline at end of file
+        item_name = item.path.decode()
+        _check_name(item_name)
+
+        sha = item.sha
+        mode = item.mode
+
+        if mode.startswith(b'04') or mode == b'40000':
+            count = _collect_tree(repo, object_read(repo, sha), path / item_name, sha, jobs, cached, checked)
+            if count is None or entry_count is None:
+                entry_count = None
+            else:
+                entry_count += count
+        elif mode.startswith(b'16'):
+            # Submodule commit; there is no object for it in this repository,
+            # nor an index entry, so the enclosing trees cannot be cached
+            entry_count = None
+        else:
+            jobs.append((prefix + item_name, sha, int(mode, 8)))
+            if entry_count is not None:
+                entry_count += 1
+
+    if tree_sha and entry_count is not None:
+        cached.append((rel_dir.split("/") if prefix else [], tree_sha, entry_count))
+
+    return entry_count
+
+
+def checkout_changes(repo, index, old_tree_sha, new_tree_sha):
+    """Switch the working tree and `index` from one tree to another, touching
+    only the files that differ between them.
+
+    The two trees are diffed (identical subtrees are skipped unread), deleted
+    files are removed along with directories left empty, and added or
+    modified files are written and their index entries refreshed. Everything
+    else, including local changes to files the trees agree on, is left alone.
+
+    Nothing is touched if a file to be removed or replaced has local changes
+    (staged or not), or if an untracked file is in the way; a ValueError
+    with git's message is raised instead. Returns the list of FileChanges
+    applied.
+    """
+    changes = diff_tree_to_tree(repo, old_tree_sha, new_tree_sha)
+    worktree = repo.worktree
+    checked = set()
+    for change in changes:
+        for name in change.path.split("/"):
+            _check_name(name)
+    _check_overwrites(repo, index, changes)
+
+    # The cached trees can be carried over only if the index held exactly
+    # the old tree; note what they were before the index changes
+    root = index.cache_tree
+    cache_plan = None
+    if root.is_valid() and root.sha == old_tree_sha:
+        cache_plan = _cache_tree_plan(repo, index, changes, old_tree_sha)
+
+    # Deletions first, so a file and a directory can swap places
+    emptied = set()
+    for change in changes:
+        if change.status not in ('D', 'T'):
+            continue
+        item_path = worktree / change.path
+        if change.old_mode == MODE_GITLINK:
+            try:
+                item_path.rmdir()
+            except OSError:
+                pass
+        else:
+            try:
+                item_path.unlink()
+            except FileNotFoundError:
+                pass
+            index.remove(change.path)
+        emptied.add(item_path.parent)
+
+    for directory in sorted(emptied, key=lambda p: len(p.parts), reverse=True):
+        while directory != worktree:
+            try:
+                directory.rmdir()
+            except OSError:
+                # Not empty (or already gone)
+                break
+            directory = directory.parent
+
+    writes = []
+    for change in changes:
+        if change.status == 'D':
+            continue
+        item_path = worktree / change.path
+        _make_parent(repo, item_path, checked)
+        if change.new_mode == MODE_GITLINK:
+            # Submodules are not checked out; git leaves an empty directory
+            item_path.mkdir(exist_ok=True)
+            continue
+        writes.append(change)
+
+    stats = write_blobs(repo, [(change.path, change.new_sha) for change in writes])
+    for change, st in zip(writes, stats):
+        entry = GitIndexEntry(change.path, change.new_sha, change.new_mode)
+        entry.update_stat(st)
+        index.add(entry)
+
+    if cache_plan is not None:
+        _refresh_cache_tree(repo, root, cache_plan, new_tree_sha)
+    return changes
+
+
+def _check_overwrites(repo, index, changes):
+    """Raise ValueError if applying `changes` would lose local changes or
+    untracked files, as git refuses to. An ignored file may be overwritten
+    by a file, but not replaced by a directory or emptied out of one."""
+    worktree = repo.worktree
+    rules = read_gitignore(worktree)
+    rules.append(".git")
+    # Tracked paths this checkout removes or replaces; they may be in the way
+    replaced = {c.path for c in changes if c.old_mode and c.old_mode != MODE_GITLINK}
+
+    dirty = []
+    overwritten = []
+    lost_dirs = []
+    for change in changes:
+        path = change.path
+        full_path = worktree / path
+        entry = index.entries.get(path)
+
+        if path in replaced:
+            if entry is None:
+                # Unstaged: fine only if it is gone for good and nothing replaces it
+                clean = not change.new_mode and not os.path.lexists(full_path)
+            else:
+                clean = (entry.sha == change.old_sha and entry.mode == change.old_mode
+                         and _worktree_matches(index, entry, full_path))
+            if not clean:
+                dirty.append(path)
+                continue
+        if not change.new_mode or change.new_mode == MODE_GITLINK:
+            continue
+
+        if path not in replaced:
+            if entry is not None:
+                # Staged but not in the current commit; fine if it is the new file
+                if (entry.sha != change.new_sha or entry.mode != change.new_mode
+                        or not _worktree_matches(index, entry, full_path)):
+                    dirty.append(path)
+                continue
+            if full_path.is_dir():
+                if any(p not in replaced for p in _files_below(worktree, path)):
+                    lost_dirs.append(path)
+                continue
+            if os.path.lexists(full_path) and not _is_ignored(worktree, path, rules):
+                overwritten.append(path)
+                continue
+
+        # A file where one of the new file's directories goes
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            parent = "/".join(parts[:i])
+            parent_path = worktree / parent
+            if parent_path.is_dir() or not os.path.lexists(parent_path):
+                continue
+            if parent not in replaced:
+                overwritten.append(parent)
+            break
+
+    errors = []
+    if dirty:
+        errors.append(_overwrite_error(
+            "Your local changes to the following files would be overwritten by checkout:", dirty,
+            "Please commit your changes or stash them before you switch branches."))
+    if overwritten:
+        errors.append(_overwrite_error(
+            "The following untracked working tree files would be overwritten by checkout:", overwritten,
+            "Please move or remove them before you switch branches."))
+    if lost_dirs:
+        errors.append(_overwrite_error(
+            "Updating the following directories would lose untracked files in them:", lost_dirs, ""))
+    if errors:
+        raise ValueError("\n".join(errors) + "\nAborting")
+
+
+def _overwrite_error(header, paths, advice):
+    return "\n".join([header] + [f"\t{p}" for p in sorted(set(paths))] + [advice])
+
+
+def _worktree_matches(index, entry, full_path):
+    """True if the file is unchanged since `entry` was staged, or is gone."""
+    try:
+        st = os.lstat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return True
+    if not os.path.isfile(full_path):
+        return False
+    return index.is_clean(entry, st) or object_hash_file(full_path) == entry.sha
+
+
+def _files_below(worktree, path):
+    """Worktree-relative paths of the files under directory `path`."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(worktree / path):
+        rel_dir = os.path.relpath(dirpath, worktree).replace(os.sep, "/")
+        # Symlinks to directories are listed but not followed
+        links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+        files += [f"{rel_dir}/{name}" for name in filenames + links]
+    return files
+
+
+def _is_ignored(worktree, path, rules):
+    # Ignored if the file or any directory above it is
+    full_path = worktree
+    for name in path.split("/"):
+        full_path = full_path / name
+        if is_ignored(full_path, rules):
+            return True
+    return False
+
+
+def _tree_lookup(repo, tree_sha, dirs, cache):
+    """SHA of the subtree at `dirs` (a tuple of names), or None."""
+    if not dirs:
+        return tree_sha
+    parent = _tree_lookup(repo, tree_sha, dirs[:-1], cache)
+    if parent is None:
+        return None
+    if parent not in cache:
+        cache[parent] = {item.path: item for item in read_tree_items(repo, parent)}
+    item = cache[parent].get(dirs[-1].encode())
+    return item.sha if item is not None and is_tree_mode(int(item.mode, 8)) else None
+
+
+def _cache_tree_plan(repo, index, changes, old_tree_sha):
+    """{dirs: entry count after the changes, or None if unknown} for every
+    directory containing a change."""
+    deltas = {}
+    unknown = set()
+    for change in changes:
+        parts = change.path.split("/")[:-1]
+        gitlink = MODE_GITLINK in (change.old_mode, change.new_mode)
+        delta = (1 if change.new_mode else 0) - (1 if change.old_mode else 0)
+        for depth in range(len(parts) + 1):
+            dirs = tuple(parts[:depth])
+            deltas[dirs] = deltas.get(dirs, 0) + delta
+            if gitlink:
+                # As in checkout_tree, trees holding submodules are not cached
+                unknown.add(dirs)
+
+    trees = {}
+    plan = {}
+    for dirs, delta in deltas.items():
+        node = index.cache_tree.find(dirs)
+        if dirs in unknown:
+            plan[dirs] = None
+        elif node is not None and node.is_valid():
+            plan[dirs] = node.entry_count + delta
+        elif node is None and _tree_lookup(repo, old_tree_sha, dirs, trees) is None:
+            # A new directory
+            plan[dirs] = delta
+        else:
+            plan[dirs] = None
+    return plan
+
+
+def _refresh_cache_tree(repo, root, plan, new_tree_sha):
+    trees = {}
+    # Children first, so a directory that is gone can be dropped from its parent
+    for dirs in sorted(plan, key=len, reverse=True):
+        sha = _tree_lookup(repo, new_tree_sha, dirs, trees)
+        if sha is None:
+            parent = root.find(dirs[:-1])
+            if parent is not None:
+                parent.children.pop(dirs[-1], None)
+            continue
+        if plan[dirs] is None:
+            continue
+        node = root.find(dirs, create=True)
+        node.sha = sha
+        node.entry_count = plan[dirs]
@@ -1,12 +1,14 @@
 import sys
 from .commands.base import cmd_init, cmd_cat_file, cmd_hash_object
 from .commands.commit import cmd_write_tree, cmd_commit
-from .commands.inspect import cmd_log, cmd_ls_tree
+from .commands.inspect import cmd_log, cmd_ls_tree, cmd_merge_base
 from .commands.checkout import cmd_checkout
 from .commands.branch import cmd_branch
 from .commands.tag import cmd_tag
 from .commands.config import cmd_config
 from .commands.diff import cmd_diff
+from .commands.stage import cmd_add, cmd_status
+from .commands.maintenance import cmd_gc, cmd_repack, cmd_commit_graph, cmd_fast_import
 from .help import show_help
  
 def cmd_help(args):
@@ -24,14 +26,21 @@ commands = {
     "cat-file": cmd_cat_file,
     "hash-object": cmd_hash_object,
     "write-tree": cmd_write_tree,
+    "add": cmd_add,
+    "status": cmd_status,
     "commit": cmd_commit,
     "log": cmd_log,
+    "merge-base": cmd_merge_base,
     "ls-tree": cmd_ls_tree,
     "checkout": cmd_checkout,
     "branch": cmd_branch,
     "tag": cmd_tag,
     "config": cmd_config,
     "diff": cmd_diff,
+    "gc": cmd_gc,
+    "repack": cmd_repack,
+    "commit-graph": cmd_commit_graph,
+    "fast-import": cmd_fast_import,
     "help": cmd_help
 }
  
@@ -1,8 +1,9 @@
+import shutil
 import sys
 from pathlib import Path
-from ..repo import GitRepository, repo_find
-from ..storage import object_read, object_write
-from ..objects.blob import GitBlob
+from ..repo import GitRepository, repo_find, resolve_ref
+from ..storage import object_open, object_info, object_hash_file, STREAM_CHUNK
+from ..pack.types import TYPE_NAMES
 
 def cmd_init(args):
     target = Path(args[0]) if args else Path.cwd()
@@ -10,26 +11,95 @@ def cmd_init(args):
     repo.init()
     print(f"Initialized empty Git repository in {repo.gitdir}")
 
+CAT_FILE_USAGE = ("usage: gitlite cat-file <type> <object>\n"
+                  "   or: gitlite cat-file (-t | -s) <object>\n"
+                  "   or: gitlite cat-file (--batch | --batch-check) [--buffer]")
+
 def cmd_cat_file(args):
+    if args and args[0] in ["--batch", "--batch-check"]:
+        if any(arg != "--buffer" for arg in args[1:]):
+            print(CAT_FILE_USAGE)
+            sys.exit(129)
+        repo = repo_find()
+        cat_file_batch(repo, sys.stdin.buffer, sys.stdout.buffer,
+                       contents=args[0] == "--batch", buffer="--buffer" in args)
+        return
+
     if len(args) != 2:
-        print("usage: gitlite cat-file <type> <object>")
+        print(CAT_FILE_USAGE)
         sys.exit(1)
     
     type_ = args[0]
     sha = args[1]
     
     repo = repo_find()
+
+    if type_ in ["-t", "-s"]:
+        # Only the object's header is needed
+        name = sha
+        sha = _batch_object_name(repo, name)
+        type_num, size = object_info(repo, sha) if sha else (None, None)
+        if type_num is None:
+            print(f"fatal: Not a valid object name {name}", file=sys.stderr)
+            sys.exit(128)
+        print(TYPE_NAMES[type_num].decode() if type_ == "-t" else size)
+        return
     
-    obj = object_read(repo, sha)
-    if not obj:
+    reader = object_open(repo, sha)
+    if not reader:
         print(f"fatal: Not a valid object name {sha}", file=sys.stderr)
         sys.exit(128)
  
-    if obj.fmt.decode() != type_:
-        print(f"fatal: git cat-file: object is of type {obj.fmt.decode()} but {type_} was specified", file=sys.stderr)
-        sys.exit(128)
-        
-    sys.stdout.buffer.write(obj.serialize())
+    with reader:
+        if reader.fmt.decode() != type_:
+            print(f"fatal: git cat-file: object is of type {reader.fmt.decode()} but {type_} was specified", file=sys.stderr)
+            sys.exit(128)
+
+        shutil.copyfileobj(reader, sys.stdout.buffer, STREAM_CHUNK)
+
+def _batch_object_name(repo, name):
+    """SHA an object name given to cat-file --batch resolves to, or None."""
+    sha = resolve_ref(repo, name).lower()
+    if len(sha) == 40 and all(c in '0123456789abcdef' for c in sha):
+        return sha
+    return None
+
+def cat_file_batch(repo, stdin, stdout, contents=True, buffer=False):
+    """Answer object names read one per line from `stdin`, as git does.
+
+    Each object is written as "<sha> <type> <size>", followed by its
+    contents and a newline when `contents` is set (--batch), or
+    "<name> missing". The repository, with its open packs and delta base
+    cache, is reused for every line. Output is flushed after each object
+    so the command can be driven interactively, or only at the end with
+    `buffer` (--buffer) when all input is given up front.
+    """
+    for line in stdin:
+        name = line.rstrip(b"\r\n").decode("utf-8", "surrogateescape").strip()
+        sha = _batch_object_name(repo, name) if name else None
+        reader = None
+        header = None
+        if contents:
+            reader = object_open(repo, sha) if sha else None
+            if reader is not None:
+                header = (reader.fmt, reader.size)
+        else:
+            # Only the header is needed, which saves resolving deltas
+            type_num, size = object_info(repo, sha) if sha else (None, None)
+            if type_num is not None:
+                header = (TYPE_NAMES[type_num], size)
+
+        if header is None:
+            stdout.write(name.encode("utf-8", "surrogateescape") + b" missing\n")
+        else:
+            stdout.write(b"%s %s %d\n" % (sha.encode(), *header))
+        if reader is not None:
+            with reader:
+                shutil.copyfileobj(reader, stdout, STREAM_CHUNK)
+                stdout.write(b"\n")
+        if not buffer:
+            stdout.flush()
+    stdout.flush()
 
 def cmd_hash_object(args):
     if not args:
@@ -45,15 +115,10 @@ def cmd_hash_object(args):
     if not path.is_file():
         print(f"fatal: Cannot open '{path}': No such file or directory", file=sys.stderr)
         sys.exit(128)
-        
-    with open(path, "rb") as f:
-        data = f.read()
-    
-    obj = GitBlob(data)
     
     repo = None
     if write:
         repo = repo_find()
     
-    sha = object_write(obj, repo)
+    sha = object_hash_file(path, repo)
     print(sha)
\ No newline at end of file
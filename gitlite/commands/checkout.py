@@ -1,7 +1,9 @@
 import sys
 from ..repo import repo_find, resolve_ref
 from ..storage import object_read
-from ..checkout import checkout_tree
+from ..checkout import checkout_tree, checkout_changes
+from ..index import GitIndex, write_index
+from ..staging import load_index
  
 def cmd_checkout(args):
     repo = repo_find()
@@ -19,6 +21,7 @@ def cmd_checkout(args):
         sys.exit(128)
         
     # If it's a commit, get the tree
+    tree_sha = sha
     if obj.fmt == b'commit':
         tree_sha = obj.kvlm[b'tree'].decode()
         obj = object_read(repo, tree_sha)
@@ -27,8 +30,21 @@ def cmd_checkout(args):
         print(f"fatal: {target} does not point to a tree or commit")
         sys.exit(128)
         
-    # Restore files
-    checkout_tree(repo, obj, repo.worktree)
+    # Only the files that differ from the current commit need touching;
+    # without one (e.g. before the first commit) everything is written
+    head_sha = resolve_ref(repo, "HEAD")
+    head = object_read(repo, head_sha) if head_sha else None
+    if head is not None and head.fmt == b'commit':
+        index = load_index(repo)
+        try:
+            checkout_changes(repo, index, head.kvlm[b'tree'].decode(), tree_sha)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        index = GitIndex()
+        checkout_tree(repo, obj, repo.worktree, index, tree_sha)
+    write_index(repo, index)
     
     # Update HEAD
     ref_path = repo.gitdir / "refs" / "heads" / target
@@ -2,7 +2,8 @@ import sys
 from ..repo import repo_find, resolve_ref
 from ..storage import object_read, object_write
 from ..objects.commit import GitCommit
-from ..staging import write_tree_recursive
+from ..objects.tree import EMPTY_TREE
+from ..staging import snapshot_index
 from ..utils import get_signature
 
 def cmd_write_tree(args):
@@ -10,29 +11,48 @@ def cmd_write_tree(args):
         print("usage: gitlite write-tree")
         sys.exit(1)
     repo = repo_find()
-    sha = write_tree_recursive(repo, repo.worktree)
+    sha = snapshot_index(repo)
     print(sha)
 
 def cmd_commit(args):
     repo = repo_find()
     
-    message = "No message"
-    if len(args) >= 2 and args[0] == "-m":
-        message = args[1]
-    else:
-        print("usage: gitlite commit -m <message>")
+    message = None
+    all_tracked = False
+    rest = list(args)
+    while rest:
+        arg = rest.pop(0)
+        if arg in ["-a", "--all"]:
+            all_tracked = True
+        elif arg == "-m" and rest:
+            message = rest.pop(0)
+        elif arg == "-am" and rest:
+            all_tracked = True
+            message = rest.pop(0)
+        else:
+            message = None
+            break
+    if message is None:
+        print("usage: gitlite commit [-a] -m <message>")
         sys.exit(1)
         
-    # 1. Create Tree
-    tree_sha = write_tree_recursive(repo, repo.worktree)
+    # 1. Create Tree from the index
+    tree_sha = snapshot_index(repo, all_tracked)
     
     # 2. Get Parent (HEAD)
     parent = resolve_ref(repo, "HEAD")
     parents = []
     
-    if object_read(repo, parent):
+    head = object_read(repo, parent)
+    if head:
         parents.append(parent)
     
+    # Like git, refuse a commit that would change nothing
+    parent_tree = head.kvlm[b'tree'].decode() if head else EMPTY_TREE
+    if tree_sha == parent_tree:
+        print("nothing to commit")
+        sys.exit(1)
+    
     # 3. Create Commit
     author_str = get_signature(repo)
     
@@ -1,31 +1,86 @@
 import sys
 from ..repo import repo_find, resolve_ref
 from ..storage import object_read
-from ..diff import diff_trees
- 
-def cmd_diff(args):
-    repo = repo_find()
-    
-    target = "HEAD"
-    if args:
-        target = args[0]
-        
-    sha = resolve_ref(repo, target)
-    if not sha:
-        print(f"fatal: bad object {target}")
-        sys.exit(128)
-        
-    obj = object_read(repo, sha)
+from ..staging import load_index
+from ..config import read_config
+from ..linediff import ALGORITHMS
+from ..diff import (
+    diff_tree_to_tree, diff_tree_to_index, diff_tree_to_worktree, diff_index_to_worktree,
+    print_patch, print_name_status, print_stat
+)
+
+DIFF_USAGE = ("usage: gitlite diff [--cached] [--name-status | --stat] "
+              "[--diff-algorithm=<algorithm>] [<commit> [<commit>]]")
+
+def resolve_tree(repo, rev):
+    """Tree SHA of a commit or tree name; exits like git if there is none."""
+    sha = resolve_ref(repo, rev)
+    obj = object_read(repo, sha) if sha else None
     if not obj:
-        print(f"fatal: bad object {sha}")
+        print(f"fatal: bad object {rev}")
         sys.exit(128)
-        
+
     if obj.fmt == b'commit':
-        tree_sha = obj.kvlm[b'tree'].decode()
-    elif obj.fmt == b'tree':
-        tree_sha = sha
+        return obj.kvlm[b'tree'].decode()
+    if obj.fmt == b'tree':
+        return sha
+    print(f"fatal: object {rev} is not a tree or commit")
+    sys.exit(128)
+
+def cmd_diff(args):
+    cached = False
+    output = "patch"
+    algorithm = None
+    revs = []
+    for arg in args:
+        if arg in ["--cached", "--staged"]:
+            cached = True
+        elif arg.startswith("--diff-algorithm="):
+            algorithm = arg.split("=", 1)[1]
+        elif arg in ["--minimal", "--patience", "--histogram"]:
+            algorithm = arg[2:]
+        elif arg == "--name-status":
+            output = "name-status"
+        elif arg == "--stat":
+            output = "stat"
+        elif arg.startswith("-"):
+            print(DIFF_USAGE)
+            sys.exit(129)
+        else:
+            revs.append(arg)
+
+    if len(revs) > 2 or (cached and len(revs) > 1):
+        print(DIFF_USAGE)
+        sys.exit(129)
+
+    repo = repo_find()
+    if algorithm is None:
+        config = read_config(repo)
+        algorithm = config.get("diff", "algorithm", fallback="myers")
+    algorithm = "myers" if algorithm == "default" else algorithm
+    if algorithm not in ALGORITHMS:
+        print(f"error: option diff-algorithm accepts \"myers\", \"minimal\", \"patience\" and \"histogram\"")
+        sys.exit(129)
+
+    worktree = False
+    if len(revs) == 2:
+        changes = diff_tree_to_tree(repo, resolve_tree(repo, revs[0]), resolve_tree(repo, revs[1]))
+    elif cached:
+        rev = revs[0] if revs else "HEAD"
+        # Before the first commit everything in the index is new
+        unborn = not revs and object_read(repo, resolve_ref(repo, rev)) is None
+        tree_sha = None if unborn else resolve_tree(repo, rev)
+        changes = diff_tree_to_index(repo, tree_sha, load_index(repo))
+    elif revs:
+        changes = diff_tree_to_worktree(repo, resolve_tree(repo, revs[0]), load_index(repo))
+        worktree = True
     else:
-        print(f"fatal: object {target} is not a tree or commit")
-        sys.exit(128)
-        
-    diff_trees(repo, tree_sha, repo.worktree)
\ No newline at end of file
+        changes = diff_index_to_worktree(repo, load_index(repo))
+        worktree = True
+
+    if output == "name-status":
+        print_name_status(changes)
+    elif output == "stat":
+        print_stat(repo, changes, worktree, algorithm)
+    else:
+        print_patch(repo, changes, worktree, algorithm)
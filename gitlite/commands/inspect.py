@@ -1,60 +1,137 @@
+import os
 import sys
 from ..repo import repo_find, resolve_ref
-from ..storage import object_read
+from ..storage import object_read, object_read_raw, object_info
+from ..commitgraph import commit_info, is_ancestor, merge_bases
+from ..revwalk import RevWalk
+from ..utils import parse_date
+from ..pack.types import OBJ_COMMIT
+
+LOG_USAGE = "usage: gitlite log [-n <number>] [--since=<date>] [--until=<date>] [--first-parent] [<revision>...] [-- <path>...]"
 
 def cmd_log(args):
     repo = repo_find()
-    
-    sha = args[0] if args else "HEAD"
-    sha = resolve_ref(repo, sha)
 
-    visited = set()
-    queue = [sha]
-
-    while queue:
-        sha = queue.pop(0)
-        
-        if sha in visited:
-            continue
-        visited.add(sha)
-        
-        obj = object_read(repo, sha)
-        if not obj:
-            if len(visited) == 1:
-                print(f"fatal: bad object {sha}")
+    revs = []
+    paths = []
+    options = {}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        value = None
+        if arg == "--":
+            paths = args[i + 1:]
+            break
+        elif arg in ["-n", "--max-count"] and i + 1 < len(args):
+            i += 1
+            value = args[i]
+        elif arg.startswith("--max-count="):
+            value = arg.split("=", 1)[1]
+        elif arg.startswith("-n"):
+            value = arg[2:]
+        elif arg[:1] == "-" and arg[1:].isdigit():
+            value = arg[1:]
+        elif arg.startswith(("--since=", "--after=", "--until=", "--before=")):
+            key = "since" if arg.startswith(("--since=", "--after=")) else "until"
+            try:
+                options[key] = parse_date(arg.split("=", 1)[1])
+            except ValueError as e:
+                print(f"fatal: {e}", file=sys.stderr)
                 sys.exit(128)
-            continue
-            
-        if obj.fmt != b'commit':
+        elif arg == "--first-parent":
+            options["first_parent"] = True
+        elif arg.startswith("-"):
+            print(LOG_USAGE)
+            sys.exit(129)
+        else:
+            revs.append(arg)
+
+        if value is not None:
+            if not value.isdigit():
+                print(LOG_USAGE)
+                sys.exit(129)
+            options["max_count"] = int(value)
+        i += 1
+
+    starts = []
+    for rev in revs or ["HEAD"]:
+        sha = resolve_ref(repo, rev)
+        type_num = object_read_raw(repo, sha)[0]
+        if type_num is None:
+            print(f"fatal: bad object {rev}")
+            sys.exit(128)
+        if type_num != OBJ_COMMIT:
             print(f"fatal: {sha} is not a commit object")
             sys.exit(128)
-            
-        print(f"commit {sha}")
-        
-        author = obj.kvlm.get(b'author')
-        if author:
-            if isinstance(author, list): author = author[0]
-            print(f"Author: {author.decode()}")
-
-        print("")
-        msg = obj.kvlm[None].decode()
-        for line in msg.splitlines():
-            print(f"    {line}")
-        print("")
-        
-        parents = obj.kvlm.get(b'parent')
-        if parents:
-            if not isinstance(parents, list):
-                parents = [parents]
-            
-            for p in parents:
-                queue.append(p.decode())
+        starts.append(sha)
+
+    # Commits are printed as the walk finds them, so a limit (or a closed
+    # pipe) stops it early. Parents come from the commit-graph when there is
+    # one; the commit object is only read for the author and message.
+    walk = RevWalk(repo, starts, paths=paths, **options)
+    try:
+        for info in walk:
+            obj = object_read(repo, info.sha)
+            out = [f"commit {info.sha}"]
+
+            author = obj.kvlm.get(b'author')
+            if author:
+                if isinstance(author, list): author = author[0]
+                out.append(f"Author: {author.decode()}")
+
+            out.append("")
+            msg = obj.kvlm[None].decode()
+            for line in msg.splitlines():
+                out.append(f"    {line}")
+            out.append("")
+            print("\n".join(out), flush=True)
+    except BrokenPipeError:
+        # The reader went away (e.g. 'gitlite log | head'); stop quietly
+        sys.stdout = open(os.devnull, "w")
+
+def cmd_merge_base(args):
+    is_ancestor_mode = False
+    show_all = False
+    revs = []
+    for arg in args:
+        if arg == "--is-ancestor":
+            is_ancestor_mode = True
+        elif arg in ["-a", "--all"]:
+            show_all = True
+        else:
+            revs.append(arg)
+
+    if len(revs) != 2:
+        print("usage: gitlite merge-base [-a | --all] <commit> <commit>")
+        print("   or: gitlite merge-base --is-ancestor <commit> <commit>")
+        sys.exit(129)
+
+    repo = repo_find()
+    one, two = (resolve_ref(repo, rev) for rev in revs)
+    for rev, sha in zip(revs, (one, two)):
+        if commit_info(repo, sha) is None:
+            print(f"fatal: Not a valid commit name {rev}", file=sys.stderr)
+            sys.exit(128)
+
+    if is_ancestor_mode:
+        sys.exit(0 if is_ancestor(repo, one, two) else 1)
+
+    bases = merge_bases(repo, one, two)
+    if not bases:
+        sys.exit(1)
+    for base in (bases if show_all else bases[:1]):
+        print(base)
 
 def cmd_ls_tree(args):
     repo = repo_find()
+
+    long_format = False
+    if args and args[0] in ["-l", "--long"]:
+        long_format = True
+        args = args[1:]
     
     if len(args) != 1:
-        print("usage: gitlite ls-tree <tree-ish>")
+        print("usage: gitlite ls-tree [-l] <tree-ish>")
         sys.exit(1)
         
     sha = args[0]
@@ -74,7 +151,7 @@ def cmd_ls_tree(args):
         sys.exit(128)
         
     for item in obj.items:
-        mode = item['mode'].decode()
+        mode = item.mode.decode()
         type_ = "unknown"
         if mode.startswith("10"): type_ = "blob"
         elif mode.startswith("12"): type_ = "blob"
@@ -82,7 +159,12 @@ def cmd_ls_tree(args):
         elif mode == "40000": type_ = "tree"
         elif mode.startswith("16"): type_ = "commit"
         
-        path = item['path'].decode()
-        sha_hex = item['sha']
+        path = item.path.decode()
+        sha_hex = item.sha
         
-        print(f"{mode.zfill(6)} {type_} {sha_hex}\t{path}")
\ No newline at end of file
+        if long_format:
+            # Sizes come from object headers; blobs are not read
+            size = object_info(repo, sha_hex)[1] if type_ == "blob" else None
+            print(f"{mode.zfill(6)} {type_} {sha_hex} {'-' if size is None else size:>7}\t{path}")
+        else:
+            print(f"{mode.zfill(6)} {type_} {sha_hex}\t{path}")
\ No newline at end of file
@@ -0,0 +1,67 @@
+import sys
+from ..repo import repo_find
+from ..maintenance import repack, gc, update_commit_graph
+from ..fastimport import FastImport
+
+def cmd_repack(args):
+    all_objects = False
+    delete_redundant = False
+    for arg in args:
+        if arg == "-a":
+            all_objects = True
+        elif arg == "-d":
+            delete_redundant = True
+        elif arg in ["-ad", "-da"]:
+            all_objects = delete_redundant = True
+        else:
+            print("usage: gitlite repack [-a] [-d]")
+            sys.exit(1)
+
+    repo = repo_find()
+    pack_path = repack(repo, all_objects, delete_redundant)
+    if pack_path is None:
+        print("Nothing new to pack.")
+    else:
+        print(f"Wrote {pack_path.name}")
+
+def cmd_gc(args):
+    if args:
+        print("usage: gitlite gc")
+        sys.exit(1)
+
+    repo = repo_find()
+    pack_path = gc(repo)
+    if pack_path is not None:
+        print(f"Wrote {pack_path.name}")
+
+def cmd_commit_graph(args):
+    if args != ["write"]:
+        print("usage: gitlite commit-graph write")
+        sys.exit(129)
+
+    repo = repo_find()
+    count = update_commit_graph(repo)
+    print(f"Wrote commit-graph with {count} commits")
+
+def cmd_fast_import(args):
+    quiet = False
+    force = False
+    for arg in args:
+        if arg == "--quiet":
+            quiet = True
+        elif arg == "--force":
+            force = True
+        else:
+            print("usage: gitlite fast-import [--quiet] [--force]")
+            sys.exit(129)
+
+    repo = repo_find()
+    importer = FastImport(repo, sys.stdin.buffer, sys.stdout.buffer, force)
+    stats = importer.run()
+    if not quiet:
+        counts = ", ".join(f"{stats[kind]} {kind}s" for kind in ("blob", "tree", "commit", "tag"))
+        print(f"Imported {counts} ({stats['delta']} deltas)", file=sys.stderr)
+    for ref, (old, new) in importer.rejected.items():
+        print(f"warning: Not updating {ref} (new tip {new} does not contain {old})", file=sys.stderr)
+    if importer.rejected:
+        sys.exit(1)
@@ -0,0 +1,104 @@
+import os
+import sys
+from pathlib import Path
+from ..repo import repo_find, resolve_ref
+from ..storage import object_read, object_hash_file
+from ..index import write_index
+from ..staging import add_paths, iter_worktree_files, load_index, read_tree_paths
+
+def cmd_add(args):
+    if not args:
+        print("Nothing specified, nothing added.")
+        sys.exit(1)
+
+    repo = repo_find()
+    worktree = repo.worktree.resolve()
+
+    paths = []
+    for arg in args:
+        path = Path(arg).resolve()
+        try:
+            path.relative_to(worktree)
+        except ValueError:
+            print(f"fatal: {arg}: '{arg}' is outside repository at '{worktree}'", file=sys.stderr)
+            sys.exit(128)
+        paths.append(path)
+
+    index = load_index(repo)
+    try:
+        add_paths(repo, index, paths)
+    except ValueError as e:
+        print(f"fatal: {e}", file=sys.stderr)
+        sys.exit(128)
+    write_index(repo, index)
+
+def cmd_status(args):
+    repo = repo_find()
+    index = load_index(repo)
+
+    with open(repo.gitdir / "HEAD", "r") as f:
+        head_data = f.read().strip()
+    if head_data.startswith("ref: refs/heads/"):
+        print(f"On branch {head_data[16:]}")
+    else:
+        print(f"HEAD detached at {head_data[:7]}")
+
+    # 1. Index vs HEAD
+    head_files = {}
+    commit = object_read(repo, resolve_ref(repo, "HEAD"))
+    if commit:
+        head_files = read_tree_paths(repo, commit.kvlm[b'tree'].decode())
+
+    staged = []
+    for path, entry in index.entries.items():
+        if path not in head_files:
+            staged.append((path, "new file"))
+        elif head_files[path][1] != entry.sha:
+            staged.append((path, "modified"))
+    for path in head_files:
+        if path not in index.entries:
+            staged.append((path, "deleted"))
+
+    # 2. Worktree vs index. Only files whose stat data changed are hashed.
+    unstaged = []
+    refreshed = False
+    for path, entry in index.entries.items():
+        full_path = repo.worktree / path
+        try:
+            st = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            unstaged.append((path, "deleted"))
+            continue
+
+        if index.is_clean(entry, st):
+            continue
+        if object_hash_file(full_path) != entry.sha:
+            unstaged.append((path, "modified"))
+        else:
+            entry.update_stat(st)
+            refreshed = True
+
+    # 3. Untracked files
+    untracked = [rel for rel, _, _ in iter_worktree_files(repo) if rel not in index.entries]
+
+    if refreshed:
+        write_index(repo, index)
+
+    if staged:
+        print("Changes to be committed:")
+        for path, status in sorted(staged):
+            print(f"\t{status + ':':<12}{path}")
+        print("")
+    if unstaged:
+        print("Changes not staged for commit:")
+        for path, status in sorted(unstaged):
+            print(f"\t{status + ':':<12}{path}")
+        print("")
+    if untracked:
+        print("Untracked files:")
+        for path in untracked:
+            print(f"\t{path}")
+        print("")
+
+    if not staged and not unstaged and not untracked:
+        print("nothing to commit, working tree clean")
@@ -0,0 +1,364 @@
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from .storage import object_read_raw
+from .objects.kvlm import kvlm_parse
+from .pack.types import OBJ_COMMIT, OBJ_TAG
+
+SIGNATURE = b'CGPH'
+CHUNK_OIDF = b'OIDF'
+CHUNK_OIDL = b'OIDL'
+CHUNK_CDAT = b'CDAT'
+CHUNK_EDGE = b'EDGE'
+
+# Parent position fields in CDAT
+PARENT_NONE = 0x70000000
+PARENT_EXTRA = 0x80000000   # second field indexes EDGE instead of a commit
+
+# Generation numbers are 30 bits; commits not in the graph have "infinity"
+GENERATION_MAX = 0x3FFFFFFF
+GENERATION_INFINITY = 0xFFFFFFFF
+
+CDAT_ENTRY = struct.Struct(">20sIIII")
+
+
+class CommitInfo:
+    """What history walks need to know about a commit, without its message."""
+
+    __slots__ = ("sha", "tree", "parents", "date", "generation")
+
+    def __init__(self, sha, tree, parents, date, generation=GENERATION_INFINITY):
+        self.sha = sha
+        self.tree = tree
+        self.parents = parents      # hex SHAs, first parent first
+        self.date = date            # committer time, seconds since the epoch
+        self.generation = generation
+
+
+class CommitGraph:
+    """Reader for objects/info/commit-graph (git's commit-graph format, version 1).
+
+    Commits are found by bisecting the sorted OID list (narrowed by the
+    fanout table) and decoded straight from the CDAT chunk, so walking
+    history never inflates a commit object.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.map)
+
+        signature, version, hash_version, num_chunks, _ = struct.unpack_from(">4sBBBB", self.data, 0)
+        if signature != SIGNATURE:
+            raise Exception("commit-graph signature mismatch")
+        if version != 1:
+            raise Exception(f"Unsupported commit-graph version {version}")
+        if hash_version != 1:
+            raise Exception(f"Unsupported commit-graph hash version {hash_version}")
+
+        self.chunks = {}
+        for i in range(num_chunks):
+            chunk_id, offset = struct.unpack_from(">4sQ", self.data, 8 + 12 * i)
+            self.chunks[chunk_id] = offset
+        for required in (CHUNK_OIDF, CHUNK_OIDL, CHUNK_CDAT):
+            if required not in self.chunks:
+                raise Exception(f"commit-graph is missing the {required.decode()} chunk")
+
+        self.fanout = struct.unpack_from(">256I", self.data, self.chunks[CHUNK_OIDF])
+        self.count = self.fanout[255]
+
+    def close(self):
+        self.data.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+
+    def __len__(self):
+        return self.count
+
+    def sha_at(self, pos):
+        start = self.chunks[CHUNK_OIDL] + 20 * pos
+        return self.data[start:start + 20].hex()
+
+    def lookup(self, sha):
+        """Position of `sha` in the graph, or None."""
+        try:
+            raw = bytes.fromhex(sha)
+        except ValueError:
+            return None
+        if len(raw) != 20:
+            return None
+
+        lo = self.fanout[raw[0] - 1] if raw[0] else 0
+        hi = self.fanout[raw[0]]
+        base = self.chunks[CHUNK_OIDL]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = bytes(self.data[base + 20 * mid:base + 20 * mid + 20])
+            if entry == raw:
+                return mid
+            if entry < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def commit_at(self, pos):
+        tree, parent1, parent2, high, low = CDAT_ENTRY.unpack_from(
+            self.data, self.chunks[CHUNK_CDAT] + CDAT_ENTRY.size * pos)
+
+        parents = []
+        if parent1 != PARENT_NONE:
+            parents.append(self.sha_at(parent1))
+        if parent2 & PARENT_EXTRA:
+            # Octopus merge: the rest of the parents are listed in EDGE
+            edge = self.chunks[CHUNK_EDGE] + 4 * (parent2 & ~PARENT_EXTRA)
+            while True:
+                value, = struct.unpack_from(">I", self.data, edge)
+                parents.append(self.sha_at(value & ~PARENT_EXTRA))
+                if value & PARENT_EXTRA:
+                    break
+                edge += 4
+        elif parent2 != PARENT_NONE:
+            parents.append(self.sha_at(parent2))
+
+        generation = high >> 2
+        date = ((high & 3) << 32) | low
+        return CommitInfo(self.sha_at(pos), tree.hex(), parents, date, generation)
+
+    def get(self, sha):
+        pos = self.lookup(sha)
+        return None if pos is None else self.commit_at(pos)
+
+
+def commit_graph_path(repo):
+    return repo.gitdir / "objects" / "info" / "commit-graph"
+
+
+def load_commit_graph(repo):
+    """Open the repository's commit-graph, or return None if there is none."""
+    path = commit_graph_path(repo)
+    if not path.is_file() or path.stat().st_size == 0:
+        return None
+    return CommitGraph(path)
+
+
+def parse_commit_info(sha, data):
+    kvlm = kvlm_parse(data, headers_only=True)
+    parents = kvlm.get(b'parent', [])
+    if not isinstance(parents, list):
+        parents = [parents]
+
+    committer = kvlm.get(b'committer', b'')
+    if isinstance(committer, list):
+        committer = committer[0]
+    # "Name <email> 1700000000 +0100"
+    try:
+        date = int(committer.rsplit(b'>', 1)[1].split()[0])
+    except (IndexError, ValueError):
+        date = 0
+
+    return CommitInfo(sha, kvlm[b'tree'].decode(), [p.decode() for p in parents], date)
+
+
+def commit_info(repo, sha):
+    """CommitInfo for `sha`, from the commit-graph if it has it, else from the object.
+
+    Returns None if `sha` is missing or not a commit.
+    """
+    graph = repo.commit_graph
+    if graph is not None:
+        info = graph.get(sha)
+        if info is not None:
+            return info
+
+    type_num, data = object_read_raw(repo, sha)
+    if type_num != OBJ_COMMIT:
+        return None
+    return parse_commit_info(sha, data)
+
+
+def peel_to_commit(repo, sha):
+    """Follow annotated tags; returns the commit SHA or None."""
+    for _ in range(10):
+        type_num, data = object_read_raw(repo, sha)
+        if type_num == OBJ_COMMIT:
+            return sha
+        if type_num != OBJ_TAG:
+            return None
+        sha = kvlm_parse(data, headers_only=True)[b'object'].decode()
+    return None
+
+
+def write_commit_graph(repo, tips):
+    """Write a commit-graph of every commit reachable from `tips`.
+
+    Tags among the tips are peeled; other non-commits are skipped. Returns
+    the number of commits written.
+    """
+    commits = {}
+    stack = [sha for sha in (peel_to_commit(repo, t) for t in tips) if sha]
+    while stack:
+        sha = stack.pop()
+        if sha in commits:
+            continue
+        type_num, data = object_read_raw(repo, sha)
+        if type_num != OBJ_COMMIT:
+            raise Exception(f"commit-graph: could not read commit {sha}")
+        info = commits[sha] = parse_commit_info(sha, data)
+        stack.extend(p for p in info.parents if p not in commits)
+    if not commits:
+        return 0
+
+    # Generation = 1 + the largest parent generation, computed without recursion
+    for sha in commits:
+        if commits[sha].generation != GENERATION_INFINITY:
+            continue
+        stack = [sha]
+        while stack:
+            info = commits[stack[-1]]
+            pending = [p for p in info.parents if commits[p].generation == GENERATION_INFINITY]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            info.generation = min(GENERATION_MAX, 1 + max(
+                (commits[p].generation for p in info.parents), default=0))
+
+    shas = sorted(commits)
+    position = {sha: i for i, sha in enumerate(shas)}
+
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[int(sha[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    cdat = []
+    edges = []
+    for sha in shas:
+        info = commits[sha]
+        parents = [position[p] for p in info.parents]
+        parent1 = parents[0] if parents else PARENT_NONE
+        if len(parents) > 2:
+            parent2 = PARENT_EXTRA | len(edges)
+            edges.extend(parents[1:-1])
+            edges.append(PARENT_EXTRA | parents[-1])
+        else:
+            parent2 = parents[1] if len(parents) == 2 else PARENT_NONE
+        date = min(info.date, (1 << 34) - 1)
+        cdat.append(CDAT_ENTRY.pack(bytes.fromhex(info.tree), parent1, parent2,
+                                    (info.generation << 2) | (date >> 32), date & 0xFFFFFFFF))
+
+    chunks = [
+        (CHUNK_OIDF, struct.pack(">256I", *fanout)),
+        (CHUNK_OIDL, b"".join(bytes.fromhex(sha) for sha in shas)),
+        (CHUNK_CDAT, b"".join(cdat)),
+    ]
+    if edges:
+        chunks.append((CHUNK_EDGE, struct.pack(f">{len(edges)}I", *edges)))
+
+    parts = [struct.pack(">4sBBBB", SIGNATURE, 1, 1, len(chunks), 0)]
+    offset = 8 + 12 * (len(chunks) + 1)
+    for chunk_id, payload in chunks:
+        parts.append(struct.pack(">4sQ", chunk_id, offset))
+        offset += len(payload)
+    parts.append(struct.pack(">4sQ", b'\0\0\0\0', offset))
+    parts += [payload for _, payload in chunks]
+    data = b"".join(parts)
+    data += hashlib.sha1(data).digest()
+
+    path = commit_graph_path(repo)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    repo.close_commit_graph()
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_graph_", dir=path.parent)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(shas)
+
+
+def _queue_key(info):
+    # Highest generation first, then newest; commits outside the graph
+    # (infinite generation) come before everything in it
+    return (-info.generation, -info.date, info.sha)
+
+
+def is_ancestor(repo, ancestor, descendant):
+    """True if `ancestor` is reachable from `descendant` (or is the same commit)."""
+    target = commit_info(repo, ancestor)
+    if target is None:
+        return False
+    start = commit_info(repo, descendant)
+    if start is None:
+        return False
+
+    seen = {start.sha: start}
+    queue = [_queue_key(start)]
+    while queue:
+        info = seen[heapq.heappop(queue)[2]]
+        if info.sha == target.sha:
+            return True
+        # Nothing below the target's generation can reach it. A target outside
+        # the graph has infinite generation, so graph commits are all pruned.
+        if info.generation < target.generation:
+            continue
+        for parent in info.parents:
+            if parent not in seen:
+                parent_info = seen[parent] = commit_info(repo, parent)
+                if parent_info is not None:
+                    heapq.heappush(queue, _queue_key(parent_info))
+    return False
+
+
+_PARENT1 = 1
+_PARENT2 = 2
+_STALE = 4
+_RESULT = 8
+
+
+def merge_bases(repo, one, two):
+    """Best common ancestors of two commits, newest first (like 'git merge-base --all')."""
+    one = commit_info(repo, one)
+    two = commit_info(repo, two)
+    if one is None or two is None:
+        return []
+    if one.sha == two.sha:
+        return [one.sha]
+
+    # Paint down from both sides in generation order; a commit reached from
+    # both is a common ancestor and everything below it is stale
+    flags = {one.sha: _PARENT1, two.sha: _PARENT2}
+    infos = {one.sha: one, two.sha: two}
+    queue = [_queue_key(one), _queue_key(two)]
+    results = []
+    while any(not flags[key[2]] & _STALE for key in queue):
+        info = infos[heapq.heappop(queue)[2]]
+        current = flags[info.sha] & (_PARENT1 | _PARENT2 | _STALE)
+        if current == _PARENT1 | _PARENT2:
+            if not flags[info.sha] & _RESULT:
+                flags[info.sha] |= _RESULT
+                results.append(info)
+            current |= _STALE
+        for parent in info.parents:
+            if flags.get(parent, 0) & current == current:
+                continue
+            parent_info = infos.get(parent) or commit_info(repo, parent)
+            if parent_info is None:
+                continue
+            infos[parent] = parent_info
+            flags[parent] = flags.get(parent, 0) | current
+            heapq.heappush(queue, _queue_key(parent_info))
+
+    # Drop results that are ancestors of other results
+    best = []
+    for info in results:
+        if not any(other is not info and is_ancestor(repo, info.sha, other.sha) for other in results):
+            best.append(info)
+    best.sort(key=lambda info: (-info.date, info.sha))
+    return [info.sha for info in best]
@@ -13,4 +13,33 @@ def read_config(repo):
 def write_config(repo, config):
     path = get_config_path(repo)
     with open(path, "w") as f:
-        config.write(f)
\ No newline at end of file
+        config.write(f)
+ 
+def get_config_int(repo, key, default):
+    """Read an integer option such as 'core.threads'; k/m/g suffixes scale by 1024."""
+    section, option = key.split(".", 1)
+    config = read_config(repo)
+    if not config.has_option(section, option):
+        return default
+
+    value = config.get(section, option).strip().lower()
+    scale = 1
+    if value and value[-1] in "kmg":
+        scale = 1024 ** ("kmg".index(value[-1]) + 1)
+        value = value[:-1]
+    try:
+        return int(value) * scale
+    except ValueError:
+        raise ValueError(f"bad numeric config value '{value}' for '{key}'")
+
+def get_compression_level(repo, key, default):
+    """zlib level for `key` (core.looseCompression or pack.compression).
+
+    As in git, an unset key falls back to core.compression, then to `default`.
+    """
+    level = get_config_int(repo, key, None)
+    if level is None:
+        level = get_config_int(repo, "core.compression", default)
+    if not -1 <= level <= 9:
+        raise ValueError(f"bad zlib compression level {level}")
+    return level
@@ -1,82 +1,418 @@
-import difflib
 import os
 import sys
-from pathlib import Path
-from .storage import object_read
-from .staging import is_ignored, read_gitignore
+from .storage import object_read_raw, object_hash_file
+from .index import write_index
+from .objects.tree import parse_tree, tree_entry_key
+from .pack.types import OBJ_TREE
+from .linediff import split_lines, unified_diff, count_changes
+
+MODE_TREE = 0o40000
+MODE_GITLINK = 0o160000
+NULL_SHA = "0" * 40
+
+
+class FileChange:
+    """One changed path. Modes are ints and SHAs hex; the missing side of an
+    added or deleted file has mode 0 and the null SHA."""
+
+    __slots__ = ("status", "path", "old_mode", "old_sha", "new_mode", "new_sha")
+
+    def __init__(self, status, path, old_mode=0, old_sha=NULL_SHA, new_mode=0, new_sha=NULL_SHA):
+        self.status = status    # 'A', 'D', 'M' or 'T' (type change)
+        self.path = path
+        self.old_mode = old_mode
+        self.old_sha = old_sha
+        self.new_mode = new_mode
+        self.new_sha = new_sha
+
+    def __repr__(self):
+        return f"FileChange({self.status!r}, {self.path!r})"
+
+
+def is_tree_mode(mode):
+    return mode & 0o170000 == MODE_TREE
+
+
+def read_tree_items(repo, sha):
+    """The entries of a tree as TreeEntry, in the order stored (git's tree order).
+
+    Names, modes and SHAs stay raw bytes; callers convert only the entries
+    they report.
+    """
+    type_num, data = object_read_raw(repo, sha)
+    if type_num != OBJ_TREE:
+        raise ValueError(f"{sha} is not a tree object")
+    return parse_tree(data)
+
+
+def _modified(path, old_mode, old_sha, new_mode, new_sha):
+    # A file turning into a symlink (or back) is a type change
+    status = 'M' if old_mode & 0o170000 == new_mode & 0o170000 else 'T'
+    return FileChange(status, path, old_mode, old_sha, new_mode, new_sha)
+
+
+def _added_tree(repo, sha, prefix, changes, deleted=False):
+    for item in read_tree_items(repo, sha):
+        path = prefix + item.path.decode()
+        mode = int(item.mode, 8)
+        item_sha = item.sha
+        if is_tree_mode(mode):
+            _added_tree(repo, item_sha, path + "/", changes, deleted)
+        elif deleted:
+            changes.append(FileChange('D', path, mode, item_sha))
+        else:
+            changes.append(FileChange('A', path, new_mode=mode, new_sha=item_sha))
+
+
+def diff_tree_to_tree(repo, old_sha, new_sha, prefix=""):
+    """Changed files between two trees, sorted by path.
+
+    Both entry lists are walked in tree order side by side, and subtrees
+    with the same SHA are skipped without being read, so trees that differ
+    in one file cost one tree read per level of that file's directory.
+    Entries are compared raw; only those that differ are decoded.
+    """
+    changes = []
+    if old_sha == new_sha:
+        return changes
+
+    old_items = read_tree_items(repo, old_sha) if old_sha else []
+    new_items = read_tree_items(repo, new_sha) if new_sha else []
+    n_old, n_new = len(old_items), len(new_items)
+    i = j = 0
+    while i < n_old or j < n_new:
+        old = old_items[i] if i < n_old else None
+        new = new_items[j] if j < n_new else None
+
+        # Identical entries (name, mode and SHA) are the common case
+        if old == new:
+            i += 1
+            j += 1
+            continue
+        if old is not None and new is not None and old.path == new.path:
+            i += 1
+            j += 1
+            # Modes are compared as numbers: old trees may spell 40000 as 040000
+            old_mode, new_mode = int(old.mode, 8), int(new.mode, 8)
+            if old.raw_sha == new.raw_sha and old_mode == new_mode:
+                continue
+
+            path = prefix + old.path.decode()
+            old_item_sha, new_item_sha = old.sha, new.sha
+            old_tree, new_tree = is_tree_mode(old_mode), is_tree_mode(new_mode)
+            if old_tree and new_tree:
+                changes += diff_tree_to_tree(repo, old_item_sha, new_item_sha, path + "/")
+            elif old_tree:
+                # Directory replaced by a file: "name" sorts before "name/..."
+                changes.append(FileChange('A', path, new_mode=new_mode, new_sha=new_item_sha))
+                _added_tree(repo, old_item_sha, path + "/", changes, deleted=True)
+            elif new_tree:
+                changes.append(FileChange('D', path, old_mode, old_item_sha))
+                _added_tree(repo, new_item_sha, path + "/", changes)
+            else:
+                changes.append(_modified(path, old_mode, old_item_sha, new_mode, new_item_sha))
+            continue
+
+        # Entries are compared the way trees sort them (directories as "name/")
+        take_old = new is None or (old is not None and
+                                   tree_entry_key(old) < tree_entry_key(new))
+        if take_old:
+            item = old
+            i += 1
+        else:
+            item = new
+            j += 1
+        path = prefix + item.path.decode()
+        mode = int(item.mode, 8)
+        if is_tree_mode(mode):
+            _added_tree(repo, item.sha, path + "/", changes, deleted=take_old)
+        elif take_old:
+            changes.append(FileChange('D', path, mode, item.sha))
+        else:
+            changes.append(FileChange('A', path, new_mode=mode, new_sha=item.sha))
+
+    return changes
+
+
+def diff_tree_to_index(repo, tree_sha, index):
+    """Changed files between a tree and the index (what 'diff --cached' shows).
+
+    Index entries are sorted by path, which is also the order a recursive
+    walk of a tree visits files in, so the two are merged in one pass.
+    Directories whose cached tree SHA in the index (see CacheTree) equals
+    the tree's are skipped along with all their index entries.
+    """
+    entries = index.sorted_entries()
+    changes = []
+    pos = 0
+    if tree_sha:
+        pos = _diff_tree_index_dir(repo, tree_sha, "", index.cache_tree, entries, 0, changes)
+    for entry in entries[pos:]:
+        changes.append(FileChange('A', entry.path, new_mode=entry.mode, new_sha=entry.sha))
+    return changes
+
+
+def _diff_tree_index_dir(repo, tree_sha, prefix, cache_node, entries, pos, changes):
+    """Diff one directory; `pos` is the first index entry not yet consumed.
+    Returns the position after the last entry handled."""
+    for item in read_tree_items(repo, tree_sha):
+        name = item.path.decode()
+        mode = int(item.mode, 8)
+        item_sha = item.sha
+        path = prefix + name
+        key = path + "/" if is_tree_mode(mode) else path
+
+        # Index entries sorting before this one are not in the tree
+        while pos < len(entries) and entries[pos].path.encode() < key.encode():
+            entry = entries[pos]
+            if not entry.path.startswith(prefix):
+                break
+            changes.append(FileChange('A', entry.path, new_mode=entry.mode, new_sha=entry.sha))
+            pos += 1
+
+        if is_tree_mode(mode):
+            child = cache_node.children.get(name) if cache_node else None
+            if child is not None and child.is_valid() and child.sha == item_sha:
+                pos += child.entry_count
+                continue
+            if pos < len(entries) and entries[pos].path.startswith(key):
+                pos = _diff_tree_index_dir(repo, item_sha, key, child, entries, pos, changes)
+            else:
+                _added_tree(repo, item_sha, key, changes, deleted=True)
+        elif pos < len(entries) and entries[pos].path == path:
+            entry = entries[pos]
+            pos += 1
+            if entry.sha != item_sha or entry.mode != mode:
+                changes.append(_modified(path, mode, item_sha, entry.mode, entry.sha))
+        else:
+            changes.append(FileChange('D', path, mode, item_sha))
+
+    while pos < len(entries) and entries[pos].path.startswith(prefix):
+        entry = entries[pos]
+        changes.append(FileChange('A', entry.path, new_mode=entry.mode, new_sha=entry.sha))
+        pos += 1
+    return pos
  
 def is_binary(data):
     return b'\0' in data[:8000]
  
-def diff_blobs(path, old_data, new_data):
+def diff_blobs(path, old_data, new_data, old_name=None, new_name=None, algorithm="myers"):
+    old_name = old_name or f"a/{path}"
+    new_name = new_name or f"b/{path}"
     if is_binary(old_data) or is_binary(new_data):
         if old_data != new_data:
-            print(f"Binary files {path} differ")
+            print(f"Binary files {old_name} and {new_name} differ")
         return
- 
-    try:
-        old_str = old_data.decode('utf-8').splitlines(keepends=True)
-        new_str = new_data.decode('utf-8').splitlines(keepends=True)
-    except UnicodeDecodeError:
-        print(f"Binary files {path} differ (encoding)")
+
+    # Undecodable bytes survive the round trip to the output unchanged
+    old_lines = split_lines(old_data.decode('utf-8', 'surrogateescape'))
+    new_lines = split_lines(new_data.decode('utf-8', 'surrogateescape'))
+    _write("".join(unified_diff(old_lines, new_lines, old_name, new_name, algorithm)))
+
+
+def _write(text):
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:
+        sys.stdout.write(text)
         return
- 
-    diff = difflib.unified_diff(
-        old_str, new_str,
-        fromfile=f"a/{path}",
-        tofile=f"b/{path}"
-    )
-    
-    for line in diff:
-        sys.stdout.write(line)
- 
-def diff_trees(repo, tree_sha, work_path, relative_prefix=""):
-    tree_obj = object_read(repo, tree_sha)
-    if not tree_obj or tree_obj.fmt != b'tree':
-        return
- 
-    # Build map of tree entries {name: item}
-    tree_entries = {item['path'].decode(): item for item in tree_obj.items}
-    
-    rules = read_gitignore(work_path)
-    rules.append(".git")
- 
-    for entry in os.scandir(work_path):
-        name = entry.name
-        path = Path(entry.path)
-        display_path = os.path.join(relative_prefix, name)
-        
-        if is_ignored(path, rules):
+    sys.stdout.flush()
+    buffer.write(text.encode('utf-8', 'surrogateescape'))
+    buffer.flush()
+
+
+def diff_index_to_worktree(repo, index):
+    """Changed files between the index and the working tree (what plain 'diff' shows).
+
+    The index doubles as a stat cache: a file whose stat data matches its
+    entry (and is not racily clean) is taken to be unchanged without being
+    read. Only the other files are hashed, and no blob is ever inflated, so
+    a clean tree costs one stat() per tracked file. Files that hash to the
+    recorded SHA get their entry's stat data refreshed, and the index is then
+    written back so they are not hashed again next time, as git does
+    opportunistically.
+    """
+    changes = []
+    refreshed = False
+    for entry in index.sorted_entries():
+        if entry.mode & 0o170000 == MODE_GITLINK:
+            continue
+        full_path = repo.worktree / entry.path
+        try:
+            st = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            changes.append(FileChange('D', entry.path, entry.mode, entry.sha))
+            continue
+
+        if index.is_clean(entry, st):
             continue
-            
-        if name in tree_entries:
-            tree_item = tree_entries[name]
-            
-            if entry.is_file():
-                blob_obj = object_read(repo, tree_item['sha'])
-                if not blob_obj: continue
-                
-                with open(path, "rb") as f:
-                    file_data = f.read()
-                
-                if blob_obj.blobdata != file_data:
-                    diff_blobs(display_path, blob_obj.blobdata, file_data)
-                    
-            elif entry.is_dir():
-                # Recurse
-                mode = tree_item['mode']
-                if mode.startswith(b'04') or mode == b'40000':
-                    diff_trees(repo, tree_item['sha'], path, display_path)
-            
-            del tree_entries[name] # Mark as processed
+        new_sha = object_hash_file(full_path)
+        if new_sha == entry.sha:
+            entry.update_stat(st)
+            refreshed = True
         else:
-            # Untracked file (ignored in diff)
+            changes.append(FileChange('M', entry.path, entry.mode, entry.sha, entry.mode, new_sha))
+
+    if refreshed:
+        try:
+            write_index(repo, index)
+        except FileExistsError:
+            # Someone else holds index.lock; the refresh is only an optimisation
             pass
- 
-    # Remaining tree_entries are DELETED files
-    for name, item in tree_entries.items():
-        display_path = os.path.join(relative_prefix, name)
-        print(f"deleted: {display_path}")
-        # To show full diff:
-        # blob_obj = object_read(repo, item['sha'])
-        # diff_blobs(display_path, blob_obj.blobdata, b"")
\ No newline at end of file
+    return changes
+
+
+def diff_tree_to_worktree(repo, tree_sha, index):
+    """Changed files between a tree and the working tree. Untracked files are not
+    reported; the new side of a change is the file's content, hashed but not stored.
+
+    Like 'git diff <commit>', the working tree is seen through the index:
+    `index` is first refreshed (see diff_index_to_worktree), then brought in
+    line with the working tree in memory only and compared with the tree, so
+    clean files are never read.
+    """
+    for change in diff_index_to_worktree(repo, index):
+        if change.status == 'D':
+            index.remove(change.path)
+        else:
+            entry = index.entries[change.path]
+            entry.sha = change.new_sha
+            index.invalidate(change.path)
+    return diff_tree_to_index(repo, tree_sha, index)
+
+
+def _side_data(repo, mode, sha):
+    if not mode:
+        return b""
+    if mode & 0o170000 == MODE_GITLINK:
+        return b"Subproject commit %s\n" % sha.encode()
+    type_num, data = object_read_raw(repo, sha)
+    if type_num is None:
+        raise ValueError(f"bad object {sha}")
+    return data
+
+
+def print_name_status(changes):
+    for change in changes:
+        print(f"{change.status}\t{change.path}")
+
+
+def _new_data(repo, change, worktree):
+    if worktree and change.new_mode:
+        with open(repo.worktree / change.path, "rb") as f:
+            return f.read()
+    return _side_data(repo, change.new_mode, change.new_sha)
+
+
+def print_patch(repo, changes, worktree=False, algorithm="myers"):
+    """Print changes as a git patch. With `worktree` the new side of each
+    change is read from the working tree instead of the object store;
+    `algorithm` is one of linediff.ALGORITHMS."""
+    for change in changes:
+        if change.status == 'T':
+            # git shows a type change as a deletion followed by an addition
+            _print_file_patch(repo, FileChange('D', change.path, change.old_mode, change.old_sha), worktree, algorithm)
+            _print_file_patch(repo, FileChange('A', change.path, new_mode=change.new_mode, new_sha=change.new_sha), worktree, algorithm)
+        else:
+            _print_file_patch(repo, change, worktree, algorithm)
+
+
+def _print_file_patch(repo, change, worktree, algorithm):
+    path = change.path
+    lines = [f"diff --git a/{path} b/{path}"]
+    if change.status == 'A':
+        lines.append(f"new file mode {change.new_mode:06o}")
+    elif change.status == 'D':
+        lines.append(f"deleted file mode {change.old_mode:06o}")
+    elif change.old_mode != change.new_mode:
+        lines.append(f"old mode {change.old_mode:06o}")
+        lines.append(f"new mode {change.new_mode:06o}")
+
+    if change.old_sha != change.new_sha:
+        index_line = f"index {change.old_sha[:7]}..{change.new_sha[:7]}"
+        if change.status == 'M' and change.old_mode == change.new_mode:
+            index_line += f" {change.new_mode:06o}"
+        lines.append(index_line)
+    sys.stdout.write("\n".join(lines) + "\n")
+
+    if change.old_sha == change.new_sha:
+        return
+    old_data = _side_data(repo, change.old_mode, change.old_sha)
+    new_data = _new_data(repo, change, worktree)
+    diff_blobs(path, old_data, new_data,
+               f"a/{path}" if change.old_mode else "/dev/null",
+               f"b/{path}" if change.new_mode else "/dev/null", algorithm)
+
+
+def count_line_changes(old_data, new_data, algorithm="myers"):
+    """(insertions, deletions) between two texts, or None if either is binary."""
+    if is_binary(old_data) or is_binary(new_data):
+        return None
+    # Any byte-preserving decoding will do for counting
+    old_lines = split_lines(old_data.decode('latin-1'))
+    new_lines = split_lines(new_data.decode('latin-1'))
+    return count_changes(old_lines, new_lines, algorithm)
+
+
+STAT_WIDTH = 80
+
+
+def print_stat(repo, changes, worktree=False, algorithm="myers"):
+    rows = []
+    for change in changes:
+        old_data = _side_data(repo, change.old_mode, change.old_sha)
+        new_data = _new_data(repo, change, worktree)
+        counts = count_line_changes(old_data, new_data, algorithm)
+        binary = None if counts is not None else f"Bin {len(old_data)} -> {len(new_data)} bytes"
+        rows.append((change.path, counts, binary))
+    if not rows:
+        return
+
+    # Column widths as git computes them for an 80 column terminal
+    max_change = max((sum(counts) for _, counts, _ in rows if counts), default=0)
+    bin_width = max((len(binary) for _, _, binary in rows if binary), default=0)
+    number_width = max(len(str(max_change)), 3 if bin_width else 0)
+    name_width = max(len(path) for path, _, _ in rows)
+    graph_width = max(max_change, bin_width - 4)
+    if name_width + number_width + 6 + graph_width > STAT_WIDTH:
+        limit = STAT_WIDTH * 3 // 8 - number_width - 6
+        if graph_width > limit:
+            graph_width = max(limit, 6)
+        if name_width > STAT_WIDTH - number_width - 6 - graph_width:
+            name_width = STAT_WIDTH - number_width - 6 - graph_width
+        else:
+            graph_width = STAT_WIDTH - number_width - 6 - name_width
+
+    total_added = total_deleted = 0
+    for path, counts, binary in rows:
+        if len(path) > name_width:
+            path = "..." + path[len(path) - name_width + 3:]
+        if binary:
+            print(f" {path:<{name_width}} | {binary}")
+            continue
+
+        added, deleted = counts
+        total_added += added
+        total_deleted += deleted
+        if graph_width <= max_change:
+            total = _scale(added + deleted, graph_width, max_change)
+            if total < 2 and added and deleted:
+                total = 2
+            if added < deleted:
+                added = _scale(added, graph_width, max_change)
+                deleted = total - added
+            else:
+                deleted = _scale(deleted, graph_width, max_change)
+                added = total - deleted
+        graph = "+" * added + "-" * deleted
+        print(f" {path:<{name_width}} | {sum(counts):>{number_width}}{' ' + graph if graph else ''}")
+
+    summary = f" {len(rows)} file{'s' if len(rows) != 1 else ''} changed"
+    if total_added or not total_deleted:
+        summary += f", {total_added} insertion{'s' if total_added != 1 else ''}(+)"
+    if total_deleted or not total_added:
+        summary += f", {total_deleted} deletion{'s' if total_deleted != 1 else ''}(-)"
+    print(summary)
+
+
+def _scale(value, width, max_change):
+    return 1 + value * (width - 1) // max_change if value else 0
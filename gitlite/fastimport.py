@@ -0,0 +1,556 @@
+import os
+import tempfile
+import zlib
+from collections import OrderedDict
+from .config import get_config_int, get_compression_level
+from .maintenance import DEFAULT_DEPTH
+from .objects.kvlm import kvlm_parse, kvlm_serialize
+from .objects.tree import parse_tree
+from .pack.delta import create_delta
+from .pack.types import OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG, TYPE_NAMES
+from .pack.writer import PackWriter, object_sha
+from .commitgraph import is_ancestor, peel_to_commit
+from .repo import check_refname_format, list_refs, resolve_ref
+from .storage import object_read_raw, object_info, object_exists
+
+# Bytes of blob data kept in memory: blobs waiting for the commit that names
+# their path, and the latest blob of each path as a delta base
+BLOB_BUDGET = 64 * 1024 * 1024
+
+NULL_SHA = "0" * 40
+TREE_MODE = b"40000"
+MODES = {b"644": b"100644", b"755": b"100755", b"040000": TREE_MODE}
+FILE_COMMANDS = (b"M ", b"D ", b"R ", b"C ", b"deleteall")
+ESCAPES = {ord("n"): 10, ord("t"): 9, ord("r"): 13, ord("a"): 7, ord("b"): 8,
+           ord("f"): 12, ord("v"): 11, ord('"'): ord('"'), ord("\\"): ord("\\")}
+
+
+class _TreeNode:
+    """A directory being edited. `entries` maps name to [mode, sha, node]
+    and is read from the tree `sha` on first use; `sha` is None once the
+    directory has changed. `base` is the (sha, data) of the last version
+    written, to store the next one as a delta against."""
+    __slots__ = ("sha", "entries", "base")
+
+    def __init__(self, sha=None):
+        self.sha = sha
+        self.entries = None if sha else {}
+        self.base = None
+
+
+class FastImport:
+    """Import a stream in git's fast-import format into packs.
+
+    Supports the blob, commit, tag, reset, checkpoint, progress and done
+    commands, marks, inline and delimited data, and the M, D, R, C and
+    deleteall file commands, with raw dates. Objects are appended to a
+    PackWriter as they are read; a blob is held back until a commit names
+    its path, so it can be stored as a delta against the previous blob of
+    that path. Trees are edited in memory and only the directories a commit
+    changed are written, each as a delta against its previous version. The
+    pack, its index and the refs of imported branches are written at each
+    checkpoint and at the end. A branch that existed before the import is
+    only moved to a commit that contains its old tip, unless `force` is set;
+    refused updates are left in `rejected`.
+    """
+
+    def __init__(self, repo, stream, out=None, force=False):
+        self.repo = repo
+        self.stream = stream
+        self.out = out
+        self.force = force
+        self.old_refs = {}          # ref -> sha, as they were before the import
+        self.rejected = {}          # ref -> (old sha, new sha) not written
+        self.marks = {}
+        self.branches = {}          # ref -> [tip sha, _TreeNode of its tree]
+        self.tags = {}              # ref -> sha
+        self.types = {}             # sha -> type_num, for objects imported here
+        self.commit_trees = {}      # commit sha -> tree sha, for commits imported here
+        self.trees = {}             # tree sha -> data, for trees in the pack being written
+        self.pending = OrderedDict()    # blob sha -> data, not written yet
+        self.pending_bytes = 0
+        self.bases = OrderedDict()      # path -> (sha, data) of its latest blob
+        self.bases_bytes = 0
+        self.chain_depth = {}
+        self.stats = {"blob": 0, "tree": 0, "commit": 0, "tag": 0, "delta": 0}
+
+        self.depth = get_config_int(repo, "pack.depth", DEFAULT_DEPTH)
+        self.level = get_compression_level(repo, "pack.compression", zlib.Z_DEFAULT_COMPRESSION)
+        self.writer = None
+        self.line = None
+
+    def run(self):
+        """Import the whole stream. Returns the object counts."""
+        self.old_refs = list_refs(self.repo)
+        self.writer = PackWriter(self.repo.gitdir / "objects" / "pack", self.level)
+        try:
+            self._next()
+            while self.line is not None:
+                line = self.line
+                if line == b"blob":
+                    self._blob()
+                elif line.startswith(b"commit "):
+                    self._commit(line[7:].decode())
+                elif line.startswith(b"tag "):
+                    self._tag(line[4:].decode())
+                elif line.startswith(b"reset "):
+                    self._reset(line[6:].decode())
+                elif line == b"checkpoint":
+                    self.checkpoint()
+                    self._next()
+                elif line.startswith(b"progress "):
+                    if self.out is not None:
+                        self.out.write(line + b"\n")
+                        self.out.flush()
+                    self._next()
+                elif line == b"done":
+                    break
+                elif line == b"feature done":
+                    # The stream promises to end with "done"; nothing to set up
+                    self._next()
+                else:
+                    raise ValueError(f"Unsupported command: {line.decode(errors='replace')}")
+            self.checkpoint()
+        finally:
+            self.writer.abort()
+        return self.stats
+
+    def checkpoint(self):
+        """Write out the pack and index so far, then the refs."""
+        while self.pending:
+            sha, data = self.pending.popitem(last=False)
+            self._write_blob(sha, data, None)
+        self.pending_bytes = 0
+
+        self.writer.finish()
+        self.writer = PackWriter(self.repo.gitdir / "objects" / "pack", self.level)
+        self.repo.packs.refresh(force=True)
+        # Trees written so far can now be read from the pack
+        self.trees.clear()
+        # Deltas can only be against objects in the pack being written
+        self.bases.clear()
+        self.bases_bytes = 0
+        self.chain_depth.clear()
+
+        refs = {}
+        for ref, (tip, _) in self.branches.items():
+            old = self.old_refs.get(ref)
+            if tip and old and not self.force and not is_ancestor(self.repo, old, tip):
+                self.rejected[ref] = (old, tip)
+                continue
+            if tip:
+                self.rejected.pop(ref, None)
+                refs[ref] = tip
+        refs.update(self.tags)
+        for ref, sha in refs.items():
+            path = self.repo.gitdir / ref
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix="tmp_ref_", dir=path.parent)
+            with os.fdopen(fd, "w") as f:
+                f.write(sha + "\n")
+            os.replace(tmp_path, path)
+
+    # Reading the stream
+
+    def _next(self):
+        """Move to the next command line, skipping blank lines and comments."""
+        while True:
+            line = self.stream.readline()
+            if not line:
+                self.line = None
+                return
+            line = line.rstrip(b"\n")
+            if line and not line.startswith(b"#"):
+                self.line = line
+                return
+
+    def _optional(self, prefix):
+        """The value of the current line if it starts with `prefix` (and move on), else None."""
+        if self.line is not None and self.line.startswith(prefix):
+            value = self.line[len(prefix):]
+            self._next()
+            return value
+        return None
+
+    def _data(self):
+        if self.line is None or not self.line.startswith(b"data "):
+            raise ValueError(f"Expected 'data' command, found: {self._current()}")
+        arg = self.line[5:]
+        if arg.startswith(b"<<"):
+            delimiter = arg[2:] + b"\n"
+            lines = []
+            while True:
+                line = self.stream.readline()
+                if not line:
+                    raise ValueError("EOF in data (terminator not found)")
+                if line == delimiter:
+                    break
+                lines.append(line)
+            data = b"".join(lines)
+        else:
+            size = int(arg)
+            data = self.stream.read(size)
+            if len(data) != size:
+                raise ValueError(f"EOF in data ({len(data)} bytes remaining)")
+        self._next()
+        return data
+
+    def _current(self):
+        return "EOF" if self.line is None else self.line.decode(errors="replace")
+
+    def _mark(self, sha, mark):
+        if mark is not None:
+            self.marks[int(mark.lstrip(b":"))] = sha
+
+    # Commands
+
+    def _blob(self):
+        self._next()
+        mark = self._optional(b"mark ")
+        self._optional(b"original-oid ")
+        data = self._data()
+
+        sha = object_sha(OBJ_BLOB, data)
+        self._mark(sha, mark)
+        if sha not in self.pending and not self._exists(sha):
+            self.pending[sha] = data
+            self.pending_bytes += len(data)
+            while self.pending_bytes > BLOB_BUDGET and len(self.pending) > 1:
+                old_sha, old_data = self.pending.popitem(last=False)
+                self.pending_bytes -= len(old_data)
+                self._write_blob(old_sha, old_data, None)
+
+    def _commit(self, ref):
+        _check_ref(ref)
+        self._next()
+        mark = self._optional(b"mark ")
+        self._optional(b"original-oid ")
+        author = self._optional(b"author ")
+        committer = self._optional(b"committer ")
+        if committer is None:
+            raise ValueError(f"Expected 'committer' command, found: {self._current()}")
+        encoding = self._optional(b"encoding ")
+        message = self._data()
+
+        start = self._optional(b"from ")
+        if start is not None:
+            tip = self._commitish(start.decode())
+            state = [tip, _TreeNode(self._commit_tree(tip) if tip else None)]
+        else:
+            state = self.branches.get(ref) or self._existing_branch(ref)
+        parents = [state[0]] if state[0] else []
+        while True:
+            merge = self._optional(b"merge ")
+            if merge is None:
+                break
+            parents.append(self._commitish(merge.decode()))
+
+        root = state[1]
+        while self.line is not None and self.line.startswith(FILE_COMMANDS):
+            self._file_command(root, self.line)
+
+        kvlm = {b"tree": self._write_tree(root).encode(),
+                b"parent": [p.encode() for p in parents],
+                b"author": author if author is not None else committer,
+                b"committer": committer}
+        if encoding is not None:
+            kvlm[b"encoding"] = encoding
+        kvlm[None] = message
+
+        sha = self._add(OBJ_COMMIT, kvlm_serialize(kvlm))
+        self.commit_trees[sha] = root.sha
+        self.branches[ref] = [sha, root]
+        self._mark(sha, mark)
+
+    def _tag(self, name):
+        _check_ref(f"refs/tags/{name}")
+        self._next()
+        mark = self._optional(b"mark ")
+        target = self._optional(b"from ")
+        if target is None:
+            raise ValueError(f"Expected 'from' command, found: {self._current()}")
+        self._optional(b"original-oid ")
+        tagger = self._optional(b"tagger ")
+        message = self._data()
+
+        sha = self._commitish(target.decode())
+        type_num = self._object_type(sha)
+        if type_num is None:
+            raise ValueError(f"Not a valid object: {target.decode(errors='replace')}")
+        kvlm = {b"object": sha.encode(),
+                b"type": TYPE_NAMES[type_num],
+                b"tag": name.encode()}
+        if tagger is not None:
+            kvlm[b"tagger"] = tagger
+        kvlm[None] = message
+
+        tag_sha = self._add(OBJ_TAG, kvlm_serialize(kvlm))
+        self.tags[f"refs/tags/{name}"] = tag_sha
+        self._mark(tag_sha, mark)
+
+    def _reset(self, ref):
+        _check_ref(ref)
+        self._next()
+        start = self._optional(b"from ")
+        tip = self._commitish(start.decode()) if start is not None else None
+        self.branches[ref] = [tip, _TreeNode(self._commit_tree(tip) if tip else None)]
+
+    def _file_command(self, root, line):
+        self._next()
+        if line == b"deleteall":
+            root.sha = None
+            root.entries = {}
+        elif line.startswith(b"M "):
+            mode, ref, rest = line[2:].split(b" ", 2)
+            mode = MODES.get(mode, mode)
+            path, _ = _parse_path(rest, last=True)
+            if ref == b"inline":
+                data = self._data()
+                sha = object_sha(OBJ_BLOB, data)
+                if not self._exists(sha):
+                    self._write_blob(sha, data, path)
+                else:
+                    self._remember(path, sha, data)
+            else:
+                sha = self._dataref(ref.decode())
+                data = self.pending.pop(sha, None)
+                if data is not None:
+                    self.pending_bytes -= len(data)
+                    self._write_blob(sha, data, path)
+                elif mode != b"160000" and not (sha in self.writer or object_exists(self.repo, sha)):
+                    raise ValueError(f"Object {sha} not found for {path.decode(errors='replace')}")
+            self._set(root, path, mode, sha)
+        elif line.startswith(b"D "):
+            path, _ = _parse_path(line[2:], last=True)
+            self._take(root, path.split(b"/"))
+        elif line.startswith((b"R ", b"C ")):
+            source, rest = _parse_path(line[2:], last=False)
+            target, _ = _parse_path(rest, last=True)
+            parts = source.split(b"/")
+            entry = self._take(root, parts) if line[0] == ord("R") else self._get(root, parts)
+            if entry is None:
+                raise ValueError(f"Path {source.decode(errors='replace')} not in branch")
+            mode, sha, node = entry
+            if node is not None and node.sha is None:
+                sha = self._write_tree(node)
+            self._set(root, target, mode, sha)
+
+    # Objects
+
+    def _exists(self, sha):
+        # Like git, only packs are checked: a loose copy just gets packed too,
+        # and every new object would otherwise cost a stat
+        return sha in self.writer or self.repo.packs.find(sha) is not None
+
+    def _add(self, type_num, data, sha=None, base=None):
+        """Append an object unless it exists. With `base`, the (sha, data) of
+        an earlier version, it is stored as a delta against it if that pays."""
+        if sha is None:
+            sha = object_sha(type_num, data)
+        if self._exists(sha):
+            return sha
+        delta = None
+        if base is not None and base[0] in self.writer and self.chain_depth.get(base[0], 0) < self.depth:
+            # Not worth it unless the delta saves half the object, as in repack
+            delta = create_delta(base[1], data, len(data) // 2 - 20)
+        if delta is not None:
+            self.writer.add_ofs_delta(sha, base[0], delta)
+            self.chain_depth[sha] = self.chain_depth.get(base[0], 0) + 1
+            self.stats["delta"] += 1
+        else:
+            self.writer.add(type_num, data, sha)
+        self.types[sha] = type_num
+        self.stats[TYPE_NAMES[type_num].decode()] += 1
+        return sha
+
+    def _write_blob(self, sha, data, path):
+        if path is None:
+            self._add(OBJ_BLOB, data, sha)
+        else:
+            self._add(OBJ_BLOB, data, sha, self.bases.get(path))
+            self._remember(path, sha, data)
+
+    def _remember(self, path, sha, data):
+        old = self.bases.pop(path, None)
+        if old is not None:
+            self.bases_bytes -= len(old[1])
+        if len(data) > BLOB_BUDGET:
+            return
+        self.bases[path] = (sha, data)
+        self.bases_bytes += len(data)
+        while self.bases_bytes > BLOB_BUDGET:
+            _, (_, evicted) = self.bases.popitem(last=False)
+            self.bases_bytes -= len(evicted)
+
+    def _dataref(self, ref):
+        if ref.startswith(":"):
+            try:
+                return self.marks[int(ref[1:])]
+            except (KeyError, ValueError):
+                raise ValueError(f"Unknown mark {ref}")
+        if _is_sha(ref):
+            return ref
+        raise ValueError(f"Invalid dataref {ref}")
+
+    def _commitish(self, name):
+        if name.startswith(":"):
+            return self._dataref(name)
+        if name == NULL_SHA:
+            return None
+        # 'from refs/heads/<branch>^0' restarts a branch from its current tip
+        peel = name.endswith("^0")
+        if peel:
+            name = name[:-2]
+        for ref in (name, f"refs/heads/{name}"):
+            if ref in self.branches:
+                return self.branches[ref][0]
+        sha = resolve_ref(self.repo, name)
+        if self._object_type(sha) is None:
+            raise ValueError(f"Not a valid commit: {name}")
+        if peel:
+            sha = peel_to_commit(self.repo, sha)
+            if sha is None:
+                raise ValueError(f"Not a valid commit: {name}^0")
+        return sha
+
+    def _existing_branch(self, ref):
+        sha = resolve_ref(self.repo, ref)
+        if self._object_type(sha) != OBJ_COMMIT:
+            return [None, _TreeNode()]
+        return [sha, _TreeNode(self._commit_tree(sha))]
+
+    def _object_type(self, sha):
+        type_num = self.types.get(sha)
+        if type_num is None and _is_sha(sha):
+            type_num = object_info(self.repo, sha)[0]
+        return type_num
+
+    def _commit_tree(self, sha):
+        tree = self.commit_trees.get(sha)
+        if tree is None:
+            type_num, data = object_read_raw(self.repo, sha)
+            if type_num != OBJ_COMMIT:
+                raise ValueError(f"Not a valid commit: {sha}")
+            tree = kvlm_parse(data, headers_only=True)[b"tree"].decode()
+        return tree
+
+    # Trees
+
+    def _load(self, node):
+        if node.entries is None:
+            data = self.trees.get(node.sha)
+            if data is None:
+                type_num, data = object_read_raw(self.repo, node.sha)
+                if type_num != OBJ_TREE:
+                    raise ValueError(f"Not a valid tree: {node.sha}")
+            node.entries = {item.path: [item.mode, item.sha, None] for item in parse_tree(data)}
+        return node.entries
+
+    def _subtree(self, entry):
+        if entry[2] is None:
+            entry[2] = _TreeNode(entry[1])
+        return entry[2]
+
+    def _set(self, root, path, mode, sha):
+        *dirs, name = path.split(b"/")
+        node = root
+        for part in dirs:
+            entries = self._load(node)
+            node.sha = None
+            entry = entries.get(part)
+            if entry is None or entry[0] != TREE_MODE:
+                entry = entries[part] = [TREE_MODE, None, _TreeNode()]
+            node = self._subtree(entry)
+        entries = self._load(node)
+        node.sha = None
+        entries[name] = [mode, sha, _TreeNode(sha) if mode == TREE_MODE else None]
+
+    def _get(self, root, parts):
+        node = root
+        for part in parts[:-1]:
+            entry = self._load(node).get(part)
+            if entry is None or entry[0] != TREE_MODE:
+                return None
+            node = self._subtree(entry)
+        return self._load(node).get(parts[-1])
+
+    def _take(self, root, parts):
+        """Remove the entry at `parts` and return it; directories left empty go too."""
+        entries = self._load(root)
+        entry = entries.get(parts[0])
+        if entry is None:
+            return None
+        if len(parts) == 1:
+            taken = entries.pop(parts[0])
+        else:
+            if entry[0] != TREE_MODE:
+                return None
+            child = self._subtree(entry)
+            taken = self._take(child, parts[1:])
+            if taken is None:
+                return None
+            if not child.entries:
+                del entries[parts[0]]
+        root.sha = None
+        return taken
+
+    def _write_tree(self, node):
+        if node.sha is not None:
+            return node.sha
+        items = []
+        for name, entry in self._load(node).items():
+            if entry[2] is not None and entry[2].sha is None:
+                entry[1] = self._write_tree(entry[2])
+            # Sorted as tree_entry_key does, without building TreeEntry objects
+            key = name + b"/" if entry[0] == TREE_MODE else name
+            items.append((key, b"%s %s\x00%s" % (entry[0], name, bytes.fromhex(entry[1]))))
+        items.sort()
+        data = b"".join([item for _, item in items])
+        node.sha = self._add(OBJ_TREE, data, base=node.base)
+        node.base = (node.sha, data)
+        self.trees[node.sha] = data
+        return node.sha
+
+
+def _check_ref(ref):
+    # Ref names are joined onto the git directory, so anything outside
+    # refs/ or with '..' in it could write elsewhere
+    if not ref.startswith("refs/") or not check_refname_format(ref):
+        raise ValueError(f"Invalid ref name: {ref}")
+
+
+def _parse_path(text, last):
+    """Split a path off the front of `text`: a C-style quoted string, or the
+    rest of the line if `last`, else up to the next space. Returns (path, rest)."""
+    if text.startswith(b'"'):
+        out = bytearray()
+        i = 1
+        while True:
+            if i >= len(text):
+                raise ValueError(f"Unterminated quoted path: {text.decode(errors='replace')}")
+            c = text[i]
+            if c == ord('"'):
+                break
+            if c == ord("\\"):
+                i += 1
+                if text[i:i+3].isdigit():
+                    out.append(int(text[i:i+3], 8))
+                    i += 3
+                    continue
+                c = ESCAPES.get(text[i], text[i])
+            out.append(c)
+            i += 1
+        path, rest = bytes(out), text[i+1:].lstrip(b" ")
+    elif last:
+        path, rest = text, b""
+    else:
+        path, _, rest = text.partition(b" ")
+
+    parts = path.split(b"/")
+    if any(part in (b"", b".", b"..", b".git") for part in parts):
+        raise ValueError(f"Invalid path: {path.decode(errors='replace')}")
+    return path, rest
+
+
+def _is_sha(name):
+    return len(name) == 40 and all(c in "0123456789abcdef" for c in name)
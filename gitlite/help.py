@@ -9,13 +9,15 @@ start a working area (see also: gitlite help tutorial)
    init       Create an empty Git repository or reinitialize an existing one
 
 work on the current change (see also: gitlite help everyday)
+   add        Add file contents to the index
    diff       Show changes between commits, commit and working tree, etc
-   status     Show the working tree status (Not implemented)
+   status     Show the working tree status
 
 examine the history and state (see also: gitlite help revisions)
    log        Show commit logs
    cat-file   Provide content of repository objects
    ls-tree    List the contents of a tree object
+   merge-base Find as good common ancestors as possible for a merge
 
 grow, mark and tweak your common history
    branch     List, create, or delete branches
@@ -26,6 +28,12 @@ grow, mark and tweak your common history
 collaborate (see also: gitlite help workflows)
    config     Get and set repository or global options
 
+maintain the repository
+   commit-graph Write the commit-graph file
+   fast-import  Backend for fast Git data importers
+   gc         Pack reachable objects and remove redundant copies
+   repack     Pack unpacked objects in a repository
+
 'gitlite help -a' and 'gitlite help -g' list available subcommands and some
 concept guides. See 'gitlite help <command>' or 'gitlite help <concept>'
 to read about a specific subcommand or concept.
@@ -47,16 +55,27 @@ HELP_COMMIT = """
 gitlite-commit - Record changes to the repository
 
 SYNOPSIS
-    gitlite commit -m <msg>
+    gitlite commit [-a] -m <msg>
 
 DESCRIPTION
-    Stores the current contents of the index in a new commit along with a log message from the user describing the changes.
+    Stores the current contents of the index in a new commit along with a log message from the user describing the changes. Use 'gitlite add' to stage what should be committed; changes that were not staged are left out.
+
+    A commit whose tree would be the same as its parent's (or, for the first commit, empty) is refused with "nothing to commit".
+
+    In a repository that has commits but no .git/index (one made before gitlite kept an index), the index is first filled from HEAD's tree, so files that were not touched stay in the commit.
 
-    Note: In gitlite, this command acts like 'git commit -a', automatically snapshotting all tracked files in the current directory (respecting .gitignore).
+    Only the trees of directories whose entries changed are written; the others come from the index cache-tree.
 
 OPTIONS
+    -a, --all
+        Stage changes to tracked files first, and remove files that were deleted from the working tree. New files are not added. Files whose size, mtime, ctime and inode are unchanged since they were last staged are not read or hashed again.
+
     -m <msg>
         Use the given <msg> as the commit message.
+
+CONFIGURATION
+    core.threads
+        Number of threads used to read, hash and compress changed files. Defaults to the number of CPUs; 1 disables threading.
 """
 
 HELP_CHECKOUT = """
@@ -70,34 +89,83 @@ DESCRIPTION
 
     If <commit> is a branch name, checking it out switches to that branch.
     If <commit> is a SHA-1 hash, checking it out puts the repository in a 'detached HEAD' state.
+
+    Only files that differ between the current commit and <commit> are written or removed; local changes to other files are kept.
+
+    The checkout is refused before anything is touched if a file it would remove or replace has local changes, staged or not, or if an untracked file is in the way.
+
+CONFIGURATION
+    checkout.workers
+        Number of threads writing files (default 1). A value below 1 uses one thread per CPU.
+
+    checkout.thresholdForParallelism
+        Fewer files than this (default 100) are always written by a single thread.
 """
 
 HELP_LOG = """
 gitlite-log - Show commit logs
 
 SYNOPSIS
-    gitlite log [<revision range>]
+    gitlite log [<options>] [<revision>...] [-- <path>...]
 
 DESCRIPTION
-    Shows the commit logs.
+    Shows the commit logs, newest commit date first. Commits are printed as they are found, so limiting the output also limits how much history is read.
+
+    Parents, dates and generation numbers come from the commit-graph when there is one (see 'gitlite help commit-graph').
+
+OPTIONS
+    -<number>, -n <number>, --max-count=<number>
+        Limit the number of commits to output.
 
-    The command takes options applicable to the git rev-list command to control what is shown and how, and options applicable to the git diff-* commands to control how the changes each commit introduces are shown.
+    --since=<date>, --after=<date>
+        Show commits more recent than a specific date. Dates may be epoch seconds, ISO 8601 dates or relative dates such as '2 weeks ago'.
+
+    --until=<date>, --before=<date>
+        Show commits older than a specific date.
+
+    --first-parent
+        Follow only the first parent commit upon seeing a merge commit.
+
+    [--] <path>...
+        Show only commits that change the given paths. A merge that took the paths unchanged from one parent is not shown, and only that parent is followed.
 """
 
 HELP_DIFF = """
 gitlite-diff - Show changes between commits, commit and working tree, etc
 
 SYNOPSIS
-    gitlite diff [<commit>]
+    gitlite diff [<options>] [<commit>]
+    gitlite diff [<options>] --cached [<commit>]
+    gitlite diff [<options>] <commit> <commit>
 
 DESCRIPTION
     Show changes between the working tree and the index or a tree, changes between the index and a tree, changes between two trees, changes resulting from a merge, changes between two blob objects, or changes between two files on disk.
 
     gitlite diff
-        Changes between the working tree and the index.
+        Changes between the working tree and the index. Files whose stat data matches the index are not read; other files are hashed, and only files that really changed are diffed. Files found unchanged have their stat data updated in the index.
 
     gitlite diff <commit>
-        Changes between the working tree and the named <commit>.
+        Changes between the working tree and the named <commit>, seen through the index in the same way.
+
+    gitlite diff --cached [<commit>]
+        Changes between the index and the named <commit> (HEAD by default). --staged is a synonym of --cached.
+
+    gitlite diff <commit> <commit>
+        Changes between two arbitrary commits or trees. Subtrees that are the same on both sides are skipped without being read.
+
+OPTIONS
+    --name-status
+        Show only the names and status (A, D, M or T) of changed files.
+
+    --stat
+        Generate a diffstat.
+
+    --diff-algorithm=<algorithm>
+        Choose how lines are matched up: myers (the default), minimal, patience or histogram. --minimal, --patience and --histogram are short for the same. Hunks are the same as git produces with the same algorithm.
+
+CONFIGURATION
+    diff.algorithm
+        The algorithm to use when --diff-algorithm is not given.
 """
 
 HELP_BRANCH = """
@@ -154,9 +222,29 @@ gitlite-cat-file - Provide content of repository objects
 
 SYNOPSIS
     gitlite cat-file <type> <object>
+    gitlite cat-file (-t | -s) <object>
+    gitlite cat-file (--batch | --batch-check) [--buffer]
 
 DESCRIPTION
     In its first form, the command provides the content or the type of an object in the repository. The type is required (blob, tree, commit, tag).
+
+    In batch mode, object names (SHAs or refs) are read from standard input, one per line, and answered in a single process.
+
+OPTIONS
+    -t
+        Show the object's type.
+
+    -s
+        Show the object's size. Only the object's header is read, so large or deltified objects are not inflated.
+
+    --batch
+        Print "<sha> <type> <size>" followed by the object's contents and a newline for each object, or "<object> missing".
+
+    --batch-check
+        Print only the "<sha> <type> <size>" line (or "<object> missing").
+
+    --buffer
+        Flush output only at the end rather than after each object. Faster when all input is given up front.
 """
 
 HELP_HASH_OBJECT = """
@@ -177,21 +265,143 @@ HELP_LS_TREE = """
 gitlite-ls-tree - List the contents of a tree object
 
 SYNOPSIS
-    gitlite ls-tree <tree-ish>
+    gitlite ls-tree [-l] <tree-ish>
 
 DESCRIPTION
     Lists the contents of a given tree object, like what "ls -a" does in the current working directory.
+
+OPTIONS
+    -l, --long
+        Show the size of blob entries, read from their object headers.
 """
 
 HELP_WRITE_TREE = """
-gitlite-write-tree - Create a tree object from the current directory
+gitlite-write-tree - Create a tree object from the current index
 
 SYNOPSIS
     gitlite write-tree
 
 DESCRIPTION
-    Creates a tree object using the current directory content.
-    The index is not used in gitlite; this command scans the directory directly.
+    Creates a tree object using the current index, exactly as staged with 'gitlite add'. Trees cached in the index are reused.
+"""
+
+HELP_ADD = """
+gitlite-add - Add file contents to the index
+
+SYNOPSIS
+    gitlite add <pathspec>...
+
+DESCRIPTION
+    This command updates the index (.git/index) using the current content found in the working tree. Directories are added recursively, respecting .gitignore. Tracked files that no longer exist in the working tree are removed from the index.
+
+    Files whose stat data matches the index entry are not hashed again.
+"""
+
+HELP_STATUS = """
+gitlite-status - Show the working tree status
+
+SYNOPSIS
+    gitlite status
+
+DESCRIPTION
+    Displays paths that have differences between the index file and the current HEAD commit, paths that have differences between the working tree and the index file, and paths in the working tree that are not tracked.
+
+    Only files whose stat data differs from the index are hashed to find out whether they really changed.
+"""
+
+HELP_REPACK = """
+gitlite-repack - Pack unpacked objects in a repository
+
+SYNOPSIS
+    gitlite repack [-a] [-d]
+
+DESCRIPTION
+    This command is used to combine all objects that do not currently reside in a "pack", into a pack. Objects are found by walking HEAD, every ref under refs/ (including packed-refs) and the index.
+
+    A pack is a single .pack file holding compressed objects, with a matching .idx (version 2) used to find them.
+
+OPTIONS
+    -a
+        Instead of incrementally packing the unpacked objects, pack every reachable object into a single pack.
+
+    -d
+        After packing, remove the loose copies of packed objects. Together with -a, also remove the packs the new pack makes redundant; unreachable objects in them are lost. Packs with a .keep file are never removed.
+CONFIGURATION
+    pack.window
+        How many preceding objects (sorted by type, path and size) each tree or blob is tried as a delta against. Defaults to 10; 0 disables deltas.
+
+    pack.depth
+        The longest delta chain allowed. Defaults to 50.
+"""
+
+HELP_GC = """
+gitlite-gc - Cleanup unnecessary files and optimize the local repository
+
+SYNOPSIS
+    gitlite gc
+
+DESCRIPTION
+    Packs every reachable object into a single pack, removes the packs it supersedes and prunes loose objects that are now packed, as 'gitlite repack -a -d' does. It then rewrites the commit-graph (see 'gitlite help commit-graph').
+
+    Unreachable loose objects are left alone.
+"""
+
+HELP_MERGE_BASE = """
+gitlite-merge-base - Find as good common ancestors as possible for a merge
+
+SYNOPSIS
+    gitlite merge-base [-a | --all] <commit> <commit>
+    gitlite merge-base --is-ancestor <commit> <commit>
+
+DESCRIPTION
+    Finds the best common ancestor between two commits. A common ancestor is better than another if it is a descendant of it. Commit parents and generation numbers are read from the commit-graph when there is one.
+
+OPTIONS
+    -a, --all
+        Output all merge bases for the commits, instead of just one.
+
+    --is-ancestor
+        Check if the first <commit> is an ancestor of the second <commit>, and exit with status 0 if true, or with status 1 if not.
+"""
+
+HELP_COMMIT_GRAPH = """
+gitlite-commit-graph - Write the commit-graph file
+
+SYNOPSIS
+    gitlite commit-graph write
+
+DESCRIPTION
+    Writes objects/info/commit-graph for every commit reachable from HEAD and the refs, in git's format. It stores each commit's tree, parents, generation number and commit date, so log, merge-base and ancestry checks can walk history without reading commit objects. Commits made afterwards are read from their objects until the file is rewritten; 'gitlite gc' rewrites it too.
+"""
+
+HELP_FAST_IMPORT = """
+gitlite-fast-import - Backend for fast Git data importers
+
+SYNOPSIS
+    frontend | gitlite fast-import [--quiet] [--force]
+
+DESCRIPTION
+    Reads a stream in git's fast-import format on standard input, such as the output of 'git fast-export', and writes the objects it describes straight into a new pack. The blob, commit, tag, reset, checkpoint, progress and done commands are supported, with marks, 'data <count>' and 'data <<delim>' blocks and the M, D, R, C and deleteall file commands. Dates are taken as they are (the raw format). A 'from' or 'merge' may name a mark, a SHA or a branch, and 'from refs/heads/<branch>^0' restarts a branch from its current tip.
+
+    Each blob and tree is stored as a delta against the previous version at the same path when that saves at least half of it, within pack.depth. Objects already in the repository are not written again.
+
+    At each 'checkpoint' and at the end of the stream the pack and its index are written and the refs of imported branches and tags are updated. 'progress' lines are copied to standard output.
+
+    Ref names must be under refs/ and follow the rules of 'git check-ref-format'; a stream naming any other ref is refused before it is written. A branch that existed before the import is only moved to a commit that contains its old tip. Other updates are left undone with a warning, and the command exits with status 1.
+
+OPTIONS
+    --quiet
+        Do not print the number of imported objects.
+
+    --force
+        Update existing branches even when the new tip does not contain the old one.
+
+CONFIGURATION
+    pack.compression
+        The zlib level of the pack. Defaults to -1 (zlib's default).
+
+    pack.depth
+        The longest delta chain allowed. Defaults to 50.
 """
 
 DETAILS = {
@@ -206,7 +416,14 @@ DETAILS = {
     "cat-file": HELP_CAT_FILE,
     "hash-object": HELP_HASH_OBJECT,
     "ls-tree": HELP_LS_TREE,
-    "write-tree": HELP_WRITE_TREE
+    "write-tree": HELP_WRITE_TREE,
+    "add": HELP_ADD,
+    "status": HELP_STATUS,
+    "repack": HELP_REPACK,
+    "gc": HELP_GC,
+    "merge-base": HELP_MERGE_BASE,
+    "commit-graph": HELP_COMMIT_GRAPH,
+    "fast-import": HELP_FAST_IMPORT
 }
 
 def show_help(cmd=None):
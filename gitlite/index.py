@@ -0,0 +1,243 @@
+import hashlib
+import os
+import struct
+
+# Fixed part of an index entry: ten 32-bit stat fields, the SHA-1 and the flags
+ENTRY_HEADER = struct.Struct(">10I20sH")
+
+
+class GitIndexEntry:
+    def __init__(self, path, sha, mode=0o100644, ctime=(0, 0), mtime=(0, 0),
+                 dev=0, ino=0, uid=0, gid=0, size=0, flags=0):
+        self.path = path        # worktree-relative, '/' separated
+        self.sha = sha          # hex
+        self.mode = mode
+        self.ctime = ctime      # (seconds, nanoseconds)
+        self.mtime = mtime
+        self.dev = dev
+        self.ino = ino
+        self.uid = uid
+        self.gid = gid
+        self.size = size
+        self.flags = flags
+
+    def update_stat(self, st):
+        """Record the stat data of the file this entry was hashed from."""
+        self.ctime = _split_ns(st.st_ctime_ns)
+        self.mtime = _split_ns(st.st_mtime_ns)
+        # Stored as 32-bit fields on disk, so keep them truncated the same way
+        self.dev = st.st_dev & 0xFFFFFFFF
+        self.ino = st.st_ino & 0xFFFFFFFF
+        self.uid = st.st_uid & 0xFFFFFFFF
+        self.gid = st.st_gid & 0xFFFFFFFF
+        self.size = st.st_size & 0xFFFFFFFF
+
+    def stat_matches(self, st):
+        """True if the file looks untouched since this entry was recorded."""
+        return (self.mtime == _split_ns(st.st_mtime_ns)
+                and self.ctime == _split_ns(st.st_ctime_ns)
+                and self.ino == st.st_ino & 0xFFFFFFFF
+                and self.size == st.st_size & 0xFFFFFFFF)
+
+
+class CacheTree:
+    """Cached tree SHA of one directory in the index (git's TREE extension).
+
+    `entry_count` is the number of index entries below the directory, or -1
+    once something below it changed and `sha` is stale.
+    """
+
+    def __init__(self, entry_count=-1, sha=None):
+        self.entry_count = entry_count
+        self.sha = sha
+        self.children = {}
+
+    def is_valid(self):
+        return self.entry_count >= 0
+
+    def find(self, dirs, create=False):
+        node = self
+        for name in dirs:
+            child = node.children.get(name)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[name] = CacheTree()
+            node = child
+        return node
+
+
+class GitIndex:
+    """In-memory form of .git/index (the DIRC format, version 2).
+
+    `timestamp` is the mtime of the index file when it was read; entries whose
+    file mtime is not older than it are "racily clean" and must be re-hashed
+    because the file may have changed within the same timestamp tick.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.timestamp = None
+        self.cache_tree = CacheTree()
+
+    def add(self, entry):
+        old = self.entries.get(entry.path)
+        if old is None or old.sha != entry.sha or old.mode != entry.mode:
+            self.invalidate(entry.path)
+        self.entries[entry.path] = entry
+
+    def remove(self, path):
+        if self.entries.pop(path, None) is not None:
+            self.invalidate(path)
+
+    def invalidate(self, path):
+        """Mark the cached trees of every directory containing `path` as stale."""
+        node = self.cache_tree
+        node.entry_count = -1
+        for name in path.split("/")[:-1]:
+            node = node.children.get(name)
+            if node is None:
+                break
+            node.entry_count = -1
+
+    def sorted_entries(self):
+        return [self.entries[p] for p in sorted(self.entries, key=lambda p: p.encode())]
+
+    def is_racy(self, entry):
+        return self.timestamp is None or entry.mtime >= self.timestamp
+
+    def is_clean(self, entry, st):
+        """True if the entry's SHA can be reused for a file with this stat."""
+        return entry.stat_matches(st) and not self.is_racy(entry)
+
+
+def _split_ns(ns):
+    return ns // 1_000_000_000, ns % 1_000_000_000
+
+
+def index_path(repo):
+    return repo.gitdir / "index"
+
+
+def read_index(repo):
+    """Read .git/index, returning an empty GitIndex if there is none."""
+    index = GitIndex()
+    path = index_path(repo)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+            st = os.fstat(f.fileno())
+    except FileNotFoundError:
+        return index
+
+    if len(data) < 32 or hashlib.sha1(data[:-20]).digest() != data[-20:]:
+        raise Exception("index file corrupt")
+
+    signature, version, count = struct.unpack_from(">4sII", data, 0)
+    if signature != b'DIRC':
+        raise Exception("index file has bad signature")
+    if version != 2:
+        raise Exception(f"Unsupported index version {version}")
+
+    index.timestamp = _split_ns(st.st_mtime_ns)
+
+    pos = 12
+    for _ in range(count):
+        (ctime_s, ctime_ns, mtime_s, mtime_ns, dev, ino, mode, uid, gid, size,
+         sha, flags) = ENTRY_HEADER.unpack_from(data, pos)
+
+        name_end = data.index(b'\x00', pos + ENTRY_HEADER.size)
+        path = data[pos + ENTRY_HEADER.size:name_end].decode()
+
+        index.add(GitIndexEntry(
+            path, sha.hex(), mode, (ctime_s, ctime_ns), (mtime_s, mtime_ns),
+            dev, ino, uid, gid, size, flags
+        ))
+
+        # Entries are NUL-padded to a multiple of 8 bytes (at least one NUL)
+        pos += ((name_end - pos) + 8) & ~7
+
+    # Extensions: 4 byte signature, 32-bit size, payload
+    while pos < len(data) - 20:
+        signature, size = struct.unpack_from(">4sI", data, pos)
+        pos += 8
+        if signature == b'TREE':
+            _, index.cache_tree, _ = _parse_cache_tree(data, pos)
+        elif not b'A' <= signature[:1] <= b'Z':
+            # Lowercase signatures mark extensions a reader must understand
+            raise Exception(f"index uses {signature.decode(errors='replace')} extension, which we do not understand")
+        pos += size
+
+    return index
+
+
+def _parse_cache_tree(data, pos):
+    """Parse one TREE extension node (and its subtrees) at `pos`."""
+    nul = data.index(b'\x00', pos)
+    name = data[pos:nul].decode()
+    nl = data.index(b'\n', nul)
+    entry_count, subtree_count = (int(n) for n in data[nul+1:nl].split(b' '))
+    pos = nl + 1
+
+    node = CacheTree(entry_count)
+    if entry_count >= 0:
+        node.sha = data[pos:pos+20].hex()
+        pos += 20
+
+    for _ in range(subtree_count):
+        child_name, child, pos = _parse_cache_tree(data, pos)
+        node.children[child_name] = child
+
+    return name, node, pos
+
+
+def _serialize_cache_tree(name, node, parts):
+    parts.append(b'%s\x00%d %d\n' % (name.encode(), node.entry_count, len(node.children)))
+    if node.is_valid():
+        parts.append(bytes.fromhex(node.sha))
+    # Same subtree order as git: shorter names first, then bytewise
+    for child_name in sorted(node.children, key=lambda n: (len(n.encode()), n.encode())):
+        _serialize_cache_tree(child_name, node.children[child_name], parts)
+
+
+def write_index(repo, index):
+    """Write the index atomically through .git/index.lock."""
+    entries = index.sorted_entries()
+    parts = [struct.pack(">4sII", b'DIRC', 2, len(entries))]
+
+    for e in entries:
+        path = e.path.encode()
+        flags = (e.flags & 0xF000) | min(len(path), 0xFFF)
+        header = ENTRY_HEADER.pack(
+            e.ctime[0], e.ctime[1], e.mtime[0], e.mtime[1],
+            e.dev, e.ino, e.mode, e.uid, e.gid, e.size,
+            bytes.fromhex(e.sha), flags
+        )
+        entry_len = len(header) + len(path)
+        parts.append(header + path + b'\x00' * (((entry_len + 8) & ~7) - entry_len))
+
+    tree_parts = []
+    _serialize_cache_tree("", index.cache_tree, tree_parts)
+    tree_data = b"".join(tree_parts)
+    parts.append(struct.pack(">4sI", b'TREE', len(tree_data)) + tree_data)
+
+    data = b"".join(parts)
+    data += hashlib.sha1(data).digest()
+
+    path = index_path(repo)
+    lock_path = path.with_name("index.lock")
+    try:
+        f = open(lock_path, "xb")
+    except FileExistsError:
+        # Still a FileExistsError, so callers can tell a held lock from other failures
+        raise FileExistsError(f"Unable to create '{lock_path}': File exists.") from None
+
+    try:
+        with f:
+            f.write(data)
+        os.replace(lock_path, path)
+    except Exception:
+        lock_path.unlink(missing_ok=True)
+        raise
+
+    index.timestamp = _split_ns(os.stat(path).st_mtime_ns)
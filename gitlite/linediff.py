@@ -0,0 +1,861 @@
+"""Line diffs producing the same hunks as git's xdiff.
+
+Lines are interned to ints once, and every algorithm works on those ints,
+marking lines as changed in one `changed` list per side (xdiff's rchg).
+The algorithms follow xdiff closely: Myers with its cost heuristics and
+preprocessing (trimming the common ends, discarding lines without a match),
+patience, and histogram, followed by the same hunk compaction (slide
+groups to line up with the other side, then git's indent heuristic).
+"""
+
+ALGORITHMS = ("myers", "minimal", "patience", "histogram")
+
+# xdiff tuning constants
+MAX_COST_MIN = 256
+HEUR_MIN_COST = 256
+SNAKE_CNT = 20
+K_HEUR = 4
+MAX_EQLIMIT = 1024
+SIMSCAN_WINDOW = 100
+KPDIS_RUN = 4
+HISTOGRAM_MAX_CHAIN = 64
+
+CONTEXT = 3
+FUNCNAME_MAX = 80
+SPACE = " \t\n\v\f\r"
+
+
+def split_lines(text):
+    """Split on '\\n' only, keeping the newlines (the last line may lack one)."""
+    parts = text.split("\n")
+    lines = [part + "\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def intern_lines(a, b):
+    """Map equal lines of both sides to the same small int."""
+    ids = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b]
+    return a_ids, b_ids
+
+
+def diff_lines(a, b, algorithm="myers"):
+    """Compare two line lists. Returns (changed_a, changed_b): one bool per line."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"unknown diff algorithm '{algorithm}'")
+    a_ids, b_ids = intern_lines(a, b)
+
+    if algorithm == "patience":
+        rchg1, rchg2 = [False] * len(a_ids), [False] * len(b_ids)
+        _patience(a_ids, b_ids, rchg1, rchg2, 1, len(a_ids), 1, len(b_ids))
+    elif algorithm == "histogram":
+        rchg1, rchg2 = [False] * len(a_ids), [False] * len(b_ids)
+        _histogram(a_ids, b_ids, rchg1, rchg2, 1, len(a_ids), 1, len(b_ids))
+    else:
+        rchg1, rchg2 = _myers(a_ids, b_ids, need_min=algorithm == "minimal")
+
+    _compact(a, a_ids, rchg1, rchg2)
+    _compact(b, b_ids, rchg2, rchg1)
+    return rchg1, rchg2
+
+
+# Myers
+
+def _bogosqrt(n):
+    i = 1
+    while n > 0:
+        i <<= 1
+        n >>= 2
+    return i
+
+
+def _myers(a, b, need_min=False):
+    rchg1 = [False] * len(a)
+    rchg2 = [False] * len(b)
+
+    # Common ends never take part
+    start = 0
+    limit = min(len(a), len(b))
+    while start < limit and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < limit - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a_end, b_end = len(a) - end, len(b) - end
+
+    # Lines without a match on the other side are changed for sure, and so
+    # are lines with many matches sitting in a run of such lines. Only the
+    # rest goes through the (expensive) search.
+    counts_a, counts_b = {}, {}
+    for line in a:
+        counts_a[line] = counts_a.get(line, 0) + 1
+    for line in b:
+        counts_b[line] = counts_b.get(line, 0) + 1
+
+    ha1, rindex1 = _discard(a, start, a_end, counts_b, rchg1, need_min)
+    ha2, rindex2 = _discard(b, start, b_end, counts_a, rchg2, need_min)
+
+    ndiags = len(ha1) + len(ha2) + 3
+    env = _MyersEnv(ha1, ha2, rindex1, rindex2, rchg1, rchg2,
+                    max(_bogosqrt(ndiags), MAX_COST_MIN), ndiags)
+    env.compare(0, len(ha1), 0, len(ha2), need_min)
+    return rchg1, rchg2
+
+
+def _discard(lines, start, end, other_counts, rchg, need_min):
+    mlim = min(_bogosqrt(len(lines)), MAX_EQLIMIT)
+    dis = [0] * len(lines)
+    for i in range(start, end):
+        matches = other_counts.get(lines[i], 0)
+        dis[i] = 0 if matches == 0 else 2 if matches >= mlim and not need_min else 1
+
+    ha = []
+    rindex = []
+    for i in range(start, end):
+        if dis[i] == 1 or (dis[i] == 2 and not _clean_mmatch(dis, i, start, end - 1)):
+            rindex.append(i)
+            ha.append(lines[i])
+        else:
+            rchg[i] = True
+    return ha, rindex
+
+
+def _clean_mmatch(dis, i, s, e):
+    """Whether a line with many matches sits among lines without any (xdl_clean_mmatch)."""
+    s = max(s, i - SIMSCAN_WINDOW)
+    e = min(e, i + SIMSCAN_WINDOW)
+
+    r, rdis0, rpdis0 = 1, 0, 1
+    while i - r >= s:
+        if not dis[i - r]:
+            rdis0 += 1
+        elif dis[i - r] == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    if rdis0 == 0:
+        return False
+
+    r, rdis1, rpdis1 = 1, 0, 1
+    while i + r <= e:
+        if not dis[i + r]:
+            rdis1 += 1
+        elif dis[i + r] == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * KPDIS_RUN < rpdis1 + rdis1
+
+
+class _MyersEnv:
+    """Divide and conquer over the middle snake (xdl_recs_cmp / xdl_split)."""
+
+    def __init__(self, ha1, ha2, rindex1, rindex2, rchg1, rchg2, mxcost, ndiags):
+        self.ha1, self.ha2 = ha1, ha2
+        self.rindex1, self.rindex2 = rindex1, rindex2
+        self.rchg1, self.rchg2 = rchg1, rchg2
+        self.mxcost = mxcost
+        # Diagonals run from -(len(ha2) + 1) to len(ha1) + 1
+        self.koff = len(ha2) + 1
+        self.kvdf = [0] * ndiags
+        self.kvdb = [0] * ndiags
+
+    def compare(self, off1, lim1, off2, lim2, need_min):
+        ha1, ha2 = self.ha1, self.ha2
+        stack = [(off1, lim1, off2, lim2, need_min)]
+        while stack:
+            off1, lim1, off2, lim2, need_min = stack.pop()
+            while off1 < lim1 and off2 < lim2 and ha1[off1] == ha2[off2]:
+                off1 += 1
+                off2 += 1
+            while off1 < lim1 and off2 < lim2 and ha1[lim1 - 1] == ha2[lim2 - 1]:
+                lim1 -= 1
+                lim2 -= 1
+
+            if off1 == lim1:
+                for i in range(off2, lim2):
+                    self.rchg2[self.rindex2[i]] = True
+            elif off2 == lim2:
+                for i in range(off1, lim1):
+                    self.rchg1[self.rindex1[i]] = True
+            else:
+                i1, i2, min_lo, min_hi = self.split(off1, lim1, off2, lim2, need_min)
+                # Same order as the recursion in xdiff: low half first
+                stack.append((i1, lim1, i2, lim2, min_hi))
+                stack.append((off1, i1, off2, i2, min_lo))
+
+    def split(self, off1, lim1, off2, lim2, need_min):
+        ha1, ha2 = self.ha1, self.ha2
+        kvdf, kvdb, k = self.kvdf, self.kvdb, self.koff
+        dmin, dmax = off1 - lim2, lim1 - off2
+        fmid, bmid = off1 - off2, lim1 - lim2
+        odd = (fmid - bmid) & 1
+        fmin = fmax = fmid
+        bmin = bmax = bmid
+
+        kvdf[fmid + k] = off1
+        kvdb[bmid + k] = lim1
+
+        ec = 0
+        while True:
+            ec += 1
+            got_snake = False
+
+            if fmin > dmin:
+                fmin -= 1
+                kvdf[fmin - 1 + k] = -1
+            else:
+                fmin += 1
+            if fmax < dmax:
+                fmax += 1
+                kvdf[fmax + 1 + k] = -1
+            else:
+                fmax -= 1
+
+            for d in range(fmax, fmin - 1, -2):
+                if kvdf[d - 1 + k] >= kvdf[d + 1 + k]:
+                    i1 = kvdf[d - 1 + k] + 1
+                else:
+                    i1 = kvdf[d + 1 + k]
+                prev1 = i1
+                i2 = i1 - d
+                while i1 < lim1 and i2 < lim2 and ha1[i1] == ha2[i2]:
+                    i1 += 1
+                    i2 += 1
+                if i1 - prev1 > SNAKE_CNT:
+                    got_snake = True
+                kvdf[d + k] = i1
+                if odd and bmin <= d <= bmax and kvdb[d + k] <= i1:
+                    return i1, i2, True, True
+
+            if bmin > dmin:
+                bmin -= 1
+                kvdb[bmin - 1 + k] = float("inf")
+            else:
+                bmin += 1
+            if bmax < dmax:
+                bmax += 1
+                kvdb[bmax + 1 + k] = float("inf")
+            else:
+                bmax -= 1
+
+            for d in range(bmax, bmin - 1, -2):
+                if kvdb[d - 1 + k] < kvdb[d + 1 + k]:
+                    i1 = kvdb[d - 1 + k]
+                else:
+                    i1 = kvdb[d + 1 + k] - 1
+                prev1 = i1
+                i2 = i1 - d
+                while i1 > off1 and i2 > off2 and ha1[i1 - 1] == ha2[i2 - 1]:
+                    i1 -= 1
+                    i2 -= 1
+                if prev1 - i1 > SNAKE_CNT:
+                    got_snake = True
+                kvdb[d + k] = i1
+                if not odd and fmin <= d <= fmax and i1 <= kvdf[d + k]:
+                    return i1, i2, True, True
+
+            if need_min:
+                continue
+
+            # Costly: settle for a diagonal that got far with a long snake
+            if got_snake and ec > HEUR_MIN_COST:
+                best = 0
+                for d in range(fmax, fmin - 1, -2):
+                    dd = d - fmid if d > fmid else fmid - d
+                    i1 = kvdf[d + k]
+                    i2 = i1 - d
+                    v = (i1 - off1) + (i2 - off2) - dd
+                    if (v > K_HEUR * ec and v > best
+                            and off1 + SNAKE_CNT <= i1 < lim1
+                            and off2 + SNAKE_CNT <= i2 < lim2):
+                        run = 1
+                        while ha1[i1 - run] == ha2[i2 - run]:
+                            if run == SNAKE_CNT:
+                                best = v
+                                spl = (i1, i2)
+                                break
+                            run += 1
+                if best > 0:
+                    return spl[0], spl[1], True, False
+
+                best = 0
+                for d in range(bmax, bmin - 1, -2):
+                    dd = d - bmid if d > bmid else bmid - d
+                    i1 = kvdb[d + k]
+                    i2 = i1 - d
+                    v = (lim1 - i1) + (lim2 - i2) - dd
+                    if (v > K_HEUR * ec and v > best
+                            and off1 < i1 <= lim1 - SNAKE_CNT
+                            and off2 < i2 <= lim2 - SNAKE_CNT):
+                        run = 0
+                        while ha1[i1 + run] == ha2[i2 + run]:
+                            if run == SNAKE_CNT - 1:
+                                best = v
+                                spl = (i1, i2)
+                                break
+                            run += 1
+                if best > 0:
+                    return spl[0], spl[1], False, True
+
+            # Enough is enough: take the furthest reaching path
+            if ec >= self.mxcost:
+                fbest = fbest1 = -1
+                for d in range(fmax, fmin - 1, -2):
+                    i1 = min(kvdf[d + k], lim1)
+                    i2 = i1 - d
+                    if lim2 < i2:
+                        i1, i2 = lim2 + d, lim2
+                    if fbest < i1 + i2:
+                        fbest, fbest1 = i1 + i2, i1
+
+                bbest = bbest1 = float("inf")
+                for d in range(bmax, bmin - 1, -2):
+                    i1 = max(off1, kvdb[d + k])
+                    i2 = i1 - d
+                    if i2 < off2:
+                        i1, i2 = off2 + d, off2
+                    if i1 + i2 < bbest:
+                        bbest, bbest1 = i1 + i2, i1
+
+                if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                    return fbest1, fbest - fbest1, True, False
+                return bbest1, bbest - bbest1, False, True
+
+
+def _fall_back(a, b, rchg1, rchg2, line1, count1, line2, count2):
+    """Run Myers on a sub-range (1-based lines), as patience and histogram do."""
+    sub1, sub2 = _myers(a[line1 - 1:line1 - 1 + count1], b[line2 - 1:line2 - 1 + count2])
+    rchg1[line1 - 1:line1 - 1 + count1] = sub1
+    rchg2[line2 - 1:line2 - 1 + count2] = sub2
+
+
+def _mark(rchg, line, count):
+    for i in range(line - 1, line - 1 + count):
+        rchg[i] = True
+
+
+# Patience
+
+def _patience(a, b, rchg1, rchg2, line1, count1, line2, count2):
+    stack = [(line1, count1, line2, count2)]
+    while stack:
+        line1, count1, line2, count2 = stack.pop()
+        if not count1:
+            _mark(rchg2, line2, count2)
+            continue
+        if not count2:
+            _mark(rchg1, line1, count1)
+            continue
+
+        # Lines unique on both sides, in the order of their first occurrence in a
+        entries = {}
+        for line in range(line1, line1 + count1):
+            entry = entries.get(a[line - 1])
+            if entry is None:
+                entries[a[line - 1]] = [line, 0]
+            else:
+                entry[1] = -1
+        has_matches = False
+        for line in range(line2, line2 + count2):
+            entry = entries.get(b[line - 1])
+            if entry is not None:
+                has_matches = True
+                entry[1] = line if entry[1] == 0 else -1
+
+        if not has_matches:
+            _mark(rchg1, line1, count1)
+            _mark(rchg2, line2, count2)
+            continue
+
+        common = _longest_common_sequence([e for e in entries.values() if e[1] > 0])
+        if not common:
+            _fall_back(a, b, rchg1, rchg2, line1, count1, line2, count2)
+            continue
+
+        # Walk the anchors, growing each into the lines around it; the gaps
+        # in between are diffed the same way (pushed in reverse to keep order)
+        end1, end2 = line1 + count1, line2 + count2
+        ranges = []
+        pos = 0
+        while True:
+            if pos < len(common):
+                next1, next2 = common[pos]
+                while next1 > line1 and next2 > line2 and a[next1 - 2] == b[next2 - 2]:
+                    next1 -= 1
+                    next2 -= 1
+            else:
+                next1, next2 = end1, end2
+            while line1 < next1 and line2 < next2 and a[line1 - 1] == b[line2 - 1]:
+                line1 += 1
+                line2 += 1
+
+            if next1 > line1 or next2 > line2:
+                ranges.append((line1, next1 - line1, line2, next2 - line2))
+            if pos >= len(common):
+                break
+
+            while (pos + 1 < len(common) and common[pos + 1][0] == common[pos][0] + 1
+                   and common[pos + 1][1] == common[pos][1] + 1):
+                pos += 1
+            line1, line2 = common[pos][0] + 1, common[pos][1] + 1
+            pos += 1
+        stack.extend(reversed(ranges))
+
+
+def _longest_common_sequence(entries):
+    """Patience sorting over [line1, line2] pairs (ordered by line1)."""
+    sequence = []       # entry indexes, the tails of increasing runs
+    previous = [None] * len(entries)
+    for n, (_, line2) in enumerate(entries):
+        left, right = -1, len(sequence)
+        while left + 1 < right:
+            middle = left + (right - left) // 2
+            if entries[sequence[middle]][1] > line2:
+                right = middle
+            else:
+                left = middle
+        previous[n] = sequence[left] if left >= 0 else None
+        if left + 1 == len(sequence):
+            sequence.append(n)
+        else:
+            sequence[left + 1] = n
+
+    if not sequence:
+        return []
+    result = []
+    n = sequence[-1]
+    while n is not None:
+        result.append(tuple(entries[n]))
+        n = previous[n]
+    result.reverse()
+    return result
+
+
+# Histogram
+
+def _histogram(a, b, rchg1, rchg2, line1, count1, line2, count2):
+    stack = [(line1, count1, line2, count2)]
+    while stack:
+        line1, count1, line2, count2 = stack.pop()
+        if count1 <= 0 and count2 <= 0:
+            continue
+        if not count1:
+            _mark(rchg2, line2, count2)
+            continue
+        if not count2:
+            _mark(rchg1, line1, count1)
+            continue
+
+        lcs = _find_lcs(a, b, line1, count1, line2, count2)
+        if lcs is None:
+            _fall_back(a, b, rchg1, rchg2, line1, count1, line2, count2)
+        elif lcs[0] == 0 and lcs[2] == 0:
+            _mark(rchg1, line1, count1)
+            _mark(rchg2, line2, count2)
+        else:
+            begin1, end1, begin2, end2 = lcs
+            end_a, end_b = line1 + count1 - 1, line2 + count2 - 1
+            stack.append((end1 + 1, end_a - end1, end2 + 1, end_b - end2))
+            stack.append((line1, begin1 - line1, line2, begin2 - line2))
+
+
+def _find_lcs(a, b, line1, count1, line2, count2):
+    """Longest run around the rarest common line (xhistogram's find_lcs).
+
+    Returns (begin1, end1, begin2, end2), all zero if nothing is common, or
+    None if every common line is too frequent and Myers should be used.
+    """
+    end_a = line1 + count1 - 1
+    end_b = line2 + count2 - 1
+
+    # For each distinct line of a: [first occurrence, count]; next_ptr chains
+    # later occurrences, line_count maps a line number to its line's count
+    records = {}
+    next_ptr = {}
+    line_record = {}
+    for ptr in range(end_a, line1 - 1, -1):
+        record = records.get(a[ptr - 1])
+        if record is None:
+            record = records[a[ptr - 1]] = [ptr, 1]
+        else:
+            next_ptr[ptr] = record[0]
+            record[0] = ptr
+            record[1] += 1
+        line_record[ptr] = record
+
+    best_cnt = HISTOGRAM_MAX_CHAIN + 1
+    has_common = False
+    lcs = [0, 0, 0, 0]
+
+    b_ptr = line2
+    while b_ptr <= end_b:
+        b_next = b_ptr + 1
+        record = records.get(b[b_ptr - 1])
+        if record is not None:
+            if record[1] > best_cnt:
+                has_common = True
+            else:
+                has_common = True
+                as_ = record[0]
+                while True:
+                    np = next_ptr.get(as_, 0)
+                    bs = b_ptr
+                    ae, be = as_, bs
+                    rc = record[1]
+
+                    while line1 < as_ and line2 < bs and a[as_ - 2] == b[bs - 2]:
+                        as_ -= 1
+                        bs -= 1
+                        if rc > 1:
+                            rc = min(rc, line_record[as_][1])
+                    while ae < end_a and be < end_b and a[ae] == b[be]:
+                        ae += 1
+                        be += 1
+                        if rc > 1:
+                            rc = min(rc, line_record[ae][1])
+
+                    if b_next <= be:
+                        b_next = be + 1
+                    if lcs[1] - lcs[0] < ae - as_ or rc < best_cnt:
+                        lcs = [as_, ae, bs, be]
+                        best_cnt = rc
+
+                    if np == 0:
+                        break
+                    while np and np <= ae:
+                        np = next_ptr.get(np, 0)
+                    if np == 0:
+                        break
+                    as_ = np
+        b_ptr = b_next
+
+    if has_common and HISTOGRAM_MAX_CHAIN < best_cnt:
+        return None
+    return tuple(lcs)
+
+
+# Compaction
+
+def _compact(lines, ids, rchg, rchg_other):
+    """Slide each group of changed lines to its best position (xdl_change_compact).
+
+    A group is first merged with any neighbours it can reach, then lined up
+    with a change on the other side if possible, and otherwise placed where
+    git's indent heuristic scores it best.
+    """
+    n = len(ids)
+    n_other = len(rchg_other)
+    chg = _Flags(rchg)
+    chg_other = _Flags(rchg_other)
+
+    def group_init(flags):
+        end = 0
+        while flags[end]:
+            end += 1
+        return [0, end]
+
+    def group_next(flags, nrec, g):
+        if g[1] == nrec:
+            return False
+        g[0] = g[1] + 1
+        g[1] = g[0]
+        while flags[g[1]]:
+            g[1] += 1
+        return True
+
+    def group_previous(flags, g):
+        if g[0] == 0:
+            return False
+        g[1] = g[0] - 1
+        g[0] = g[1]
+        while flags[g[0] - 1]:
+            g[0] -= 1
+        return True
+
+    def slide_down(g):
+        if g[1] < n and ids[g[0]] == ids[g[1]]:
+            chg[g[0]] = False
+            chg[g[1]] = True
+            g[0] += 1
+            g[1] += 1
+            while chg[g[1]]:
+                g[1] += 1
+            return True
+        return False
+
+    def slide_up(g):
+        if g[0] > 0 and ids[g[0] - 1] == ids[g[1] - 1]:
+            g[0] -= 1
+            g[1] -= 1
+            chg[g[0]] = True
+            chg[g[1]] = False
+            while chg[g[0] - 1]:
+                g[0] -= 1
+            return True
+        return False
+
+    g = group_init(chg)
+    go = group_init(chg_other)
+    while True:
+        if g[1] != g[0]:
+            while True:
+                groupsize = g[1] - g[0]
+                end_matching_other = -1
+
+                while slide_up(g):
+                    group_previous(chg_other, go)
+                earliest_end = g[1]
+                if go[1] > go[0]:
+                    end_matching_other = g[1]
+
+                while slide_down(g):
+                    group_next(chg_other, n_other, go)
+                    if go[1] > go[0]:
+                        end_matching_other = g[1]
+
+                if groupsize == g[1] - g[0]:
+                    break
+
+            if g[1] == earliest_end:
+                pass
+            elif end_matching_other != -1:
+                while go[1] == go[0]:
+                    slide_up(g)
+                    group_previous(chg_other, go)
+            else:
+                best_shift = -1
+                best_score = None
+                shift = max(earliest_end, g[1] - groupsize - 1, g[1] - INDENT_MAX_SLIDING)
+                while shift <= g[1]:
+                    score = [0, 0]
+                    _score_split(lines, shift, score)
+                    _score_split(lines, shift - groupsize, score)
+                    if best_shift == -1 or _score_cmp(score, best_score) <= 0:
+                        best_score = score
+                        best_shift = shift
+                    shift += 1
+                while g[1] > best_shift:
+                    slide_up(g)
+                    group_previous(chg_other, go)
+
+        if not group_next(chg, n, g):
+            break
+        group_next(chg_other, n_other, go)
+
+
+class _Flags:
+    """A changed-line list that reads as False just outside both ends."""
+
+    __slots__ = ("flags",)
+
+    def __init__(self, flags):
+        self.flags = flags
+
+    def __getitem__(self, i):
+        return 0 <= i < len(self.flags) and self.flags[i]
+
+    def __setitem__(self, i, value):
+        self.flags[i] = value
+
+
+# Indent heuristic (see xdiff/xdiffi.c for the reasoning behind the weights)
+INDENT_MAX_SLIDING = 100
+MAX_INDENT = 200
+MAX_BLANKS = 20
+START_OF_FILE_PENALTY = 1
+END_OF_FILE_PENALTY = 21
+TOTAL_BLANK_WEIGHT = -30
+POST_BLANK_WEIGHT = 6
+RELATIVE_INDENT_PENALTY = -4
+RELATIVE_INDENT_WITH_BLANK_PENALTY = 10
+RELATIVE_OUTDENT_PENALTY = 24
+RELATIVE_OUTDENT_WITH_BLANK_PENALTY = 17
+RELATIVE_DEDENT_PENALTY = 23
+RELATIVE_DEDENT_WITH_BLANK_PENALTY = 17
+INDENT_WEIGHT = 60
+
+
+def _get_indent(line):
+    indent = 0
+    for c in line:
+        if c not in SPACE:
+            return indent
+        if c == " ":
+            indent += 1
+        elif c == "\t":
+            indent += 8 - indent % 8
+        if indent >= MAX_INDENT:
+            return MAX_INDENT
+    # Only whitespace
+    return -1
+
+
+def _score_split(lines, split, score):
+    """Add the badness of splitting `lines` before index `split` to [effective_indent, penalty]."""
+    nrec = len(lines)
+    end_of_file = split >= nrec
+    indent = -1 if end_of_file else _get_indent(lines[split])
+
+    pre_blank, pre_indent = 0, -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = _get_indent(lines[i])
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == MAX_BLANKS:
+            pre_indent = 0
+            break
+
+    post_blank, post_indent = 0, -1
+    for i in range(split + 1, nrec):
+        post_indent = _get_indent(lines[i])
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == MAX_BLANKS:
+            post_indent = 0
+            break
+
+    penalty = 0
+    if pre_indent == -1 and pre_blank == 0:
+        penalty += START_OF_FILE_PENALTY
+    if end_of_file:
+        penalty += END_OF_FILE_PENALTY
+
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+    penalty += TOTAL_BLANK_WEIGHT * total_blank
+    penalty += POST_BLANK_WEIGHT * post_blank
+
+    if indent == -1:
+        indent = post_indent
+    any_blanks = total_blank != 0
+    score[0] += indent
+
+    if indent == -1 or pre_indent == -1 or indent == pre_indent:
+        pass
+    elif indent > pre_indent:
+        penalty += RELATIVE_INDENT_WITH_BLANK_PENALTY if any_blanks else RELATIVE_INDENT_PENALTY
+    elif post_indent != -1 and post_indent > indent:
+        penalty += RELATIVE_OUTDENT_WITH_BLANK_PENALTY if any_blanks else RELATIVE_OUTDENT_PENALTY
+    else:
+        penalty += RELATIVE_DEDENT_WITH_BLANK_PENALTY if any_blanks else RELATIVE_DEDENT_PENALTY
+    score[1] += penalty
+
+
+def _score_cmp(s1, s2):
+    cmp_indents = (s1[0] > s2[0]) - (s1[0] < s2[0])
+    return INDENT_WEIGHT * cmp_indents + (s1[1] - s2[1])
+
+
+# Output
+
+def count_changes(a, b, algorithm="myers"):
+    """(insertions, deletions) between two line lists."""
+    changed_a, changed_b = diff_lines(a, b, algorithm)
+    return sum(changed_b), sum(changed_a)
+
+
+def unified_diff(a, b, old_name, new_name, algorithm="myers", context=CONTEXT):
+    """Yield a diff of two line lists in git's unified format, hunk headers
+    with function names included. Yields nothing if they are equal."""
+    changed_a, changed_b = diff_lines(a, b, algorithm)
+
+    # (i1, i2, chg1, chg2) for each block of changes, in order
+    changes = []
+    i1 = i2 = 0
+    n1, n2 = len(a), len(b)
+    while i1 < n1 or i2 < n2:
+        if (i1 < n1 and changed_a[i1]) or (i2 < n2 and changed_b[i2]):
+            s1, s2 = i1, i2
+            while i1 < n1 and changed_a[i1]:
+                i1 += 1
+            while i2 < n2 and changed_b[i2]:
+                i2 += 1
+            changes.append((s1, s2, i1 - s1, i2 - s2))
+        else:
+            i1 += 1
+            i2 += 1
+    if not changes:
+        return
+
+    yield f"--- {old_name}\n"
+    yield f"+++ {new_name}\n"
+
+    func_line = ""
+    func_prev = -1
+    start = 0
+    while start < len(changes):
+        # Changes closer than two contexts share a hunk
+        end = start
+        while (end + 1 < len(changes)
+               and changes[end + 1][0] - (changes[end][0] + changes[end][2]) <= 2 * context):
+            end += 1
+        first, last = changes[start], changes[end]
+
+        s1 = max(first[0] - context, 0)
+        s2 = max(first[1] - context, 0)
+        found = _find_func_line(a, s1 - 1, func_prev)
+        if found is not None:
+            func_line = found
+        func_prev = s1 - 1
+
+        lctx = min(context, n1 - (last[0] + last[2]), n2 - (last[1] + last[3]))
+        e1 = last[0] + last[2] + lctx
+        e2 = last[1] + last[3] + lctx
+
+        header = f"@@ -{_hunk_range(s1 + 1, e1 - s1)} +{_hunk_range(s2 + 1, e2 - s2)} @@"
+        yield header + (" " + func_line if func_line else "") + "\n"
+
+        pos2 = s2
+        for i1, i2, chg1, chg2 in changes[start:end + 1]:
+            for line in b[pos2:i2]:
+                yield from _record(" ", line)
+            for line in a[i1:i1 + chg1]:
+                yield from _record("-", line)
+            for line in b[i2:i2 + chg2]:
+                yield from _record("+", line)
+            pos2 = i2 + chg2
+        for line in b[pos2:e2]:
+            yield from _record(" ", line)
+
+        start = end + 1
+
+
+def _hunk_range(start, count):
+    if count == 0:
+        return f"{start - 1},0"
+    if count == 1:
+        return f"{start}"
+    return f"{start},{count}"
+
+
+def _record(prefix, line):
+    yield prefix + line
+    if not line.endswith("\n"):
+        yield "\n\\ No newline at end of file\n"
+
+
+def _find_func_line(lines, start, limit):
+    """Nearest line at or above `start` (stopping at `limit`) that looks like a
+    function header by git's default rule: it starts with a letter, '_' or '$'."""
+    step = -1 if start > limit else 1
+    i = start
+    while i != limit and 0 <= i < len(lines):
+        line = lines[i]
+        if line and ((line[0].isascii() and line[0].isalpha()) or line[0] in "_$"):
+            text = line.encode(errors="surrogateescape")[:FUNCNAME_MAX]
+            return text.decode(errors="surrogateescape").rstrip(SPACE)
+        i += step
+    return None
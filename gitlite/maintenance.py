@@ -0,0 +1,239 @@
+import zlib
+from .repo import list_refs, resolve_ref
+from .config import get_config_int, get_compression_level
+from .commitgraph import write_commit_graph
+from .storage import object_read_raw, object_info
+from .index import read_index
+from .objects.kvlm import kvlm_parse
+from .objects.tree import parse_tree
+from .pack.types import OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG
+from .pack.delta import create_delta
+from .pack.writer import PackWriter
+
+# Defaults of pack.window and pack.depth, as in git
+DEFAULT_WINDOW = 10
+DEFAULT_DEPTH = 50
+
+
+def reachable_tips(repo):
+    """SHAs that HEAD and every ref point at."""
+    tips = list(list_refs(repo).values())
+    head = resolve_ref(repo, "HEAD")
+    if head:
+        tips.append(head)
+    return tips
+
+
+def collect_reachable(repo):
+    """List every object reachable from HEAD, the refs and the index.
+
+    Returns (sha, type_num, name) tuples, commits and tags first and then trees
+    and blobs, where `name` is the path an object was first seen at ("" for
+    commits and tags).
+    """
+    tips = reachable_tips(repo)
+    index = read_index(repo)
+
+    seen = set()
+    commits = []
+    contents = []
+
+    # (sha, name) still to visit; index blobs are kept even if uncommitted
+    stack = [(sha, "") for sha in reversed(tips)]
+    stack += [(e.sha, e.path) for e in index.entries.values() if e.mode & 0o170000 != 0o160000]
+
+    while stack:
+        sha, name = stack.pop()
+        if sha in seen:
+            continue
+
+        type_num, data = object_read_raw(repo, sha)
+        if type_num is None:
+            # Refs pointing nowhere (e.g. an unborn branch) are not our business
+            continue
+        seen.add(sha)
+
+        if type_num == OBJ_COMMIT:
+            commits.append((sha, type_num, name))
+            kvlm = kvlm_parse(data, headers_only=True)
+            parents = kvlm.get(b'parent', [])
+            if not isinstance(parents, list):
+                parents = [parents]
+            for parent in reversed(parents):
+                stack.append((parent.decode(), ""))
+            stack.append((kvlm[b'tree'].decode(), ""))
+        elif type_num == OBJ_TAG:
+            commits.append((sha, type_num, name))
+            stack.append((kvlm_parse(data, headers_only=True)[b'object'].decode(), ""))
+        elif type_num == OBJ_TREE:
+            contents.append((sha, type_num, name))
+            for item in reversed(parse_tree(data)):
+                if item.mode.startswith(b'16'):
+                    # Submodule commits live in another repository
+                    continue
+                path = item.path.decode()
+                stack.append((item.sha, f"{name}/{path}" if name else path))
+        elif type_num == OBJ_BLOB:
+            contents.append((sha, type_num, name))
+
+    return commits + contents
+
+
+def repack(repo, all_objects=False, delete_redundant=False):
+    """Pack objects into a new pack. Returns the path of the new .pack, or None.
+
+    By default only reachable objects that are not in a pack yet are packed.
+    With `all_objects` every reachable object goes into the new pack, and with
+    `delete_redundant` the packs it supersedes and the loose copies of packed
+    objects are removed.
+    """
+    pack_dir = repo.gitdir / "objects" / "pack"
+    registry = repo.packs
+    registry.refresh(force=True)
+    old_packs = list(registry.packs)
+
+    objects = collect_reachable(repo)
+    if not all_objects:
+        objects = [o for o in objects if registry.find(o[0]) is None]
+
+    window = get_config_int(repo, "pack.window", DEFAULT_WINDOW)
+    depth = get_config_int(repo, "pack.depth", DEFAULT_DEPTH)
+    deltas = find_deltas(repo, objects, window, depth)
+
+    level = get_compression_level(repo, "pack.compression", zlib.Z_DEFAULT_COMPRESSION)
+    writer = PackWriter(pack_dir, level)
+    try:
+        for sha, _, _ in objects:
+            _write_object(repo, writer, sha, deltas)
+        pack_path = writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+    if delete_redundant:
+        registry.close()
+        if all_objects:
+            for pack in old_packs:
+                if pack.pack_path == pack_path:
+                    continue
+                if pack.pack_path.with_suffix(".keep").exists():
+                    continue
+                # Index first, so the pack is never visible without its data
+                pack.idx_path.unlink(missing_ok=True)
+                pack.pack_path.unlink(missing_ok=True)
+        registry.refresh(force=True)
+        prune_packed(repo)
+
+    registry.refresh(force=True)
+    return pack_path
+
+
+def name_hash(name):
+    """git's pack name hash: similar paths, especially same suffixes, sort together."""
+    value = 0
+    for c in name.encode():
+        if c in b" \t\n\r\f\v":
+            continue
+        value = ((value >> 2) + (c << 24)) & 0xFFFFFFFF
+    return value
+
+
+def find_deltas(repo, objects, window=DEFAULT_WINDOW, depth=DEFAULT_DEPTH):
+    """Pick a delta base for the objects in `objects` that compress well against one.
+
+    Trees and blobs are sorted by type, name hash and decreasing size, so
+    revisions of the same file end up next to each other with the largest
+    first, and each is tried against the previous `window` objects. Chains are
+    kept to at most `depth` deltas. Returns {sha: (base_sha, delta)}.
+    """
+    deltas = {}
+    if window <= 0 or depth <= 0:
+        return deltas
+
+    # Sizes come from object headers; contents are read only while in the window
+    candidates = []
+    for sha, type_num, name in objects:
+        if type_num in (OBJ_TREE, OBJ_BLOB):
+            candidates.append((type_num, name_hash(name), object_info(repo, sha)[1], sha))
+    candidates.sort(key=lambda c: (c[0], c[1], -c[2]))
+
+    chain_depth = {}
+    recent = []     # (type_num, sha, data) of the last `window` candidates
+    for type_num, _, size, sha in candidates:
+        _, data = object_read_raw(repo, sha)
+        # Not worth it unless the delta saves half the object (less for deep chains)
+        best = None
+        max_size = size // 2 - 20
+        for base_type, base_sha, base_data in reversed(recent):
+            if base_type != type_num or max_size <= 0:
+                continue
+            base_depth = chain_depth.get(base_sha, 0)
+            if base_depth >= depth or size < len(base_data) // 32:
+                continue
+            scaled = max_size * (depth - base_depth) // depth
+            delta = create_delta(base_data, data, scaled)
+            if delta is not None:
+                best = (base_sha, delta)
+                max_size = len(delta) - 1
+
+        if best is not None:
+            deltas[sha] = best
+            chain_depth[sha] = chain_depth.get(best[0], 0) + 1
+
+        recent.append((type_num, sha, data))
+        if len(recent) > window:
+            recent.pop(0)
+
+    return deltas
+
+
+def _write_object(repo, writer, sha, deltas):
+    # OFS_DELTA bases must precede their deltas, so write the chain base first
+    chain = []
+    while sha not in writer and sha in deltas:
+        chain.append(sha)
+        sha = deltas[sha][0]
+    if sha not in writer:
+        type_num, data = object_read_raw(repo, sha)
+        writer.add(type_num, data, sha)
+    for delta_sha in reversed(chain):
+        base_sha, delta = deltas[delta_sha]
+        writer.add_ofs_delta(delta_sha, base_sha, delta)
+
+
+def prune_packed(repo):
+    """Delete loose objects that are also stored in a pack. Returns how many."""
+    objects_dir = repo.gitdir / "objects"
+    pruned = 0
+
+    for fan_dir in sorted(objects_dir.iterdir()):
+        name = fan_dir.name
+        if len(name) != 2 or not fan_dir.is_dir():
+            continue
+
+        for obj_path in fan_dir.iterdir():
+            sha = name + obj_path.name
+            if len(sha) == 40 and repo.packs.find(sha) is not None:
+                obj_path.unlink()
+                pruned += 1
+
+        try:
+            fan_dir.rmdir()
+        except OSError:
+            # Still holds unpacked objects
+            pass
+
+    return pruned
+
+
+def update_commit_graph(repo):
+    """Rewrite objects/info/commit-graph for everything reachable. Returns the commit count."""
+    return write_commit_graph(repo, reachable_tips(repo))
+
+
+def gc(repo):
+    """Pack all reachable objects into a single pack, drop what it supersedes
+    and refresh the commit-graph."""
+    pack_path = repack(repo, all_objects=True, delete_redundant=True)
+    update_commit_graph(repo)
+    return pack_path
@@ -1,56 +1,71 @@
 import collections
+import re
 
-def kvlm_parse(raw, start=0, dct=None):
+# The newline that ends a header value: one not followed by a continuation
+_VALUE_END = re.compile(rb'\n(?! )')
+
+def kvlm_parse(raw, start=0, dct=None, headers_only=False):
+    """Parse the headers and message of a commit or tag into an ordered dict.
+
+    Repeated keys (e.g. several `parent` lines) collect into a list, and
+    continuation lines (starting with a space, as in `gpgsig`) are joined to
+    their value. The message goes under the None key, unless `headers_only`
+    is set: parsing then stops at the blank line and the message is never
+    copied, which is all that walking history needs.
+    """
     if not dct:
         dct = collections.OrderedDict()
 
-    spc = raw.find(b' ', start)
-    nl = raw.find(b'\n', start)
-
-    # If no space or newline is found, or newline comes before space,
-    # it means we are at the blank line before the message.
-    if (spc < 0) or (nl < spc):
-        if nl != start:
-            raise ValueError(f"Invalid object: expected blank line at position {start}")
-        dct[None] = raw[start+1:]
-        return dct
+    find = raw.find
+    size = len(raw)
+    while True:
+        nl = find(b'\n', start)
+        # A line with no space before its end is the blank line before the
+        # message (or a malformed object)
+        spc = find(b' ', start, nl) if nl >= 0 else -1
+        if spc < 0:
+            if nl != start:
+                raise ValueError(f"Invalid object: expected blank line at position {start}")
+            if not headers_only:
+                dct[None] = raw[start+1:]
+            return dct
 
-    key = raw[start:spc]
+        key = raw[start:spc]
 
-    # Find the end of the value. Continuation lines start with space.
-    end = start
-    while True:
-        end = raw.find(b'\n', end+1)
-        if end < 0:
-            raise ValueError("Invalid object: unterminated header value")
-        if end + 1 >= len(raw) or raw[end+1] != ord(' '):
-            break
+        # Find the end of the value. Continuation lines start with space.
+        end = nl
+        if end + 1 < size and raw[end+1] == 0x20:
+            match = _VALUE_END.search(raw, end + 1)
+            if match is None:
+                raise ValueError("Invalid object: unterminated header value")
+            end = match.start()
 
-    value = raw[spc+1:end].replace(b'\n ', b'\n')
+        value = raw[spc+1:end]
+        if end != nl:
+            value = value.replace(b'\n ', b'\n')
 
-    if key in dct:
-        if isinstance(dct[key], list):
-            dct[key].append(value)
+        if key in dct:
+            if isinstance(dct[key], list):
+                dct[key].append(value)
+            else:
+                dct[key] = [dct[key], value]
         else:
-            dct[key] = [dct[key], value]
-    else:
-        dct[key] = value
+            dct[key] = value
 
-    return kvlm_parse(raw, start=end+1, dct=dct)
+        start = end + 1
 
 def kvlm_serialize(kvlm):
-    ret = b""
-    for k in kvlm.keys():
+    parts = []
+    for k, val in kvlm.items():
         if k is None: continue
-        val = kvlm[k]
         if not isinstance(val, list):
             val = [val]
 
         for v in val:
-            ret += k + b' ' + (v.replace(b'\n', b'\n ')) + b'\n'
+            parts.append(b"%s %s\n" % (k, v.replace(b'\n', b'\n ')))
 
-    ret += b'\n'
+    parts.append(b'\n')
     if None in kvlm:
-        ret += kvlm[None]
-        
-    return ret
+        parts.append(kvlm[None])
+
+    return b"".join(parts)
@@ -1,31 +1,81 @@
+import re
+from functools import partial
+from operator import itemgetter
 from .base import GitObject
 
+# mode SP name NUL 20-byte SHA, repeated
+_ENTRY = re.compile(rb'([0-7]+) ([^\x00]*)\x00(.{20})', re.S)
+_ENTRIES = re.compile(rb'(?:[0-7]+ [^\x00]*\x00.{20})*', re.S)
 
-def parse_tree(raw):
-    pos = 0
-    max_len = len(raw)
-    ret = []
-    while pos < max_len:
-        pos_space = raw.find(b' ', pos)
-        pos_null = raw.find(b'\x00', pos_space)
+# The SHA of a tree with no entries
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+
+class TreeEntry(tuple):
+    """One tree entry: (mode, path, raw_sha), all bytes.
+
+    A plain tuple underneath, so large trees cost one small object per entry
+    and parsing never runs Python code per entry. The hex SHA is only worked
+    out when `sha` is read. `sha` may be given as hex or as 20 raw bytes.
+    """
+    __slots__ = ()
+
+    def __new__(cls, mode, path, sha):
+        if isinstance(sha, str):
+            sha = bytes.fromhex(sha)
+        return tuple.__new__(cls, (mode, path, sha))
+
+    mode = property(itemgetter(0))
+    path = property(itemgetter(1))
+    raw_sha = property(itemgetter(2))
+
+    @property
+    def sha(self):
+        return self[2].hex()
+
+    def __repr__(self):
+        return f"TreeEntry({self[0]!r}, {self[1]!r}, {self.sha!r})"
 
-        mode = raw[pos:pos_space]
-        path = raw[pos_space+1:pos_null]
-        # Read 20 bytes for SHA-1
-        sha = raw[pos_null+1:pos_null+21]
 
-        ret.append({'mode': mode, 'path': path, 'sha': sha.hex()}) # mode + b' ' + path + b'\x00' + sha_binary
+# Builds entries straight from the (mode, path, raw_sha) tuples the regex yields
+_make_entry = partial(tuple.__new__, TreeEntry)
+
+
+def _check_tree(raw):
+    if _ENTRIES.fullmatch(raw) is None:
+        raise ValueError("Invalid object: malformed tree")
+
+
+def iter_tree(raw):
+    """Iterate over the entries of a tree's data (bytes or a memoryview) as
+    TreeEntry, parsing and checking each one as it is reached."""
+    end = 0
+    for match in _ENTRY.finditer(raw):
+        # finditer skips over anything that does not parse; a gap means garbage
+        if match.start() != end:
+            break
+        end = match.end()
+        yield _make_entry(match.groups())
+    if end != len(raw):
+        raise ValueError("Invalid object: malformed tree")
+
+
+def parse_tree(raw):
+    """All entries of a tree's data, as a list of TreeEntry."""
+    _check_tree(raw)
+    return list(map(_make_entry, _ENTRY.findall(raw)))
+
 
-        pos = pos_null + 21
-    return ret
+def tree_entry_key(item):
+    """Git orders tree entries by name, comparing directories as if they ended in '/'."""
+    mode = item.mode
+    if mode.startswith(b'04') or mode == b'40000':
+        return item.path + b'/'
+    return item.path
 
 
 def serialize_tree(items):
-    ret = b""
-    for item in items:
-        sha = bytes.fromhex(item['sha'])
-        ret += item['mode'] + b' ' + item['path'] + b'\x00' + sha
-    return ret
+    return b"".join([b"%s %s\x00%s" % item for item in items])
 
 
 class GitTree(GitObject):
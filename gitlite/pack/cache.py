@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_DELTA_BASE_CACHE_LIMIT = 96 * 1024 * 1024
+
+
+class DeltaBaseCache:
+    """LRU cache of resolved delta bases, bounded by the total size of their data.
+
+    Keys are (pack_path, offset) so one cache can be shared by every pack of a
+    repository. `hits` and `misses` count lookups. Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_DELTA_BASE_CACHE_LIMIT):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, type_num, data):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        # Callers may modify the bytearray they were given
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old[1])
+
+            self.entries[key] = (type_num, data)
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def discard_pack(self, pack_path):
+        """Drop entries of a pack that went away; its offsets no longer mean anything."""
+        with self._lock:
+            for key in [k for k in self.entries if k[0] == pack_path]:
+                _, data = self.entries.pop(key)
+                self.total_bytes -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "limit": self.max_bytes,
+        }
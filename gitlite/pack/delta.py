@@ -1,3 +1,13 @@
+# Bytes per indexed block of the delta base; also the shortest copy emitted
+BLOCK_SIZE = 16
+# Most base offsets remembered per block, so repetitive data stays cheap
+BUCKET_LIMIT = 64
+# Largest copy a single instruction may carry in pack v2
+MAX_COPY = 0x10000
+# Largest literal run a single insert instruction may carry
+MAX_INSERT = 0x7f
+
+
 def patch_delta(base, delta):
     pos = 0
     
@@ -73,4 +83,135 @@ def patch_delta(base, delta):
     if len(out) != target_size:
         raise Exception("Delta target size mismatch")
         
-    return bytes(out)
\ No newline at end of file
+    return bytes(out)
+
+
+def encode_varint(n):
+    """Little-endian base-128 size, as at the start of a delta."""
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def decode_varint(data, pos=0):
+    """Read a size written by encode_varint at data[pos]. Returns (n, pos after it)."""
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if not (byte & 0x80):
+            return n, pos
+
+
+def create_delta(base, target, max_size=None):
+    """Encode `target` as copy/insert instructions against `base` (inverse of patch_delta).
+
+    The base is cut into BLOCK_SIZE blocks that are indexed by content; every
+    position of the target is looked up in that index and matches are grown
+    forwards and backwards as far as the data agrees. Returns None if the
+    delta would be larger than `max_size`.
+    """
+    base = bytes(base)
+    target = bytes(target)
+
+    out = bytearray(encode_varint(len(base)) + encode_varint(len(target)))
+    index = _index_blocks(base)
+
+    pending = 0         # start of the literal run not yet emitted
+    pos = 0
+    last = len(target) - BLOCK_SIZE
+    while pos <= last:
+        offsets = index.get(target[pos:pos + BLOCK_SIZE])
+        if offsets is None:
+            pos += 1
+            continue
+
+        best_offset, best_length = 0, 0
+        for offset in offsets:
+            length = BLOCK_SIZE + _match_length(base, offset + BLOCK_SIZE, target, pos + BLOCK_SIZE)
+            if length > best_length:
+                best_offset, best_length = offset, length
+
+        # Bytes just before the block may match too; take them off the literal run
+        while (pos > pending and best_offset > 0
+               and base[best_offset - 1] == target[pos - 1]):
+            pos -= 1
+            best_offset -= 1
+            best_length += 1
+
+        _emit_insert(out, target, pending, pos)
+        _emit_copy(out, best_offset, best_length)
+        pos += best_length
+        pending = pos
+
+        if max_size is not None and len(out) > max_size:
+            return None
+
+    _emit_insert(out, target, pending, len(target))
+    if max_size is not None and len(out) > max_size:
+        return None
+    return bytes(out)
+
+
+def _index_blocks(base):
+    index = {}
+    for offset in range(0, len(base) - BLOCK_SIZE + 1, BLOCK_SIZE):
+        offsets = index.setdefault(base[offset:offset + BLOCK_SIZE], [])
+        if len(offsets) < BUCKET_LIMIT:
+            offsets.append(offset)
+    return index
+
+
+def _match_length(base, base_pos, target, target_pos):
+    """Length of the common run starting at base[base_pos] and target[target_pos]."""
+    limit = min(len(base) - base_pos, len(target) - target_pos)
+    length = 0
+    step = 64
+    # Compare growing slices while they agree, then halve down to the mismatch
+    while length < limit:
+        n = min(step, limit - length)
+        if base[base_pos + length:base_pos + length + n] == target[target_pos + length:target_pos + length + n]:
+            length += n
+            step *= 2
+        elif n > 1:
+            step = n // 2
+        else:
+            break
+    return length
+
+
+def _emit_insert(out, target, start, end):
+    while start < end:
+        n = min(end - start, MAX_INSERT)
+        out.append(n)
+        out += target[start:start + n]
+        start += n
+
+
+def _emit_copy(out, offset, length):
+    while length > 0:
+        n = min(length, MAX_COPY)
+        op = 0x80
+        args = bytearray()
+        for i in range(4):
+            byte = (offset >> (8 * i)) & 0xff
+            if byte:
+                op |= 1 << i
+                args.append(byte)
+        # A size of 0x10000 is encoded by leaving all size bytes out
+        size = n if n != MAX_COPY else 0
+        for i in range(3):
+            byte = (size >> (8 * i)) & 0xff
+            if byte:
+                op |= 0x10 << i
+                args.append(byte)
+        out.append(op)
+        out += args
+        offset += n
+        length -= n
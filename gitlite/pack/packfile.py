@@ -1,17 +1,25 @@
+import mmap
 import struct
+import threading
 import zlib
 from pathlib import Path
-from .delta import patch_delta
+from .cache import DeltaBaseCache
+from .delta import patch_delta, decode_varint
 from ..objects.blob import GitBlob
 from ..objects.tree import GitTree
 from ..objects.commit import GitCommit
 from ..objects.tag import GitTag
 from .types import OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG, OBJ_OFS_DELTA, OBJ_REF_DELTA
+
+# Compressed bytes read per step, and the most inflated bytes produced per step
+INFLATE_CHUNK = 64 * 1024
+INFLATE_PIECE = 1024 * 1024
  
 class GitPack:
-    def __init__(self, path, resolve_base_fn=None):
-        if str(path).endswith(".idx") or str(path).endswith(".pack"):
-            path = Path(str(path)[:-4])
+    def __init__(self, path, resolve_base_fn=None, use_mmap=True, delta_cache=None):
+        path = Path(path)
+        if path.suffix in (".idx", ".pack"):
+            path = path.with_suffix("")
             
         self.pack_path = path.with_suffix(".pack")
         self.idx_path = path.with_suffix(".idx")
@@ -21,75 +29,139 @@ class GitPack:
         self.total_objects = 0
         self.sha_offset = 0
         self.resolve_base_fn = resolve_base_fn
+        self.delta_cache = delta_cache if delta_cache is not None else DeltaBaseCache()
+
+        # In mmap mode the index and pack are read through memoryviews over
+        # the mapped files instead of seek()/read() pairs.
+        self.use_mmap = use_mmap
+        self.idx_map = None
+        self.idx_view = None
+        self.pack_map = None
+        self.pack_view = None
+
+        # Guards opening, closing and seek()/read() pairs, so one GitPack can
+        # be read from several threads; inflating happens outside of it
+        self._lock = threading.RLock()
  
     def load_index(self):
-        if self.f_idx:
-            return
-            
-        try:
-            self.f_idx = open(self.idx_path, "rb")
-        except FileNotFoundError:
-            return
-        
-        magic = self.f_idx.read(4)
-        if magic != b'\377tOc':
-            raise Exception("Not a git index file")
-            
-        version = struct.unpack(">I", self.f_idx.read(4))[0]
-        if version != 2:
-            raise Exception(f"Unsupported index version {version}")
-            
-        self.fanout = []    # fanout[i] = number of object SHAs whose first byte ≤ i
-        for _ in range(256):
-            n = struct.unpack(">I", self.f_idx.read(4))[0]
-            self.fanout.append(n)
-            
-        self.total_objects = self.fanout[255]
-        self.sha_offset = 4 + 4 + (256 * 4)
+        with self._lock:
+            if self.f_idx:
+                return
+
+            try:
+                self.f_idx = open(self.idx_path, "rb")
+            except FileNotFoundError:
+                return
+
+            if self.use_mmap:
+                self.idx_map, self.idx_view = _map_file(self.f_idx)
+
+            if self.fanout:
+                # Header already parsed; only the handle had been closed.
+                return
+
+            header = self._idx_data(0, 8 + 256 * 4)
+            if header[:4] != b'\377tOc':
+                raise Exception("Not a git index file")
+
+            version = struct.unpack_from(">I", header, 4)[0]
+            if version != 2:
+                raise Exception(f"Unsupported index version {version}")
+
+            # fanout[i] = number of object SHAs whose first byte ≤ i
+            self.fanout = list(struct.unpack_from(">256I", header, 8))
+
+            self.total_objects = self.fanout[255]
+            self.sha_offset = 4 + 4 + (256 * 4)
+
+    def load_pack(self):
+        with self._lock:
+            if self.f_pack:
+                return
+
+            self.f_pack = open(self.pack_path, "rb")
+            if self.use_mmap:
+                self.pack_map, self.pack_view = _map_file(self.f_pack)
+
+    def close(self):
+        """Release open file handles and mappings. The parsed fanout table is kept."""
+        with self._lock:
+            self.idx_map, self.idx_view = _unmap(self.idx_map, self.idx_view)
+            self.pack_map, self.pack_view = _unmap(self.pack_map, self.pack_view)
+            if self.f_idx:
+                self.f_idx.close()
+                self.f_idx = None
+            if self.f_pack:
+                self.f_pack.close()
+                self.f_pack = None
+
+    def _idx_data(self, pos, size):
+        with self._lock:
+            self.load_index()
+            if self.idx_view is not None:
+                return self.idx_view[pos:pos+size]
+            self.f_idx.seek(pos)
+            return self.f_idx.read(size)
+
+    def _pack_data(self, pos, size):
+        # Reopens the pack if another thread closed it in the middle of a read
+        with self._lock:
+            self.load_pack()
+            if self.pack_view is not None:
+                return self.pack_view[pos:pos+size]
+            self.f_pack.seek(pos)
+            return self.f_pack.read(size)
  
     def find_offset(self, sha_hex):
-        self.load_index()
-        if not self.f_idx:
+        try:
+            sha_bytes = bytes.fromhex(sha_hex)
+        except ValueError:
+            return None
+        if len(sha_bytes) != 20:
             return None
-            
-        sha_bytes = bytes.fromhex(sha_hex)
         first_byte = sha_bytes[0]
-        
-        start = 0 if first_byte == 0 else self.fanout[first_byte - 1]
-        end = self.fanout[first_byte]
-        
-        if start == end:
+
+        # Held for the whole search, so another thread cannot close the
+        # index (e.g. the registry's LRU) between two reads of it
+        with self._lock:
+            self.load_index()
+            if not self.f_idx:
+                return None
+
+            start = 0 if first_byte == 0 else self.fanout[first_byte - 1]
+            end = self.fanout[first_byte]
+
+            lo = start
+            hi = end
+
+            while lo < hi:
+                mid = (lo + hi) // 2
+                pos = self.sha_offset + (mid * 20)
+                if self.idx_map is not None:
+                    data = self.idx_map[pos:pos+20]
+                else:
+                    data = self._idx_data(pos, 20)
+
+                if data < sha_bytes:
+                    lo = mid + 1
+                elif data > sha_bytes:
+                    hi = mid
+                else:
+                    return self.get_offset_by_index(mid)
+
             return None
-            
-        lo = start
-        hi = end
-        
-        while lo < hi:
-            mid = (lo + hi) // 2
-            self.f_idx.seek(self.sha_offset + (mid * 20))
-            data = self.f_idx.read(20)
-            
-            if data < sha_bytes:
-                lo = mid + 1
-            elif data > sha_bytes:
-                hi = mid
-            else:
-                return self.get_offset_by_index(mid)
-                
-        return None
  
     def get_offset_by_index(self, idx):
         offset_table_start = self.sha_offset + (self.total_objects * 20) # Skip the SHA table
         offset_table_start += (self.total_objects * 4)  # Skip the CRC32 table
         
-        self.f_idx.seek(offset_table_start + (idx * 4)) # Inside the small offset table
-        offset = struct.unpack(">I", self.f_idx.read(4))[0]
+        # Inside the small offset table
+        offset = struct.unpack(">I", self._idx_data(offset_table_start + (idx * 4), 4))[0]
         
         if offset & 0x80000000:
             large_offset_idx = offset & 0x7FFFFFFF
             large_offset_start = offset_table_start + (self.total_objects * 4)
-            self.f_idx.seek(large_offset_start + (large_offset_idx * 8))
-            offset = struct.unpack(">Q", self.f_idx.read(8))[0]
+            offset = struct.unpack(">Q", self._idx_data(large_offset_start + (large_offset_idx * 8), 8))[0]
             
         return offset
 
@@ -102,71 +174,256 @@ class GitPack:
         if type_num == OBJ_TAG: return GitTag(data)
         return None
 
-    def get_raw_object(self, offset):
-        if not self.f_pack:
-            self.f_pack = open(self.pack_path, "rb")
-        
-        self.f_pack.seek(offset)
-        
-        byte = ord(self.f_pack.read(1))         # bit 7        bit 4–6       bit 0–3
+    def read_entry_header(self, offset):
+        """Parse the entry header at `offset`.
+
+        Returns (type_num, size, header, pos) where `header` holds the raw bytes
+        starting at `offset` and `pos` is the index just past the type/size field.
+        """
+        self.load_pack()
+
+        # Longest possible entry header: 10 bytes of type/size plus a 20 byte base SHA
+        header = self._pack_data(offset, 32)
+
+        byte = header[0]                        # bit 7        bit 4–6       bit 0–3
         type_num = (byte >> 4) & 7              # +-----------+-------------+-----------+
         size = byte & 15                        # | continue? |  type (3)   | size (4)  |
         shift = 4                               # +-----------+-------------+-----------+
+        pos = 1
         
         while byte & 128:                       # bit 7        bit 0–6
-            byte = ord(self.f_pack.read(1))     # +-----------+-----------+
-            size += (byte & 127) << shift       # | continue? | size bits |
-            shift += 7                          # +-----------+-----------+
-            
-        if type_num in [OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG]:
-            data = self.read_compressed_data()
-            return type_num, data
-        elif type_num == OBJ_OFS_DELTA:
-            return self.read_ofs_delta(offset)
-        elif type_num == OBJ_REF_DELTA:
-            return self.read_ref_delta()
-        else:
-            raise Exception(f"Unknown type {type_num}")
-
-    def read_compressed_data(self):
-        dobj = zlib.decompressobj() # streaming de-compression
-        data = b""
+            byte = header[pos]                  # +-----------+-----------+
+            pos += 1                            # | continue? | size bits |
+            size += (byte & 127) << shift       # +-----------+-----------+
+            shift += 7
+
+        return type_num, size, header, pos
+
+    def open_stream(self, offset):
+        """Stream a whole (non-delta) entry without inflating it up front.
+
+        Returns (type_num, size, read_input) where read_input(n) returns the next
+        n bytes of the entry's zlib stream, or None if the entry is a delta.
+        """
+        type_num, size, header, pos = self.read_entry_header(offset)
+        if type_num not in [OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG]:
+            return None
+
+        pos += offset
+
+        def read_input(n):
+            nonlocal pos
+            self.load_pack()
+            data = self._pack_data(pos, n)
+            pos += len(data)
+            return data
+
+        return type_num, size, read_input
+
+    def get_raw_object(self, offset):
+        # Walk down the delta chain iteratively until we reach a whole object
+        # (or a cached base), then apply the deltas back up.
+        chain = []
         while True:
-            chunk = self.f_pack.read(4096)
-            if not chunk: break
-            data += dobj.decompress(chunk)
-            if dobj.eof:
+            cached = self.delta_cache.get((self.pack_path, offset))
+            if cached is not None:
+                base_type, base_data = cached
                 break
-        return data
-
-    def read_ofs_delta(self, current_offset):
-        # Decode OFS_DELTA backward offset.
-        # Encoding follows Git pack-file specification:
-        # continuation bytes add a bias (+1) before shifting.
-        byte = ord(self.f_pack.read(1))
-        offset = byte & 127
-        while byte & 128:
-            byte = ord(self.f_pack.read(1))
-            offset += 1
-            offset <<= 7
-            offset += (byte & 127)
-            
-        delta_data = self.read_compressed_data()
-        
-        base_offset = current_offset - offset
-        base_type, base_data = self.get_raw_object(base_offset)
+
+            type_num, size, header, pos = self.read_entry_header(offset)
+
+            if type_num in [OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG]:
+                base_type, base_data = type_num, self.read_compressed_data(offset + pos, size)
+                if chain:
+                    self.delta_cache.put((self.pack_path, offset), base_type, base_data)
+                break
+            elif type_num == OBJ_OFS_DELTA:
+                base_offset, delta_data = self.read_ofs_delta(offset, header, pos, size)
+                chain.append((offset, delta_data))
+                offset = base_offset
+            elif type_num == OBJ_REF_DELTA:
+                base_sha, delta_data = self.read_ref_delta(offset, header, pos, size)
+                chain.append((offset, delta_data))
+
+                base_offset = self.find_offset(base_sha)
+                if base_offset is not None:
+                    offset = base_offset
+                    continue
+
+                # Base lives outside this pack
+                if not self.resolve_base_fn:
+                    raise Exception("Cannot resolve REF_DELTA without resolver function")
+
+                base_type, base_data = self.resolve_base_fn(base_sha)
+                if base_type is None:
+                    raise Exception(f"Base object {base_sha} not found for REF_DELTA")
+                break
+            else:
+                raise Exception(f"Unknown type {type_num}")
+
+        for i in range(len(chain) - 1, -1, -1):
+            offset, delta_data = chain[i]
+            base_data = patch_delta(base_data, delta_data)
+            if i:
+                # Intermediate results are bases for the next link
+                self.delta_cache.put((self.pack_path, offset), base_type, base_data)
+
+        if base_type != OBJ_BLOB:
+            # Commits, trees and tags are parsed into dict keys and must be hashable
+            base_data = bytes(base_data)
+        # A blob is returned as inflated, without a copy; the caches keep
+        # their own immutable copy of anything they hold
+        return base_type, base_data
+
+    def object_info(self, offset):
+        """(type_num, size) of the object at `offset`, reading entry headers only.
+
+        For a delta the size is the target size at the start of the delta, so
+        only its first bytes are inflated, and the type is that of the whole
+        object at the end of the chain; nothing is patched.
+        """
+        size = None
+        while True:
+            type_num, entry_size, header, pos = self.read_entry_header(offset)
+
+            if type_num in [OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG]:
+                return type_num, entry_size if size is None else size
+            elif type_num == OBJ_OFS_DELTA:
+                distance, pos = _decode_ofs_distance(header, pos)
+                base_sha = None
+                base_offset = offset - distance
+            elif type_num == OBJ_REF_DELTA:
+                base_sha = bytes(header[pos:pos+20]).hex()
+                pos += 20
+                base_offset = self.find_offset(base_sha)
+            else:
+                raise Exception(f"Unknown type {type_num}")
+
+            if size is None:
+                size = self.read_delta_target_size(offset + pos)
+
+            if base_offset is None:
+                # Base lives outside this pack; only its type is needed
+                if not self.resolve_base_fn:
+                    raise Exception("Cannot resolve REF_DELTA without resolver function")
+                base_type, _ = self.resolve_base_fn(base_sha)
+                if base_type is None:
+                    raise Exception(f"Base object {base_sha} not found for REF_DELTA")
+                return base_type, size
+            offset = base_offset
+
+    def read_delta_target_size(self, pos):
+        """Target size of the delta whose zlib stream starts at `pos`.
+
+        The source and target sizes open the delta, so at most 20 bytes of it
+        are inflated.
+        """
+        dobj = zlib.decompressobj()
+        start = b""
+        while len(start) < 20 and not dobj.eof:
+            chunk = self._pack_data(pos, 64)
+            if not chunk:
+                raise Exception("Truncated object in pack file")
+            pos += len(chunk)
+            start += dobj.decompress(chunk, 20 - len(start))
+
+        _, i = decode_varint(start)
+        size, _ = decode_varint(start, i)
+        return size
+
+    def read_compressed_data(self, pos, size):
+        """Inflate the zlib stream at `pos` whose inflated length is `size`.
+
+        The output buffer is allocated once from the size in the entry header and
+        filled in bounded pieces; input is consumed only up to the end of the stream.
+        """
+        out = bytearray(size)
+        view = memoryview(out)
+        filled = 0
+
+        dobj = zlib.decompressobj() # streaming de-compression
+        chunk = self._pack_data(pos, min(INFLATE_CHUNK, size + 32))
+        pos += len(chunk)
+
+        while not dobj.eof:
+            if not chunk:
+                chunk = self._pack_data(pos, INFLATE_CHUNK)
+                if not chunk:
+                    raise Exception("Truncated object in pack file")
+                pos += len(chunk)
+
+            # max_length must stay positive so the end of the stream is still read
+            piece = dobj.decompress(chunk, min(size - filled, INFLATE_PIECE) or 1)
+            chunk = dobj.unconsumed_tail
+
+            if filled + len(piece) > size:
+                raise Exception("Object in pack file is larger than its header")
+            view[filled:filled+len(piece)] = piece
+            filled += len(piece)
+
+        view.release()
+        if filled != size:
+            raise Exception("Object in pack file is smaller than its header")
+        return out
+
+    def delta_base_offset(self, offset):
+        """Offset of the delta base of the entry at `offset`, read from its
+        header alone. None if it is not a delta or its base is in another pack."""
+        type_num, _, header, pos = self.read_entry_header(offset)
+        if type_num == OBJ_OFS_DELTA:
+            distance, _ = _decode_ofs_distance(header, pos)
+            return offset - distance
+        if type_num == OBJ_REF_DELTA:
+            return self.find_offset(bytes(header[pos:pos+20]).hex())
+        return None
+
+    def read_ofs_delta(self, current_offset, header, pos, size):
+        """Return (base_offset, delta_data) for the OFS_DELTA entry at `current_offset`."""
+        offset, pos = _decode_ofs_distance(header, pos)
+        delta_data = self.read_compressed_data(current_offset + pos, size)
         
-        return base_type, patch_delta(base_data, delta_data)
+        return current_offset - offset, delta_data
 
-    def read_ref_delta(self):
-        base_sha = self.f_pack.read(20).hex()
-        delta_data = self.read_compressed_data()
+    def read_ref_delta(self, current_offset, header, pos, size):
+        """Return (base_sha, delta_data) for the REF_DELTA entry at `current_offset`."""
+        base_sha = bytes(header[pos:pos+20]).hex()
+        delta_data = self.read_compressed_data(current_offset + pos + 20, size)
         
-        if not self.resolve_base_fn:
-             raise Exception("Cannot resolve REF_DELTA without resolver function")
-             
-        base_type, base_data = self.resolve_base_fn(base_sha)
-        if base_type is None:
-             raise Exception(f"Base object {base_sha} not found for REF_DELTA")
-             
-        return base_type, patch_delta(base_data, delta_data)
\ No newline at end of file
+        return base_sha, delta_data
+
+def _decode_ofs_distance(header, pos):
+    """Decode the OFS_DELTA backward offset at header[pos]. Returns (distance, pos after it)."""
+    # Encoding follows Git pack-file specification:
+    # continuation bytes add a bias (+1) before shifting.
+    byte = header[pos]
+    pos += 1
+    offset = byte & 127
+    while byte & 128:
+        byte = header[pos]
+        pos += 1
+        offset += 1
+        offset <<= 7
+        offset += (byte & 127)
+    return offset, pos
+
+
+def _map_file(f):
+    """Map an open file read-only. Returns (None, None) if it cannot be mapped."""
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # Empty files cannot be mapped; fall back to seek()/read()
+        return None, None
+    return mapped, memoryview(mapped)
+
+
+def _unmap(mapped, view):
+    if view is not None:
+        view.release()
+    if mapped is not None:
+        try:
+            mapped.close()
+        except BufferError:
+            # A slice is still referenced somewhere; the mapping is freed with it
+            pass
+    return None, None
@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+from .cache import DeltaBaseCache, DEFAULT_DELTA_BASE_CACHE_LIMIT
+from .packfile import GitPack
+
+
+class PackRegistry:
+    """Keeps one GitPack per .idx in a repository's objects/pack directory.
+
+    Indexes are loaded once and reused across lookups. Packs are searched in
+    most-recently-hit order, and at most `max_open` packs keep file handles
+    open at a time (least recently used ones are closed first). The directory
+    is only rescanned when its mtime changes. All packs share one delta base
+    cache. Lookups may come from several threads at once.
+    """
+
+    def __init__(self, pack_dir, resolve_base_fn=None, max_open=32,
+                 delta_cache_limit=DEFAULT_DELTA_BASE_CACHE_LIMIT):
+        self.pack_dir = pack_dir
+        self.resolve_base_fn = resolve_base_fn
+        self.max_open = max_open
+        self.delta_cache = DeltaBaseCache(delta_cache_limit)
+        self.packs = []
+        self._open = OrderedDict()
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def refresh(self, force=False):
+        with self._lock:
+            try:
+                mtime = os.stat(self.pack_dir).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+
+            if mtime == self._mtime and not force:
+                return
+            self._mtime = mtime
+
+            on_disk = set(self.pack_dir.glob("*.idx")) if mtime is not None else set()
+
+            # Keep the hit order of packs we already know, newly found packs go first
+            packs = []
+            for pack in self.packs:
+                if pack.idx_path in on_disk:
+                    packs.append(pack)
+                    on_disk.discard(pack.idx_path)
+                else:
+                    self._release(pack)
+
+            new_packs = [
+                GitPack(idx, resolve_base_fn=self.resolve_base_fn, delta_cache=self.delta_cache)
+                for idx in sorted(on_disk)
+            ]
+            self.packs = new_packs + packs
+
+    def find(self, sha):
+        """Return (pack, offset) for the object, or None if no pack has it."""
+        with self._lock:
+            self.refresh()
+
+            for i, pack in enumerate(self.packs):
+                offset = pack.find_offset(sha)
+                self._touch(pack)
+                if offset is not None:
+                    if i:
+                        # Move to the front: the next lookup is likely in the same pack
+                        del self.packs[i]
+                        self.packs.insert(0, pack)
+                    return pack, offset
+
+            return None
+
+    def read_raw(self, sha):
+        found = self.find(sha)
+        if found is None:
+            return None, None
+        pack, offset = found
+        # Inflating is done outside the lock
+        type_num, data = pack.get_raw_object(offset)
+        with self._lock:
+            self._touch(pack)
+        return type_num, data
+
+    def close(self):
+        with self._lock:
+            for pack in list(self._open):
+                self._release(pack)
+
+    def _touch(self, pack):
+        self._open[pack] = None
+        self._open.move_to_end(pack)
+
+        while len(self._open) > self.max_open:
+            # A thread still reading from it reopens it
+            oldest, _ = self._open.popitem(last=False)
+            oldest.close()
+
+    def _release(self, pack):
+        self._open.pop(pack, None)
+        pack.close()
+        self.delta_cache.discard_pack(pack.pack_path)
@@ -3,4 +3,11 @@ OBJ_TREE = 2
 OBJ_BLOB = 3
 OBJ_TAG = 4
 OBJ_OFS_DELTA = 6
-OBJ_REF_DELTA = 7
\ No newline at end of file
+OBJ_REF_DELTA = 7
+TYPE_NAMES = {
+    OBJ_COMMIT: b'commit',
+    OBJ_TREE: b'tree',
+    OBJ_BLOB: b'blob',
+    OBJ_TAG: b'tag',
+}
+TYPE_NUMS = {name: num for num, name in TYPE_NAMES.items()}
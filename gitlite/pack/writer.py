@@ -0,0 +1,168 @@
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from .types import OBJ_OFS_DELTA, TYPE_NAMES
+
+
+def encode_entry_header(type_num, size):
+    """Pack entry header: 3-bit type and the inflated size as a little-endian varint."""
+    byte = (type_num << 4) | (size & 15)
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 127
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+
+def encode_ofs_delta_offset(distance):
+    """Inverse of the OFS_DELTA offset decoding in GitPack.read_ofs_delta."""
+    out = bytearray([distance & 127])
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.insert(0, 0x80 | (distance & 127))
+        distance >>= 7
+    return bytes(out)
+
+
+def object_sha(type_num, data):
+    header = TYPE_NAMES[type_num] + b' ' + str(len(data)).encode() + b'\x00'
+    sha1 = hashlib.sha1(header)
+    sha1.update(data)
+    return sha1.hexdigest()
+
+
+class PackWriter:
+    """Append objects to a new version 2 pack and write its .idx on finish().
+
+    Entries are streamed to a temporary file in `pack_dir`. finish() fixes up
+    the object count in the header, appends the trailing checksum, writes the
+    index and renames both to pack-<checksum>.{pack,idx}.
+    """
+
+    def __init__(self, pack_dir, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.pack_dir = Path(pack_dir)
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        self.level = level
+
+        fd, self.tmp_path = tempfile.mkstemp(prefix="tmp_pack_", dir=self.pack_dir)
+        self.f = os.fdopen(fd, "w+b")
+        # The object count is patched in by finish()
+        self.f.write(b'PACK' + struct.pack(">II", 2, 0))
+        self.offset = 12
+
+        self.entries = {}   # sha (hex) -> (offset, crc32)
+
+    def __contains__(self, sha):
+        return sha in self.entries
+
+    def add(self, type_num, data, sha=None):
+        """Write a whole object. Returns its SHA-1 (hex)."""
+        if sha is None:
+            sha = object_sha(type_num, data)
+        if sha in self.entries:
+            return sha
+
+        self._write_entry(sha, encode_entry_header(type_num, len(data)), data)
+        return sha
+
+    def add_ofs_delta(self, sha, base_sha, delta):
+        """Write `sha` as a delta against `base_sha`, which must already be in this pack."""
+        if sha in self.entries:
+            return sha
+
+        base_offset, _ = self.entries[base_sha]
+        header = encode_entry_header(OBJ_OFS_DELTA, len(delta)) + encode_ofs_delta_offset(self.offset - base_offset)
+        self._write_entry(sha, header, delta)
+        return sha
+
+    def _write_entry(self, sha, header, data):
+        entry = header + zlib.compress(data, self.level)
+        self.f.write(entry)
+        self.entries[sha] = (self.offset, zlib.crc32(entry))
+        self.offset += len(entry)
+
+    def finish(self):
+        """Complete the pack. Returns the path of the .pack, or None if it is empty."""
+        if not self.entries:
+            self.abort()
+            return None
+
+        self.f.seek(8)
+        self.f.write(struct.pack(">I", len(self.entries)))
+
+        # The header changed, so hash the whole file again
+        self.f.seek(0)
+        sha1 = hashlib.sha1()
+        while True:
+            chunk = self.f.read(1024 * 1024)
+            if not chunk:
+                break
+            sha1.update(chunk)
+        checksum = sha1.digest()
+        self.f.seek(0, os.SEEK_END)
+        self.f.write(checksum)
+        self.f.close()
+
+        name = f"pack-{checksum.hex()}"
+        pack_path = self.pack_dir / f"{name}.pack"
+        idx_path = self.pack_dir / f"{name}.idx"
+
+        os.replace(self.tmp_path, pack_path)
+        # The .idx goes in last: readers discover packs through it
+        write_pack_index(idx_path, self.entries, checksum)
+        return pack_path
+
+    def abort(self):
+        if not self.f.closed:
+            self.f.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+def write_pack_index(idx_path, entries, pack_checksum):
+    """Write a version 2 .idx for {sha_hex: (offset, crc32)}."""
+    shas = sorted(entries)
+    raw_shas = [bytes.fromhex(s) for s in shas]
+
+    fanout = [0] * 256
+    for raw in raw_shas:
+        fanout[raw[0]] += 1
+    total = 0
+    for i in range(256):
+        total += fanout[i]
+        fanout[i] = total
+
+    small_offsets = []
+    large_offsets = []
+    for sha in shas:
+        offset = entries[sha][0]
+        if offset < 0x80000000:
+            small_offsets.append(offset)
+        else:
+            # MSB set: index into the table of 8-byte offsets
+            small_offsets.append(0x80000000 | len(large_offsets))
+            large_offsets.append(offset)
+
+    data = b"".join([
+        b'\377tOc',
+        struct.pack(">I", 2),
+        struct.pack(">256I", *fanout),
+        b"".join(raw_shas),
+        struct.pack(f">{len(shas)}I", *(entries[s][1] for s in shas)),
+        struct.pack(f">{len(shas)}I", *small_offsets),
+        struct.pack(f">{len(large_offsets)}Q", *large_offsets),
+        pack_checksum,
+    ])
+    data += hashlib.sha1(data).digest()
+
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_idx_", dir=Path(idx_path).parent)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, idx_path)
@@ -1,10 +1,19 @@
 from pathlib import Path
+from .pack.registry import PackRegistry
+from .storage import object_read_raw, DEFAULT_LOOSE_COMPRESSION
+from .config import get_config_int, get_compression_level
+from .pack.cache import DEFAULT_DELTA_BASE_CACHE_LIMIT
+from .cache import ObjectCache, DEFAULT_OBJECT_CACHE_SIZE, DEFAULT_BLOB_CACHE_SIZE
 
 class GitRepository:
 
     def __init__(self, path: Path, force: bool = False):
         self.worktree = path
         self.gitdir = path / ".git"
+        self._packs = None
+        self._object_cache = None
+        self._loose_compression = None
+        self._commit_graph = None
  
         if not force and not self.gitdir.is_dir():
             raise Exception(f"Not a Git repository {path}")
@@ -23,6 +32,52 @@ class GitRepository:
  
         return self
 
+    @property
+    def packs(self):
+        """Pack registry for this repository, created on first use."""
+        if self._packs is None:
+            self._packs = PackRegistry(
+                self.gitdir / "objects" / "pack",
+                resolve_base_fn=lambda s: object_read_raw(self, s),
+                delta_cache_limit=get_config_int(
+                    self, "core.deltaBaseCacheLimit", DEFAULT_DELTA_BASE_CACHE_LIMIT
+                )
+            )
+        return self._packs
+
+    @property
+    def object_cache(self):
+        """Cache of objects read from this repository, created on first use."""
+        if self._object_cache is None:
+            self._object_cache = ObjectCache(
+                get_config_int(self, "core.objectCacheSize", DEFAULT_OBJECT_CACHE_SIZE),
+                get_config_int(self, "core.blobCacheSize", DEFAULT_BLOB_CACHE_SIZE)
+            )
+        return self._object_cache
+
+    @property
+    def loose_compression(self):
+        """zlib level for new loose objects, read from the config once."""
+        if self._loose_compression is None:
+            self._loose_compression = get_compression_level(
+                self, "core.looseCompression", DEFAULT_LOOSE_COMPRESSION
+            )
+        return self._loose_compression
+
+    @property
+    def commit_graph(self):
+        """The parsed objects/info/commit-graph, or None if there is none."""
+        if self._commit_graph is None:
+            from .commitgraph import load_commit_graph
+            self._commit_graph = load_commit_graph(self) or False
+        return self._commit_graph or None
+
+    def close_commit_graph(self):
+        """Drop the loaded commit-graph, e.g. before it is rewritten."""
+        if self._commit_graph:
+            self._commit_graph.close()
+        self._commit_graph = None
+
 def repo_find(path: Path = Path("."), required: bool = True):
     path = path.resolve()
     if (path / ".git").is_dir():
@@ -35,6 +90,22 @@ def repo_find(path: Path = Path("."), required: bool = True):
         return None
     return repo_find(parent, required)
 
+def check_refname_format(name):
+    """Whether `name` is a valid ref name, by the rules of git's check-ref-format:
+    no empty, '.'-prefixed or '.lock'-suffixed components, no '..', '@{',
+    control characters, spaces or any of ~^:?*[\\, and no leading, trailing
+    or doubled '/' or trailing '.'."""
+    if not name or name == "@" or name.endswith("."):
+        return False
+    if ".." in name or "@{" in name:
+        return False
+    if any(c < " " or c == "\x7f" or c in " ~^:?*[\\" for c in name):
+        return False
+    for part in name.split("/"):
+        if not part or part.startswith(".") or part.endswith(".lock"):
+            return False
+    return True
+
 def resolve_ref(repo, ref, depth=0):
     """Resolves a reference (HEAD, branch, or SHA) to a SHA-1 hash."""
     if depth > 10:
@@ -71,4 +142,28 @@ def resolve_ref(repo, ref, depth=0):
     if data.startswith("ref: "):
         return resolve_ref(repo, data[5:], depth + 1)
 
-    return data
\ No newline at end of file
+    return data
+
+def list_refs(repo):
+    """Return {refname: sha} for every ref under refs/, including packed-refs."""
+    refs = {}
+
+    packed = repo.gitdir / "packed-refs"
+    if packed.is_file():
+        with open(packed, "r") as f:
+            for line in f:
+                line = line.strip()
+                # '#' starts the header, '^' lines hold peeled tag targets
+                if not line or line.startswith("#") or line.startswith("^"):
+                    continue
+                sha, name = line.split(" ", 1)
+                refs[name] = sha
+
+    refs_dir = repo.gitdir / "refs"
+    if refs_dir.is_dir():
+        for path in sorted(refs_dir.rglob("*")):
+            if path.is_file():
+                name = path.relative_to(repo.gitdir).as_posix()
+                refs[name] = resolve_ref(repo, name)
+
+    return refs
\ No newline at end of file
@@ -0,0 +1,107 @@
+import heapq
+from .storage import object_read_raw
+from .commitgraph import commit_info
+from .objects.tree import iter_tree
+from .pack.types import OBJ_TREE
+
+
+class RevWalk:
+    """Walk history newest first, yielding commits as soon as they are known.
+
+    A heap ordered by committer date (then generation number, which the
+    commit-graph provides) holds the frontier, so only as much history is
+    visited as the caller consumes: `log -n 20` touches roughly 20 commits
+    however long the history is.
+
+    `paths` limits the walk to commits that change something below one of
+    the given paths, with git's default history simplification: a merge
+    that matches one of its parents at those paths is skipped and only that
+    parent is followed.
+    """
+
+    def __init__(self, repo, starts, max_count=None, since=None, until=None,
+                 first_parent=False, paths=None):
+        self.repo = repo
+        self.max_count = max_count
+        self.since = since
+        self.until = until
+        self.first_parent = first_parent
+        self.paths = [p.strip("/").split("/") for p in paths or [] if p.strip("/")]
+        self._trees = {}
+
+        self._seen = set()
+        self._queue = []
+        self._counter = 0
+        for sha in starts:
+            info = commit_info(repo, sha)
+            if info is None:
+                raise ValueError(f"bad object {sha}")
+            self._push(info)
+
+    def _push(self, info):
+        if info.sha in self._seen:
+            return
+        self._seen.add(info.sha)
+        # Equal keys come out in the order they went in, as in git
+        self._counter += 1
+        heapq.heappush(self._queue, (-info.date, -info.generation, self._counter, info))
+
+    def __iter__(self):
+        shown = 0
+        while self._queue and (self.max_count is None or shown < self.max_count):
+            info = heapq.heappop(self._queue)[3]
+            if self.since is not None and info.date < self.since:
+                # Everything still queued is older
+                break
+
+            parents = info.parents[:1] if self.first_parent else info.parents
+            show = True
+            if self.paths:
+                show, parents = self._simplify(info, parents)
+
+            for parent in parents:
+                if parent not in self._seen:
+                    parent_info = commit_info(self.repo, parent)
+                    if parent_info is not None:
+                        self._push(parent_info)
+
+            if not show or (self.until is not None and info.date > self.until):
+                continue
+            shown += 1
+            yield info
+
+    def _simplify(self, info, parents):
+        """Decide whether `info` touches the limited paths; returns (show, parents to follow)."""
+        mine = self._path_shas(info.tree)
+        if not parents:
+            return any(sha is not None for sha in mine), parents
+
+        for parent in parents:
+            parent_info = commit_info(self.repo, parent)
+            if parent_info is not None and self._path_shas(parent_info.tree) == mine:
+                # Same as this parent: nothing to show, and its history explains ours
+                return False, [parent]
+        return True, parents
+
+    def _path_shas(self, tree_sha):
+        return [self._lookup(tree_sha, parts) for parts in self.paths]
+
+    def _lookup(self, tree_sha, parts):
+        sha = tree_sha
+        for name in parts:
+            entries = self._tree_entries(sha)
+            if entries is None:
+                return None
+            sha = entries.get(name.encode())
+            if sha is None:
+                return None
+        return sha
+
+    def _tree_entries(self, sha):
+        if sha not in self._trees:
+            type_num, data = object_read_raw(self.repo, sha)
+            if type_num != OBJ_TREE:
+                self._trees[sha] = None
+            else:
+                self._trees[sha] = {item.path: item.sha for item in iter_tree(data)}
+        return self._trees[sha]
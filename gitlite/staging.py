@@ -1,9 +1,12 @@
 import os
 import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from .objects.blob import GitBlob
-from .objects.tree import GitTree
-from .storage import object_write
+from .objects.tree import GitTree, TreeEntry, tree_entry_key
+from .storage import object_read, object_write, object_hash_file
+from .config import get_config_int
+from .index import CacheTree, GitIndex, GitIndexEntry, index_path, read_index, write_index
+from .repo import resolve_ref
 
 def read_gitignore(path):
     rules = []
@@ -28,48 +31,244 @@ def is_ignored(path, rules):
                  return True
     return False
  
-def write_tree_recursive(repo, path, rules=None):
+def iter_worktree_files(repo, path=None, rules=None):
+    """Yield (rel_path, full_path, stat) for every file under `path` that is not ignored."""
     if rules is None:
         rules = read_gitignore(repo.worktree)
         # Always ignore .git
         rules.append(".git")
- 
-    items = []
-    
-    # Iterate over directory entries. Sorted order ensures deterministic Tree SHAs.
+    if path is None:
+        path = repo.worktree
+
+    # Sorted order keeps the walk deterministic
     entries = sorted(os.scandir(path), key=lambda e: e.name)
-    
+
     for entry in entries:
         full_path = Path(entry.path)
-        
+
         if is_ignored(full_path, rules):
             continue
-            
+
         if entry.is_file():
-            with open(full_path, 'rb') as f:
-                data = f.read()
-            blob = GitBlob(data)
-            sha = object_write(blob, repo)
-            
+            yield full_path.relative_to(repo.worktree).as_posix(), full_path, entry.stat()
+        elif entry.is_dir():
+            yield from iter_worktree_files(repo, full_path, rules)
+
+def stage_files(repo, index, files, threads=None):
+    """Update the index entries of (rel_path, full_path, stat) files.
+
+    Only files whose stat data changed are hashed. With more than one thread
+    (core.threads, defaulting to the CPU count) the reading, hashing and
+    loose-object writing is spread over a thread pool; hashlib and zlib
+    release the GIL on large buffers. Results are applied in input order, so
+    the index and the trees built from it do not depend on scheduling.
+    """
+    to_hash = []
+    for rel_path, full_path, st in files:
+        entry = index.entries.get(rel_path)
+        if entry is None or not index.is_clean(entry, st):
+            to_hash.append((rel_path, full_path, st))
+
+    if threads is None:
+        threads = get_config_int(repo, "core.threads", os.cpu_count() or 1)
+
+    if threads > 1 and len(to_hash) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            shas = list(pool.map(lambda f: object_hash_file(f[1], repo), to_hash))
+    else:
+        shas = [object_hash_file(full_path, repo) for _, full_path, _ in to_hash]
+
+    for (rel_path, _, st), sha in zip(to_hash, shas):
+        entry = index.entries.get(rel_path)
+        if entry is None:
             # Mode: 100644 (regular)
             # On Windows, os.access(X_OK) often returns true for everything or relies on file extensions (.exe),
             # making it unreliable for mimicking Git's exact behavior without complex logic.
-            mode = b'100644'
-            
-            items.append({
-                'mode': mode,
-                'path': entry.name.encode(),
-                'sha': sha
-            })
-            
-        elif entry.is_dir():
-            sha = write_tree_recursive(repo, full_path, rules)
-            items.append({
-                'mode': b'40000', 
-                'path': entry.name.encode(),
-                'sha': sha
-            })
-            
+            entry = GitIndexEntry(rel_path, sha, 0o100644)
+            index.add(entry)
+        elif entry.sha != sha:
+            entry.sha = sha
+            index.invalidate(rel_path)
+        entry.update_stat(st)
+
+def add_paths(repo, index, paths):
+    """Stage files and directories. Tracked paths that no longer exist are unstaged."""
+    rules = read_gitignore(repo.worktree)
+    rules.append(".git")
+
+    files = []
+    for path in paths:
+        rel = path.relative_to(repo.worktree).as_posix()
+        prefix = "" if rel == "." else rel + "/"
+
+        if path.is_file():
+            if not is_ignored(path, rules):
+                files.append((rel, path, path.stat()))
+        elif path.is_dir():
+            seen = set()
+            for rel_path, full_path, st in iter_worktree_files(repo, path, rules):
+                files.append((rel_path, full_path, st))
+                seen.add(rel_path)
+
+            for tracked in list(index.entries):
+                if tracked.startswith(prefix) and tracked not in seen:
+                    index.remove(tracked)
+        else:
+            removed = [p for p in index.entries if p == rel or p.startswith(prefix)]
+            if not removed:
+                raise ValueError(f"pathspec '{rel}' did not match any files")
+            for tracked in removed:
+                index.remove(tracked)
+
+    stage_files(repo, index, files)
+
+def write_tree_from_index(repo, index):
+    """Write tree objects for the staged entries and return the root tree SHA.
+
+    Directories whose cached tree (index.cache_tree) is still valid are not
+    rebuilt, so only trees on the path of a changed entry are written.
+    """
+    root = {}
+    for entry in index.sorted_entries():
+        *dirs, name = entry.path.split("/")
+        node = root
+        for d in dirs:
+            node = node.setdefault(d, {})
+        node[name] = entry
+
+    sha, _ = _write_tree_node(repo, root, index.cache_tree)
+    return sha
+
+def _write_tree_node(repo, node, cache):
+    if cache.is_valid():
+        return cache.sha, cache.entry_count
+
+    items = []
+    children = {}
+    entry_count = 0
+    for name, child in node.items():
+        if isinstance(child, dict):
+            child_cache = cache.children.get(name) or CacheTree()
+            sha, count = _write_tree_node(repo, child, child_cache)
+            children[name] = child_cache
+            entry_count += count
+            items.append(TreeEntry(b'40000', name.encode(), sha))
+        else:
+            entry_count += 1
+            items.append(TreeEntry(b'%o' % child.mode, name.encode(), child.sha))
+
     tree = GitTree()
-    tree.items = items
-    return object_write(tree, repo)
\ No newline at end of file
+    tree.items = sorted(items, key=tree_entry_key)
+
+    cache.children = children
+    cache.sha = object_write(tree, repo)
+    cache.entry_count = entry_count
+    return cache.sha, entry_count
+
+def update_tracked(repo, index):
+    """Re-stage tracked files that changed and unstage the ones that are gone
+    (what 'git commit -a' does first). Untracked files are left alone."""
+    files = []
+    for rel_path, entry in list(index.entries.items()):
+        if entry.mode & 0o170000 == 0o160000:
+            continue
+        full_path = repo.worktree / rel_path
+        try:
+            st = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            index.remove(rel_path)
+            continue
+        files.append((rel_path, full_path, st))
+    stage_files(repo, index, files)
+
+def refresh_index(index, worktree):
+    """Record fresh stat data for files whose content still matches their entry,
+    so later commands recognise them without hashing. Nothing is staged.
+    Returns True if any entry was refreshed."""
+    refreshed = False
+    for rel_path, entry in index.entries.items():
+        if entry.mode & 0o170000 == 0o160000:
+            continue
+        full_path = worktree / rel_path
+        try:
+            st = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if not index.is_clean(entry, st) and object_hash_file(full_path) == entry.sha:
+            entry.update_stat(st)
+            refreshed = True
+    return refreshed
+
+def load_index(repo):
+    """Read .git/index, or seed one from HEAD's tree if there is none.
+
+    Repositories made before the index existed have commits but no index
+    file; reading that as an empty index would drop every file from the next
+    commit. Seeded entries have zeroed stat data, so each file is hashed once
+    and recorded when the index is next written.
+    """
+    if index_path(repo).exists():
+        return read_index(repo)
+
+    index = GitIndex()
+    head = object_read(repo, resolve_ref(repo, "HEAD"))
+    if head is None or head.fmt != b'commit':
+        return index
+    _seed_index(repo, index, head.kvlm[b'tree'].decode(), [])
+    return index
+
+def _seed_index(repo, index, tree_sha, dirs):
+    """Add an entry for every blob below the tree and record the tree in the
+    cache-tree. Returns the entry count, or None if it cannot be cached."""
+    prefix = "".join(d + "/" for d in dirs)
+    entry_count = 0
+    for item in object_read(repo, tree_sha).items:
+        name = item.path.decode()
+        mode = item.mode
+        if mode.startswith(b'04') or mode == b'40000':
+            count = _seed_index(repo, index, item.sha, dirs + [name])
+            entry_count = None if count is None or entry_count is None else entry_count + count
+        elif mode.startswith(b'16'):
+            # Submodules get no index entry, as in checkout_tree
+            entry_count = None
+        else:
+            index.add(GitIndexEntry(prefix + name, item.sha, int(mode, 8)))
+            if entry_count is not None:
+                entry_count += 1
+
+    # After the entries, which invalidate the trees they are added to
+    if entry_count is not None:
+        node = index.cache_tree.find(dirs, create=True)
+        node.entry_count = entry_count
+        node.sha = tree_sha
+    return entry_count
+
+def snapshot_index(repo, all_tracked=False):
+    """Write the tree of the index exactly as staged and return its SHA.
+
+    With `all_tracked`, changed and deleted tracked files are staged first
+    (like 'git commit -a'). Only trees on the path of a change are written,
+    thanks to the index cache-tree, which is saved along with refreshed stat
+    data.
+    """
+    index = load_index(repo)
+    if all_tracked:
+        update_tracked(repo, index)
+    else:
+        refresh_index(index, repo.worktree)
+    tree_sha = write_tree_from_index(repo, index)
+    write_index(repo, index)
+    return tree_sha
+
+def read_tree_paths(repo, tree_sha, prefix=""):
+    """Flatten a tree into {path: (mode, sha)} for every blob below it."""
+    paths = {}
+    tree = object_read(repo, tree_sha)
+    for item in tree.items:
+        path = prefix + item.path.decode()
+        mode = item.mode
+        if mode.startswith(b'04') or mode == b'40000':
+            paths.update(read_tree_paths(repo, item.sha, path + "/"))
+        else:
+            paths[path] = (mode, item.sha)
+    return paths
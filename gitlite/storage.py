@@ -1,45 +1,148 @@
 import hashlib
+import os
+import tempfile
 import zlib
 from .objects.blob import GitBlob
 from .objects.commit import GitCommit
 from .objects.tree import GitTree
 from .objects.tag import GitTag
-from .pack.packfile import GitPack
-from .pack.types import OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG
+from .pack.types import OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_TAG, TYPE_NAMES, TYPE_NUMS
+
+# Bytes moved per step by the streaming reader and writer
+STREAM_CHUNK = 64 * 1024
+# As in git, loose objects favour speed; they are recompressed when packed
+DEFAULT_LOOSE_COMPRESSION = zlib.Z_BEST_SPEED
  
 def object_read_raw(repo, sha):
+    cache = repo.object_cache
+    cached = cache.get(sha)
+    if cached is not None:
+        return cached
 
     # 1. Try loose object
-    path = repo.gitdir / "objects" / sha[0:2] / sha[2:]
-    
+    path = _loose_path(repo, sha)
     if path.is_file():
-        with open(path, "rb") as f:
-            raw = zlib.decompress(f.read())
-            
-        x = raw.find(b' ')
-        fmt = raw[0:x]
-        y = raw.find(b'\x00', x)
-        
-        if fmt == b'commit': type_num = OBJ_COMMIT
-        elif fmt == b'tree': type_num = OBJ_TREE
-        elif fmt == b'blob': type_num = OBJ_BLOB
-        elif fmt == b'tag': type_num = OBJ_TAG
-        else:
-            raise Exception(f"Unknown type {fmt} in loose object")
-            
-        return type_num, raw[y+1:]
- 
+        type_num, data = _read_loose(path)
+
     # 2. Try packfiles
-    pack_dir = repo.gitdir / "objects" / "pack"
-    if pack_dir.is_dir():
-        for idx_file in pack_dir.glob("*.idx"):
-            pack = GitPack(idx_file, resolve_base_fn=lambda s: object_read_raw(repo, s))
-            offset = pack.find_offset(sha)
-            if offset is not None:
-                return pack.get_raw_object(offset)
-                
-    return None, None
- 
+    else:
+        type_num, data = repo.packs.read_raw(sha)
+        if type_num is None:
+            return None, None
+
+    cache.put(sha, type_num, data)
+    return type_num, data
+
+
+def _loose_path(repo, sha):
+    return repo.gitdir / "objects" / sha[0:2] / sha[2:]
+
+
+def _read_loose(path):
+    with open(path, "rb") as f:
+        raw = zlib.decompress(f.read())
+
+    x = raw.find(b' ')
+    fmt = raw[0:x]
+    y = raw.find(b'\x00', x)
+
+    if fmt == b'commit': type_num = OBJ_COMMIT
+    elif fmt == b'tree': type_num = OBJ_TREE
+    elif fmt == b'blob': type_num = OBJ_BLOB
+    elif fmt == b'tag': type_num = OBJ_TAG
+    else:
+        raise Exception(f"Unknown type {fmt} in loose object")
+
+    return type_num, raw[y+1:]
+
+
+def object_locations(repo, shas):
+    """Sort out where objects are stored, each SHA once.
+
+    Returns (loose, packed, missing): loose and missing are lists of SHAs in
+    input order, packed is [(pack, offset, sha)] sorted by pack and offset,
+    i.e. the order in which reading them goes through each pack front to back.
+    """
+    loose, packed, missing = [], [], []
+    ranks = {}
+    seen = set()
+    for sha in shas:
+        if sha in seen:
+            continue
+        seen.add(sha)
+        if _loose_path(repo, sha).is_file():
+            loose.append(sha)
+            continue
+        found = repo.packs.find(sha)
+        if found is None:
+            missing.append(sha)
+            continue
+        pack, offset = found
+        packed.append((ranks.setdefault(pack.pack_path, len(ranks)), offset, pack, sha))
+
+    packed.sort(key=lambda item: item[:2])
+    return loose, [(pack, offset, sha) for _, offset, pack, sha in packed], missing
+
+
+def object_read_many(repo, shas):
+    """Read a batch of objects, yielding (sha, type_num, data) for each SHA once.
+
+    Results come in storage order, not input order: loose objects first,
+    then packed ones sorted by pack and offset, then (sha, None, None) for
+    missing objects. A requested object that another requested object is a
+    delta against is kept in the delta base cache when read, so the base is
+    inflated once for both. Results bypass the repository's object cache,
+    which a one-off pass over many objects would only churn.
+    """
+    loose, packed, missing = object_locations(repo, shas)
+
+    for sha in loose:
+        yield (sha, *_read_loose(_loose_path(repo, sha)))
+
+    wanted = {(pack.pack_path, offset) for pack, offset, _ in packed}
+    bases = set()
+    for pack, offset, _ in packed:
+        base_offset = pack.delta_base_offset(offset)
+        if base_offset is not None and (pack.pack_path, base_offset) in wanted:
+            bases.add((pack.pack_path, base_offset))
+
+    for pack, offset, sha in packed:
+        type_num, data = pack.get_raw_object(offset)
+        if (pack.pack_path, offset) in bases:
+            pack.delta_cache.put((pack.pack_path, offset), type_num, data)
+        yield sha, type_num, data
+
+    for sha in missing:
+        yield sha, None, None
+
+
+def object_info(repo, sha):
+    """(type_num, size) of an object, or (None, None) if it is missing.
+
+    Only the header is inflated from a loose object, and a packed delta is
+    not resolved: its size comes from the delta and its type from the end of
+    the chain.
+    """
+    cached = repo.object_cache.get(sha)
+    if cached is not None:
+        return cached[0], len(cached[1])
+
+    path = _loose_path(repo, sha)
+    if path.is_file():
+        # The header is in the first few compressed bytes
+        with _open_loose(path, 512) as reader:
+            type_num = TYPE_NUMS.get(reader.fmt)
+            if type_num is None:
+                raise Exception(f"Unknown type {reader.fmt} in loose object")
+            return type_num, reader.size
+
+    found = repo.packs.find(sha)
+    if found is None:
+        return None, None
+    pack, offset = found
+    return pack.object_info(offset)
+
+
 def object_read(repo, sha):
     type_num, data = object_read_raw(repo, sha)
     if type_num is None:
@@ -51,23 +154,212 @@ def object_read(repo, sha):
     if type_num == OBJ_TAG: return GitTag(data)
     return None
  
+def object_exists(repo, sha):
+    """Whether the repository has the object, loose or packed."""
+    return _loose_path(repo, sha).is_file() or repo.packs.find(sha) is not None
+
 def object_write(obj, repo=None):
-    """Serialize the object, compute its SHA-1 hash, and optionally write it to the repository."""
+    """Serialize the object, compute its SHA-1 hash, and optionally write it to the repository.
+
+    An object the repository already has is not compressed or written again.
+    New objects are written to a temporary file and renamed into place, so
+    a reader never sees a partly written object.
+    """
     data = obj.serialize()
     result = obj.fmt + b' ' + str(len(data)).encode() + b'\x00' + data
     
     sha = hashlib.sha1(result).hexdigest()
  
-    if repo:
-        path = repo.gitdir / "objects" / sha[0:2] / sha[2:]
-        path.parent.mkdir(parents=True, exist_ok=True)
- 
-        # `x` (Exclusive Creation): create only if it doesn't exist
+    if repo and not object_exists(repo, sha):
+        # Next to the object, as git does, so the rename stays in one directory
+        directory = _loose_path(repo, sha).parent
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=directory)
         try:
-            with open(path, "xb") as f:
-                f.write(zlib.compress(result))
-        except FileExistsError:
-            # Object already exists, which is fine (same content = same SHA)
-            pass
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(result, repo.loose_compression))
+            _store_loose(repo, sha, tmp_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
  
-    return sha
\ No newline at end of file
+    return sha
+
+
+def _store_loose(repo, sha, tmp_path):
+    """Move a finished temporary file into place as the loose object `sha`."""
+    path = _loose_path(repo, sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        # Written meanwhile, which is fine (same content = same SHA)
+        os.unlink(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+
+
+class ObjectReader:
+    """Read-only file-like access to an object's content.
+
+    The content is inflated incrementally: `read_input(n)` returns the next
+    compressed bytes, so memory use is bounded by the chunk size rather than by
+    the object size. Objects that had to be materialized (resolved deltas) are
+    served from `pending` instead.
+    """
+
+    def __init__(self, fmt, size, read_input=None, dobj=None, pending=b"", tail=b"", close_fn=None):
+        self.fmt = fmt
+        self.size = size
+        self._read_input = read_input
+        self._dobj = dobj
+        self._pending = memoryview(pending)
+        self._tail = tail
+        self._close_fn = close_fn
+        self._remaining = size
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self._remaining
+
+        out = []
+        while n > 0:
+            if self._pending:
+                piece = bytes(self._pending[:n])
+                self._pending = self._pending[len(piece):]
+            elif self._dobj is not None and not self._dobj.eof:
+                if not self._tail:
+                    self._tail = self._read_input(STREAM_CHUNK)
+                    if not self._tail:
+                        raise Exception("Truncated object stream")
+                piece = self._dobj.decompress(self._tail, n)
+                self._tail = self._dobj.unconsumed_tail
+            else:
+                break
+
+            if len(piece) > self._remaining:
+                raise Exception("Object is larger than its header")
+            out.append(piece)
+            n -= len(piece)
+            self._remaining -= len(piece)
+
+        if n > 0 and self._remaining:
+            raise Exception("Object is smaller than its header")
+        return b"".join(out)
+
+    def close(self):
+        if self._close_fn:
+            self._close_fn()
+            self._close_fn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_loose(path, read_size=STREAM_CHUNK):
+    f = open(path, "rb")
+    try:
+        dobj = zlib.decompressobj()
+        head = b""
+        tail = b""
+        while True:
+            if not tail:
+                tail = f.read(read_size)
+                if not tail:
+                    raise Exception(f"Truncated loose object {path}")
+            head += dobj.decompress(tail, 64)
+            tail = dobj.unconsumed_tail
+
+            nul = head.find(b'\x00')
+            if nul >= 0:
+                break
+            if len(head) >= 64 or dobj.eof:
+                raise Exception(f"Malformed loose object header in {path}")
+
+        fmt, size = head[:nul].split(b' ')
+        return ObjectReader(fmt, int(size), f.read, dobj, pending=head[nul+1:], tail=tail, close_fn=f.close)
+    except Exception:
+        f.close()
+        raise
+
+
+def object_open(repo, sha):
+    """Open an object for streaming reads. Returns an ObjectReader, or None if missing."""
+    path = _loose_path(repo, sha)
+    if path.is_file():
+        return _open_loose(path)
+
+    found = repo.packs.find(sha)
+    if found is None:
+        return None
+    pack, offset = found
+
+    stream = pack.open_stream(offset)
+    if stream is not None:
+        type_num, size, read_input = stream
+        return ObjectReader(TYPE_NAMES[type_num], size, read_input, zlib.decompressobj())
+
+    # Deltas can only be resolved in memory
+    type_num, data = pack.get_raw_object(offset)
+    return ObjectReader(TYPE_NAMES[type_num], len(data), pending=data)
+
+
+def object_write_stream(stream, size, fmt=b'blob', repo=None):
+    """Hash `size` bytes read from `stream`, and optionally store them as a loose object.
+
+    Data is hashed and deflated in chunks into a temporary file that is renamed
+    into place once the SHA-1 is known. A stream that can seek (a file) is
+    hashed on its own first, so an object the repository already has is
+    never deflated; it is read a second time only if the object is new.
+    """
+    header = fmt + b' ' + str(size).encode() + b'\x00'
+
+    known = None
+    if repo and stream.seekable():
+        start = stream.tell()
+        known = _hash_stream(stream, size, hashlib.sha1(header))
+        if object_exists(repo, known):
+            return known
+        stream.seek(start)
+
+    if not repo:
+        return _hash_stream(stream, size, hashlib.sha1(header))
+
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=repo.gitdir / "objects")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            zobj = zlib.compressobj(repo.loose_compression)
+            out.write(zobj.compress(header))
+            sha = _hash_stream(stream, size, hashlib.sha1(header), out, zobj)
+            out.write(zobj.flush())
+        if known is not None and sha != known:
+            raise Exception("File changed while being hashed")
+        _store_loose(repo, sha, tmp_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return sha
+
+
+def _hash_stream(stream, size, sha1, out=None, zobj=None):
+    """Feed `size` bytes of `stream` to `sha1` (and deflated to `out`); returns the hex digest."""
+    remaining = size
+    while remaining:
+        chunk = stream.read(min(STREAM_CHUNK, remaining))
+        if not chunk:
+            raise Exception("File changed size while being hashed")
+        remaining -= len(chunk)
+        sha1.update(chunk)
+        if out:
+            out.write(zobj.compress(chunk))
+    if stream.read(1):
+        raise Exception("File changed size while being hashed")
+    return sha1.hexdigest()
+
+
+def object_hash_file(path, repo=None, fmt=b'blob'):
+    """Hash a file as an object of type `fmt` without loading it into memory."""
+    with open(path, "rb") as f:
+        return object_write_stream(f, os.fstat(f.fileno()).st_size, fmt, repo)
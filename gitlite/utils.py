@@ -1,3 +1,4 @@
+import datetime
 import os
 import time
 from .config import read_config
@@ -24,4 +25,41 @@ def get_signature(repo=None):
     offset_minutes = (offset % 3600) // 60
     timezone = f"{offset_hours:+03d}{offset_minutes:02d}"
     
-    return f"{name} <{email}> {timestamp} {timezone}"
\ No newline at end of file
+    return f"{name} <{email}> {timestamp} {timezone}"
+
+
+_DATE_UNITS = {
+    "second": 1, "minute": 60, "hour": 3600, "day": 86400,
+    "week": 7 * 86400, "month": 30 * 86400, "year": 365 * 86400,
+}
+
+
+def parse_date(value, now=None):
+    """Parse a --since/--until style date into seconds since the epoch.
+
+    Accepts epoch seconds ('1700000000' or '@1700000000'), ISO 8601 dates
+    and times (local time unless an offset is given), 'now', 'yesterday'
+    and relative dates such as '2 weeks ago' or '3.days.ago'.
+    """
+    if now is None:
+        now = int(time.time())
+    text = value.strip().lower()
+
+    if text.lstrip("@").isdigit():
+        return int(text.lstrip("@"))
+    if text == "now":
+        return now
+    if text == "yesterday":
+        return now - _DATE_UNITS["day"]
+
+    words = text.replace(".", " ").split()
+    if len(words) == 3 and words[2] == "ago" and words[0].isdigit():
+        unit = words[1][:-1] if words[1].endswith("s") else words[1]
+        if unit in _DATE_UNITS:
+            return now - int(words[0]) * _DATE_UNITS[unit]
+
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"invalid date '{value}'")
+    return int(parsed.timestamp())
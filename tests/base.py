@@ -1,9 +1,14 @@
 import unittest
 import shutil
+import struct
+import sys
 import tempfile
 import os
+from io import StringIO
 from pathlib import Path
 from gitlite.repo import GitRepository
+from gitlite.commands.commit import cmd_commit
+from gitlite.commands.stage import cmd_add
 
 
 def create_file(name, content):
@@ -14,6 +19,58 @@ def create_file(name, content):
     return path
 
 
+def run(cmd, args):
+    saved_stdout = sys.stdout
+    out = StringIO()
+    sys.stdout = out
+    try:
+        cmd(args)
+    finally:
+        sys.stdout = saved_stdout
+    return out.getvalue()
+
+
+def commit_all(message):
+    """Stage the whole working tree, then commit it."""
+    cmd_add(["."])
+    return run(cmd_commit, ["-m", message])
+
+
+def age_files(*paths):
+    # Push mtimes into the past so entries are not racily clean
+    for path in paths:
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - 10_000_000_000))
+
+
+def encode_varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def make_delta(base, target):
+    """Tiny delta encoder for tests: copy the common prefix, insert the rest."""
+    common = 0
+    while common < min(len(base), len(target)) and base[common] == target[common]:
+        common += 1
+
+    out = bytearray(encode_varint(len(base)) + encode_varint(len(target)))
+    if common:
+        out += bytes([0x80 | 0x10 | 0x20 | 0x40]) + struct.pack("<I", common)[:3]
+    rest = target[common:]
+    for i in range(0, len(rest), 127):
+        chunk = rest[i:i+127]
+        out += bytes([len(chunk)]) + chunk
+    return bytes(out)
+
+
 class BaseTestCase(unittest.TestCase):
     def setUp(self):
         # Create a temp directory
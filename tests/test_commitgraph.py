@@ -0,0 +1,188 @@
+from unittest.mock import patch
+from tests.base import BaseTestCase, run
+from gitlite import commitgraph
+from gitlite.commitgraph import (
+    GENERATION_INFINITY, commit_info, is_ancestor, merge_bases, parse_commit_info, write_commit_graph
+)
+from gitlite.objects.commit import GitCommit
+from gitlite.objects.tree import GitTree, TreeEntry
+from gitlite.objects.blob import GitBlob
+from gitlite.storage import object_write, object_read_raw
+from gitlite.commands.inspect import cmd_log, cmd_merge_base
+from gitlite.revwalk import RevWalk
+from gitlite.utils import parse_date
+
+
+class CommitBuilder(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tree = object_write(GitTree(), self.repo)
+        self.date = 1_700_000_000
+
+    def commit(self, message, *parents):
+        self.date += 60
+        commit = GitCommit()
+        commit.kvlm[b'tree'] = self.tree.encode()
+        if parents:
+            commit.kvlm[b'parent'] = [p.encode() for p in parents] if len(parents) > 1 else parents[0].encode()
+        signature = b'A U Thor <author@example.com> %d +0000' % self.date
+        commit.kvlm[b'author'] = signature
+        commit.kvlm[b'committer'] = signature
+        commit.kvlm[None] = message.encode() + b'\n'
+        return object_write(commit, self.repo)
+
+
+class TestCommitGraph(CommitBuilder):
+    def build_history(self):
+        # root - a1 - a2 ------ merge - octopus
+        #          \           /       /  /
+        #           b1 ------ b2      c1  d1 (off root)
+        c = {}
+        c["root"] = self.commit("root")
+        c["a1"] = self.commit("a1", c["root"])
+        c["b1"] = self.commit("b1", c["a1"])
+        c["a2"] = self.commit("a2", c["a1"])
+        c["b2"] = self.commit("b2", c["b1"])
+        c["merge"] = self.commit("merge", c["a2"], c["b2"])
+        c["c1"] = self.commit("c1", c["b2"])
+        c["d1"] = self.commit("d1", c["root"])
+        c["octopus"] = self.commit("octopus", c["merge"], c["c1"], c["d1"])
+        return c
+
+    def test_graph_matches_objects(self):
+        c = self.build_history()
+        self.assertEqual(write_commit_graph(self.repo, [c["octopus"]]), 9)
+
+        graph = self.repo.commit_graph
+        self.assertEqual(len(graph), 9)
+        for name, sha in c.items():
+            from_graph = graph.get(sha)
+            from_object = parse_commit_info(sha, object_read_raw(self.repo, sha)[1])
+            self.assertEqual((from_graph.tree, from_graph.parents, from_graph.date),
+                             (from_object.tree, from_object.parents, from_object.date), name)
+        self.assertEqual(graph.get(c["root"]).generation, 1)
+        self.assertEqual(graph.get(c["merge"]).generation, 5)
+        self.assertEqual(graph.get(c["octopus"]).generation, 6)
+        self.assertIsNone(graph.get("0" * 40))
+
+    def test_walks_do_not_read_commits(self):
+        c = self.build_history()
+        write_commit_graph(self.repo, [c["octopus"]])
+
+        with patch.object(commitgraph, "object_read_raw", side_effect=AssertionError):
+            self.assertTrue(is_ancestor(self.repo, c["d1"], c["octopus"]))
+            self.assertFalse(is_ancestor(self.repo, c["c1"], c["merge"]))
+            self.assertEqual(merge_bases(self.repo, c["a2"], c["c1"]), [c["a1"]])
+
+    def test_merge_bases(self):
+        c = self.build_history()
+        for with_graph in (False, True):
+            if with_graph:
+                write_commit_graph(self.repo, [c["octopus"]])
+            self.assertEqual(merge_bases(self.repo, c["merge"], c["c1"]), [c["b2"]])
+            self.assertEqual(merge_bases(self.repo, c["d1"], c["b2"]), [c["root"]])
+            self.assertEqual(merge_bases(self.repo, c["octopus"], c["a2"]), [c["a2"]])
+
+    def test_criss_cross_has_two_bases(self):
+        root = self.commit("root")
+        x = self.commit("x", root)
+        y = self.commit("y", root)
+        x2 = self.commit("x2", x, y)
+        y2 = self.commit("y2", y, x)
+        write_commit_graph(self.repo, [x2, y2])
+        self.assertEqual(sorted(merge_bases(self.repo, x2, y2)), sorted([x, y]))
+
+    def test_commits_newer_than_graph(self):
+        c = self.build_history()
+        write_commit_graph(self.repo, [c["merge"]])
+        newer = self.commit("newer", c["octopus"])
+
+        self.assertEqual(commit_info(self.repo, newer).generation, GENERATION_INFINITY)
+        self.assertTrue(is_ancestor(self.repo, c["a1"], newer))
+        self.assertFalse(is_ancestor(self.repo, newer, c["octopus"]))
+        self.assertEqual(merge_bases(self.repo, newer, c["a2"]), [c["a2"]])
+
+    def test_log_and_merge_base_commands(self):
+        c = self.build_history()
+        write_commit_graph(self.repo, [c["octopus"]])
+
+        output = run(cmd_log, [c["octopus"]])
+        self.assertEqual(output.count("\ncommit ") + output.startswith("commit "), 9)
+        self.assertIn("    octopus", output)
+        self.assertEqual(run(cmd_merge_base, [c["merge"], c["c1"]]).strip(), c["b2"])
+        with self.assertRaises(SystemExit) as cm:
+            run(cmd_merge_base, ["--is-ancestor", c["a2"], c["b2"]])
+        self.assertEqual(cm.exception.code, 1)
+
+
+class TestRevWalk(CommitBuilder):
+    def commit_files(self, message, files, *parents):
+        tree = GitTree()
+        for name, content in sorted(files.items()):
+            blob_sha = object_write(GitBlob(content.encode()), self.repo)
+            tree.items.append(TreeEntry(b'100644', name.encode(), blob_sha))
+        self.tree = object_write(tree, self.repo)
+        return self.commit(message, *parents)
+
+    def log(self, *args):
+        output = run(cmd_log, list(args))
+        return [line.split()[-1] for line in output.splitlines() if line.startswith("    ")]
+
+    def test_date_order_across_branches(self):
+        root = self.commit("root")
+        a = self.commit("a", root)
+        b = self.commit("b", root)
+        a2 = self.commit("a2", a)
+        merge = self.commit("merge", a2, b)
+        self.assertEqual(self.log(merge), ["merge", "a2", "b", "a", "root"])
+        self.assertEqual(self.log("--first-parent", merge), ["merge", "a2", "a", "root"])
+        self.assertEqual(self.log("-n", "2", merge), ["merge", "a2"])
+        self.assertEqual(self.log("-3", merge), ["merge", "a2", "b"])
+
+    def test_limit_stops_the_walk(self):
+        shas = [self.commit("c0")]
+        for i in range(1, 200):
+            shas.append(self.commit(f"c{i}", shas[-1]))
+        write_commit_graph(self.repo, [shas[-1]])
+
+        looked_up = []
+        real_commit_info = commitgraph.commit_info
+
+        def counting_commit_info(repo, sha):
+            looked_up.append(sha)
+            return real_commit_info(repo, sha)
+
+        with patch("gitlite.revwalk.commit_info", counting_commit_info):
+            walked = [info.sha for info in RevWalk(self.repo, [shas[-1]], max_count=5)]
+        self.assertEqual(walked, shas[:-6:-1])
+        self.assertLessEqual(len(looked_up), 6)
+
+    def test_since_and_until(self):
+        shas = [self.commit("c0")]
+        for i in range(1, 10):
+            shas.append(self.commit(f"c{i}", shas[-1]))
+        # commit i is dated 1_700_000_000 + 60 * (i + 1)
+        since = f"--since=@{1_700_000_000 + 60 * 4}"
+        until = f"--until=@{1_700_000_000 + 60 * 7}"
+        self.assertEqual(self.log(since, until, shas[-1]), ["c6", "c5", "c4", "c3"])
+
+    def test_path_limiting(self):
+        root = self.commit_files("root", {"a": "1", "b": "1"})
+        touch_b = self.commit_files("touch-b", {"a": "1", "b": "2"}, root)
+        touch_a = self.commit_files("touch-a", {"a": "2", "b": "2"}, touch_b)
+        side = self.commit_files("side-b", {"a": "1", "b": "3"}, root)
+        merge = self.commit_files("merge", {"a": "2", "b": "3"}, touch_a, side)
+
+        self.assertEqual(self.log(merge, "--", "a"), ["touch-a", "root"])
+        # The merge took b from side-b, so only that side is followed
+        self.assertEqual(self.log(merge, "--", "b"), ["side-b", "root"])
+        self.assertEqual(self.log(merge, "--", "missing"), [])
+
+    def test_parse_date(self):
+        now = 1_700_000_000
+        self.assertEqual(parse_date("@123", now), 123)
+        self.assertEqual(parse_date("2 days ago", now), now - 2 * 86400)
+        self.assertEqual(parse_date("3.weeks.ago", now), now - 21 * 86400)
+        self.assertEqual(parse_date("2023-11-14T22:13:20+00:00", now), now)
+        with self.assertRaises(ValueError):
+            parse_date("whenever", now)
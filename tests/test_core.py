@@ -1,9 +1,13 @@
 import sys
-from io import StringIO
-from unittest.mock import MagicMock
+from io import StringIO, BytesIO
+import zlib
+from unittest.mock import MagicMock, patch
 from tests.base import BaseTestCase, create_file
-from gitlite.commands.base import cmd_hash_object, cmd_cat_file
-from gitlite.storage import object_read
+from gitlite.commands.base import cmd_hash_object, cmd_cat_file, cat_file_batch
+from gitlite.storage import object_read, object_write, object_open, object_hash_file
+from gitlite.objects.blob import GitBlob
+from gitlite.objects.kvlm import kvlm_parse, kvlm_serialize
+from gitlite.objects.tree import GitTree, TreeEntry, iter_tree, parse_tree
  
 class TestCore(BaseTestCase):
     def test_hash_object(self):
@@ -52,4 +56,118 @@ class TestCore(BaseTestCase):
             sys.stdout = saved_stdout
             
         # Verify it wrote the correct content
-        mock_buffer.write.assert_called_with(b"world")
\ No newline at end of file
+        mock_buffer.write.assert_called_with(b"world")
+
+    def test_cat_file_batch(self):
+        sha = object_write(GitBlob(b"world"), self.repo)
+        (self.repo.gitdir / "refs" / "heads" / "master").write_text(sha + "\n")
+        stdin = BytesIO(f"{sha}\nmaster\nnope\n".encode())
+
+        out = BytesIO()
+        cat_file_batch(self.repo, stdin, out)
+        self.assertEqual(out.getvalue(),
+                         f"{sha} blob 5\nworld\n{sha} blob 5\nworld\nnope missing\n".encode())
+
+        stdin.seek(0)
+        out = BytesIO()
+        cat_file_batch(self.repo, stdin, out, contents=False, buffer=True)
+        self.assertEqual(out.getvalue(), f"{sha} blob 5\n{sha} blob 5\nnope missing\n".encode())
+
+        for option, expected in [("-t", "blob"), ("-s", "5")]:
+            saved_stdout = sys.stdout
+            sys.stdout = out = StringIO()
+            try:
+                cmd_cat_file([option, sha])
+            finally:
+                sys.stdout = saved_stdout
+            self.assertEqual(out.getvalue(), expected + "\n")
+
+    def test_object_open_streams_loose_object(self):
+        data = bytes(range(256)) * 1000
+        path = create_file("big.bin", "")
+        path.write_bytes(data)
+
+        sha = object_hash_file(path, self.repo)
+        self.assertEqual(sha, object_write(GitBlob(data)))
+
+        with object_open(self.repo, sha) as reader:
+            self.assertEqual(reader.fmt, b"blob")
+            self.assertEqual(reader.size, len(data))
+            chunks = []
+            while True:
+                chunk = reader.read(1000)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), 1000)
+                chunks.append(chunk)
+        self.assertEqual(b"".join(chunks), data)
+
+    def test_object_open_missing(self):
+        self.assertIsNone(object_open(self.repo, "0" * 40))
+
+    def test_hash_without_write_stores_nothing(self):
+        path = create_file("a.txt", "not stored")
+        sha = object_hash_file(path)
+        self.assertIsNone(object_open(self.repo, sha))
+
+    def test_tree_roundtrip(self):
+        blob_sha = object_write(GitBlob(b"x"), self.repo)
+        tree = GitTree()
+        tree.items = [TreeEntry(b"100644", b"a file", blob_sha), TreeEntry(b"40000", b"dir", bytes(20))]
+        data = tree.serialize()
+        self.assertEqual(data, b"100644 a file\x00" + bytes.fromhex(blob_sha) + b"40000 dir\x00" + bytes(20))
+
+        items = parse_tree(data)
+        self.assertEqual(items, tree.items)
+        self.assertEqual((items[0].mode, items[0].path, items[0].sha), (b"100644", b"a file", blob_sha))
+        self.assertEqual(list(iter_tree(memoryview(data))), items)
+
+        with self.assertRaises(ValueError):
+            parse_tree(data[:-1])
+
+        # Entries are checked as they are reached, so a bad one only stops the walk there
+        entries = iter_tree(data + b"junk")
+        self.assertEqual(next(entries), items[0])
+        with self.assertRaises(ValueError):
+            list(entries)
+        with self.assertRaises(ValueError):
+            list(iter_tree(data[:5] + b"x" + data[6:]))
+
+    def test_kvlm_many_headers(self):
+        parents = [b"%040x" % i for i in range(3000)]
+        raw = (b"tree " + b"0" * 40 + b"\n" + b"".join(b"parent " + p + b"\n" for p in parents)
+               + b"gpgsig -----BEGIN-----\n" + b" line\n" * 3000 + b" -----END-----\n"
+               + b"\nmessage\n")
+        kvlm = kvlm_parse(raw)
+        self.assertEqual(kvlm[b"parent"], parents)
+        self.assertEqual(kvlm[b"gpgsig"], b"-----BEGIN-----\n" + b"line\n" * 3000 + b"-----END-----")
+        self.assertEqual(kvlm[None], b"message\n")
+        self.assertEqual(kvlm_serialize(kvlm), raw)
+
+        headers = kvlm_parse(raw, headers_only=True)
+        self.assertNotIn(None, headers)
+        self.assertEqual(headers[b"parent"], parents)
+
+        with self.assertRaises(ValueError):
+            kvlm_parse(b"tree abc\n continued")
+
+    def test_write_skips_existing_objects(self):
+        sha = object_write(GitBlob(b"kept"), self.repo)
+        path = create_file("kept.txt", "kept")
+        with patch("gitlite.storage.zlib.compress", side_effect=AssertionError), \
+                patch("gitlite.storage.zlib.compressobj", side_effect=AssertionError):
+            self.assertEqual(object_write(GitBlob(b"kept"), self.repo), sha)
+            self.assertEqual(object_hash_file(path, self.repo), sha)
+        self.assertEqual(list((self.repo.gitdir / "objects").glob("tmp_*")), [])
+
+    def test_loose_compression_level(self):
+        (self.repo.gitdir / "config").write_text("[core]\n\tcompression = 9\n\tlooseCompression = 0\n")
+        sha = object_write(GitBlob(b"a" * 1000), self.repo)
+        raw = (self.repo.gitdir / "objects" / sha[:2] / sha[2:]).read_bytes()
+        self.assertEqual(raw, zlib.compress(b"blob 1000\x00" + b"a" * 1000, 0))
+        self.assertEqual(object_read(self.repo, sha).blobdata, b"a" * 1000)
+
+        self.repo._loose_compression = None
+        (self.repo.gitdir / "config").write_text("[core]\n\tcompression = 12\n")
+        with self.assertRaises(ValueError):
+            object_write(GitBlob(b"b"), self.repo)
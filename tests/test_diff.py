@@ -1,6 +1,15 @@
+import os
 import sys
 from io import StringIO
-from tests.base import BaseTestCase, create_file
+from unittest.mock import patch
+from tests.base import BaseTestCase, create_file, run, age_files, commit_all
+from gitlite import diff
+from gitlite.linediff import split_lines, unified_diff, count_changes
+from gitlite.repo import resolve_ref
+from gitlite.storage import object_read, object_write
+from gitlite.objects.tree import TreeEntry
+from gitlite.index import read_index
+from gitlite.commands.stage import cmd_add
 from gitlite.commands.commit import cmd_commit
 from gitlite.commands.diff import cmd_diff
 from gitlite.commands.config import cmd_config
@@ -18,6 +27,7 @@ class TestDiff(BaseTestCase):
         out = StringIO()
         sys.stdout = out
         try:
+            cmd_add(["hello.txt"])
             cmd_commit(["-m", "Commit 1"])
         finally:
             sys.stdout = saved_stdout
@@ -38,3 +48,230 @@ class TestDiff(BaseTestCase):
         self.assertIn("+++ b/hello.txt", output)
         self.assertIn("-v1", output)
         self.assertIn("+v2", output)
+
+
+class TestTreeDiff(BaseTestCase):
+    def commit_tree(self, message):
+        commit_all(message)
+        commit = object_read(self.repo, resolve_ref(self.repo, "HEAD"))
+        return commit.kvlm[b'tree'].decode()
+
+    def count_reads(self, fn):
+        reads = []
+        real_read = diff.object_read_raw
+
+        def counting_read(repo, sha):
+            reads.append(sha)
+            return real_read(repo, sha)
+
+        with patch.object(diff, "object_read_raw", counting_read):
+            result = fn()
+        return result, len(reads)
+
+    def test_identical_subtrees_skipped(self):
+        for top in range(5):
+            for sub in range(5):
+                create_file(f"d{top}/s{sub}/deep/file.txt", f"{top}{sub}")
+        old = self.commit_tree("one")
+        create_file("d3/s1/deep/file.txt", "changed")
+        new = self.commit_tree("two")
+
+        changes, reads = self.count_reads(lambda: diff.diff_tree_to_tree(self.repo, old, new))
+        self.assertEqual([(c.status, c.path) for c in changes], [("M", "d3/s1/deep/file.txt")])
+        # Both sides of root, d3, d3/s1 and d3/s1/deep
+        self.assertEqual(reads, 8)
+
+    def test_files_and_directories_swapping(self):
+        create_file("a/x", "x")
+        create_file("b", "b")
+        create_file("c", "c")
+        old = self.commit_tree("one")
+        os.remove("a/x")
+        os.rmdir("a")
+        create_file("a", "now a file")
+        os.remove("b")
+        create_file("b/y", "now a dir")
+        os.remove("c")
+        new = self.commit_tree("two")
+
+        changes = diff.diff_tree_to_tree(self.repo, old, new)
+        self.assertEqual([(c.status, c.path) for c in changes],
+                         [("A", "a"), ("D", "a/x"), ("D", "b"), ("A", "b/y"), ("D", "c")])
+        reverse = diff.diff_tree_to_tree(self.repo, new, old)
+        self.assertEqual([(c.status, c.path) for c in reverse],
+                         [("D", "a"), ("A", "a/x"), ("A", "b"), ("D", "b/y"), ("A", "c")])
+
+    def test_zero_padded_tree_mode(self):
+        create_file("d/f", "x")
+        old = self.commit_tree("one")
+        tree = object_read(self.repo, old)
+        tree.items = [TreeEntry(b"040000", item.path, item.raw_sha) for item in tree.items]
+        new = object_write(tree, self.repo)
+        self.assertNotEqual(new, old)
+        self.assertEqual(diff.diff_tree_to_tree(self.repo, old, new), [])
+
+    def test_cached_uses_cache_tree(self):
+        for top in range(5):
+            create_file(f"d{top}/file.txt", str(top))
+        tree = self.commit_tree("one")
+        create_file("d2/file.txt", "staged")
+        create_file("d2/new.txt", "new")
+        cmd_add(["d2"])
+        index = read_index(self.repo)
+        index.remove("d4/file.txt")
+        changes, reads = self.count_reads(lambda: diff.diff_tree_to_index(self.repo, tree, index))
+        self.assertEqual([(c.status, c.path) for c in changes],
+                         [("M", "d2/file.txt"), ("A", "d2/new.txt"), ("D", "d4/file.txt")])
+        # The root and the two directories that changed
+        self.assertEqual(reads, 3)
+
+    def test_name_status_and_stat(self):
+        create_file("a.txt", "1\n2\n3\n")
+        create_file("gone.txt", "bye\n")
+        commit_all("one")
+        old = resolve_ref(self.repo, "HEAD")
+        create_file("a.txt", "1\ntwo\n3\n4\n")
+        os.remove("gone.txt")
+        commit_all("two")
+        new = resolve_ref(self.repo, "HEAD")
+
+        self.assertEqual(run(cmd_diff, ["--name-status", old, new]), "M\ta.txt\nD\tgone.txt\n")
+        self.assertEqual(run(cmd_diff, ["--stat", old, new]),
+                         " a.txt    | 3 ++-\n"
+                         " gone.txt | 1 -\n"
+                         " 2 files changed, 2 insertions(+), 2 deletions(-)\n")
+
+        output = run(cmd_diff, [old, new])
+        self.assertIn("diff --git a/gone.txt b/gone.txt\ndeleted file mode 100644\n", output)
+        self.assertIn("--- a/gone.txt\n+++ /dev/null\n", output)
+
+    def test_cached_before_first_commit(self):
+        create_file("a.txt", "a\n")
+        cmd_add(["a.txt"])
+        self.assertEqual(run(cmd_diff, ["--cached", "--name-status"]), "A\ta.txt\n")
+
+
+class TestWorktreeDiff(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            create_file(f"d{i % 4}/f{i}.txt", f"line {i}\n")
+        age_files(*[f"d{i % 4}/f{i}.txt" for i in range(20)])
+        commit_all("one")
+
+    def count_work(self, args):
+        reads = []
+        hashes = []
+        real_read = diff.object_read_raw
+        real_hash = diff.object_hash_file
+
+        def counting_read(repo, sha):
+            reads.append(sha)
+            return real_read(repo, sha)
+
+        def counting_hash(path, repo=None, fmt=b'blob'):
+            hashes.append(os.path.relpath(path, self.test_dir))
+            return real_hash(path, repo, fmt)
+
+        with patch.object(diff, "object_read_raw", counting_read), \
+                patch.object(diff, "object_hash_file", counting_hash):
+            output = run(cmd_diff, args)
+        return output, reads, hashes
+
+    def test_clean_tree_reads_nothing(self):
+        output, reads, hashes = self.count_work([])
+        self.assertEqual((output, reads, hashes), ("", [], []))
+
+        # Against HEAD only the root tree is read: its SHA matches the cache-tree
+        output, reads, hashes = self.count_work(["HEAD"])
+        self.assertEqual((output, hashes), ("", []))
+        self.assertEqual(len(reads), 1)
+
+    def test_only_touched_files_hashed(self):
+        create_file("d1/f5.txt", "changed\n")
+        os.remove("d2/f6.txt")
+        output, reads, hashes = self.count_work(["--name-status"])
+        self.assertEqual(output, "M\td1/f5.txt\nD\td2/f6.txt\n")
+        self.assertEqual(hashes, [os.path.join("d1", "f5.txt")])
+        self.assertEqual(reads, [])
+
+        output, _, _ = self.count_work([])
+        self.assertIn("-line 5\n+changed\n", output)
+        self.assertIn("deleted file mode 100644", output)
+
+    def test_touched_but_unchanged_file(self):
+        st = os.stat("d0/f4.txt")
+        # Still older than the index, so the new stat data is not racy
+        os.utime("d0/f4.txt", ns=(st.st_atime_ns, st.st_mtime_ns - 5_000_000_000))
+        output, reads, hashes = self.count_work([])
+        self.assertEqual((output, reads), ("", []))
+        self.assertEqual(hashes, [os.path.join("d0", "f4.txt")])
+
+        # The refreshed entry was written back, so the file is not hashed again
+        output, reads, hashes = self.count_work([])
+        self.assertEqual((output, reads, hashes), ("", [], []))
+
+    def test_refresh_skipped_while_index_locked(self):
+        st = os.stat("d0/f4.txt")
+        os.utime("d0/f4.txt", ns=(st.st_atime_ns, st.st_mtime_ns - 5_000_000_000))
+        lock = self.repo.gitdir / "index.lock"
+        lock.touch()
+        self.assertEqual(run(cmd_diff, []), "")
+        self.assertTrue(lock.exists())
+        lock.unlink()
+
+        # Anything else that stops the write is reported
+        with patch.object(diff, "write_index", side_effect=PermissionError("denied")):
+            with self.assertRaises(PermissionError):
+                run(cmd_diff, [])
+
+
+def line_diff(old, new, algorithm="myers"):
+    hunks = "".join(unified_diff(split_lines(old), split_lines(new), "a/f", "b/f", algorithm))
+    return hunks.split("+++ b/f\n", 1)[1] if hunks else ""
+
+
+class TestLineDiff(BaseTestCase):
+    """Expected hunks are what git 2.39 prints for the same files."""
+
+    def test_missing_newline_at_end(self):
+        self.assertEqual(line_diff("a\nb\nc", "a\nb\nd\n"),
+                         "@@ -1,3 +1,3 @@\n a\n b\n-c\n\\ No newline at end of file\n+d\n")
+        self.assertEqual(line_diff("a\n", "a\n"), "")
+
+    def test_function_name_in_hunk_header(self):
+        old = "def one():\n    x = 1\n    y = 2\n    z = 3\n    w = 4\n    return x\n"
+        new = old.replace("w = 4", "w = 5")
+        self.assertTrue(line_diff(old, new).startswith("@@ -2,5 +2,5 @@ def one():\n"))
+
+    def test_insertion_slides_to_whole_function(self):
+        old = "def a():\n    pass\n\ndef c():\n    pass\n"
+        new = "def a():\n    pass\n\ndef b():\n    pass\n\ndef c():\n    pass\n"
+        self.assertEqual(line_diff(old, new),
+                         "@@ -1,5 +1,8 @@\n def a():\n     pass\n \n"
+                         "+def b():\n+    pass\n+\n def c():\n     pass\n")
+
+    def test_algorithms(self):
+        old = "x\na\nb\nc\n{\n}\n{\n}\ny\n"
+        new = "x\nc\n{\n}\na\nb\n{\n}\ny\n"
+        moved_ab = "@@ -1,9 +1,9 @@\n x\n-a\n-b\n c\n {\n }\n+a\n+b\n {\n }\n y\n"
+        self.assertEqual(line_diff(old, new, "myers"), moved_ab)
+        self.assertEqual(line_diff(old, new, "histogram"), moved_ab)
+        self.assertEqual(line_diff(old, new, "patience"),
+                         "@@ -1,9 +1,9 @@\n x\n+c\n+{\n+}\n a\n b\n-c\n-{\n-}\n {\n }\n y\n")
+        self.assertEqual(count_changes(split_lines(old), split_lines(new), "myers"), (2, 2))
+        self.assertEqual(count_changes(split_lines(old), split_lines(new), "patience"), (3, 3))
+
+    def test_diff_algorithm_option(self):
+        create_file("f.txt", "x\na\nb\nc\n{\n}\n{\n}\ny\n")
+        cmd_add(["f.txt"])
+        create_file("f.txt", "x\nc\n{\n}\na\nb\n{\n}\ny\n")
+
+        self.assertIn("\n-a\n-b\n", run(cmd_diff, []))
+        self.assertIn("\n+c\n+{\n+}\n", run(cmd_diff, ["--diff-algorithm=patience"]))
+        self.assertIn("\n+c\n+{\n+}\n", run(cmd_diff, ["--patience"]))
+        cmd_config(["diff.algorithm", "patience"])
+        self.assertIn(" 6 +++---\n", run(cmd_diff, ["--stat"]))
+        with self.assertRaises(SystemExit) as raised:
+            run(cmd_diff, ["--diff-algorithm=bogus"])
+        self.assertEqual(raised.exception.code, 129)
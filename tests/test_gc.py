@@ -0,0 +1,251 @@
+import io
+from unittest.mock import patch
+from tests.base import BaseTestCase, create_file, run, commit_all, make_delta
+from gitlite.storage import object_read, object_hash_file
+from gitlite.commands.stage import cmd_add
+from gitlite.commands.tag import cmd_tag
+from gitlite.commands.inspect import cmd_log
+from gitlite.commands.maintenance import cmd_gc, cmd_repack
+from gitlite import storage
+from gitlite.maintenance import collect_reachable, find_deltas
+from gitlite.fastimport import FastImport
+from gitlite.repo import resolve_ref
+from gitlite.pack.packfile import GitPack
+from gitlite.pack.writer import PackWriter, write_pack_index
+from gitlite.pack.types import OBJ_BLOB, OBJ_COMMIT, OBJ_OFS_DELTA
+
+
+def loose_objects(repo):
+    objects_dir = repo.gitdir / "objects"
+    return [p for p in objects_dir.glob("??/*")]
+
+
+class TestPackWriter(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pack_dir = self.repo.gitdir / "objects" / "pack"
+
+    def test_roundtrip_with_delta(self):
+        base = b"line\n" * 100
+        target = base + b"more\n"
+
+        writer = PackWriter(self.pack_dir)
+        base_sha = writer.add(OBJ_BLOB, base)
+        target_sha = writer.add_ofs_delta(
+            "%040x" % 1, base_sha, make_delta(base, target))
+        pack_path = writer.finish()
+
+        pack = GitPack(pack_path)
+        self.assertEqual(pack.get_raw_object(pack.find_offset(base_sha)), (OBJ_BLOB, base))
+        type_num, data = pack.get_raw_object(pack.find_offset(target_sha))
+        self.assertEqual(bytes(data), target)
+        self.assertEqual(list(self.pack_dir.glob("tmp_*")), [])
+
+    def test_empty_pack_not_written(self):
+        self.assertIsNone(PackWriter(self.pack_dir).finish())
+        self.assertEqual(list(self.pack_dir.iterdir()), [])
+
+    def test_large_offsets_in_index(self):
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        idx_path = self.pack_dir / "pack-big.idx"
+        entries = {"aa" * 20: (12, 0), "bb" * 20: (0x1_0000_0010, 0)}
+        write_pack_index(idx_path, entries, b"\0" * 20)
+
+        pack = GitPack(self.pack_dir / "pack-big.pack")
+        self.assertEqual(pack.find_offset("aa" * 20), 12)
+        self.assertEqual(pack.find_offset("bb" * 20), 0x1_0000_0010)
+
+
+class TestGc(BaseTestCase):
+    def test_gc_packs_history(self):
+        for i in range(5):
+            create_file("a.txt", f"version {i}\n")
+            create_file(f"dir/f{i}.txt", "x")
+            commit_all(f"c{i}")
+        cmd_tag(["-a", "-m", "tagged", "v1"])
+        reachable = collect_reachable(self.repo)
+
+        run(cmd_gc, [])
+        self.assertEqual(loose_objects(self.repo), [])
+        packs = list((self.repo.gitdir / "objects" / "pack").glob("*.pack"))
+        self.assertEqual(len(packs), 1)
+
+        for sha, _, _ in reachable:
+            self.assertIsNotNone(object_read(self.repo, sha))
+        self.assertIn("c0", run(cmd_log, []))
+
+    def test_gc_stores_revisions_as_deltas(self):
+        lines = [f"line {i}\n" for i in range(2000)]
+        for i in range(6):
+            lines[i * 300] = f"edit {i}\n"
+            create_file("big.txt", "".join(lines))
+            commit_all(f"c{i}")
+        run(cmd_gc, [])
+
+        pack_path = next((self.repo.gitdir / "objects" / "pack").glob("*.pack"))
+        pack = GitPack(pack_path)
+        types = []
+        for sha, type_num, _ in collect_reachable(self.repo):
+            types.append(pack.read_entry_header(pack.find_offset(sha))[0])
+            self.assertIsNotNone(object_read(self.repo, sha))
+        pack.close()
+        # Five of the six blob revisions (and trees) are deltas
+        self.assertGreaterEqual(types.count(OBJ_OFS_DELTA), 5)
+        self.assertLess(pack_path.stat().st_size, 20000)
+
+    def test_find_deltas_reads_each_object_once(self):
+        lines = [f"line {i}\n" for i in range(500)]
+        for i in range(4):
+            lines[i * 100] = f"edit {i}\n"
+            create_file("a.txt", "".join(lines))
+            commit_all(f"c{i}")
+        objects = list(collect_reachable(self.repo))
+        self.repo.object_cache.clear()
+        inflated = []
+        real_read = storage._read_loose
+
+        def counting_read(path):
+            inflated.append(path.parent.name + path.name)
+            return real_read(path)
+
+        # Sizes come from headers, so only the window pass inflates anything
+        with patch.object(storage, "_read_loose", counting_read):
+            deltas = find_deltas(self.repo, objects)
+        self.assertTrue(deltas)
+        self.assertEqual(sorted(inflated), sorted(sha for sha, type_num, _ in objects if type_num != OBJ_COMMIT))
+
+    def test_index_blobs_survive(self):
+        create_file("a.txt", "a")
+        commit_all("one")
+        create_file("staged.txt", "only in the index")
+        cmd_add(["staged.txt"])
+
+        run(cmd_gc, [])
+        sha = object_hash_file(self.repo.worktree / "staged.txt")
+        self.assertEqual(object_read(self.repo, sha).blobdata, b"only in the index")
+
+    def test_incremental_repack(self):
+        create_file("a.txt", "a")
+        commit_all("one")
+        run(cmd_repack, ["-d"])
+        self.assertEqual(loose_objects(self.repo), [])
+
+        create_file("b.txt", "b")
+        commit_all("two")
+        self.assertIn("Wrote", run(cmd_repack, []))
+        # Without -d the loose copies stay
+        self.assertEqual(len(loose_objects(self.repo)), 3)
+
+        counts = []
+        for path in (self.repo.gitdir / "objects" / "pack").glob("*.pack"):
+            pack = GitPack(path)
+            pack.load_index()
+            counts.append(pack.total_objects)
+        # Only the new commit, its tree and b.txt went into the second pack
+        self.assertEqual(sorted(counts), [3, 3])
+        self.assertIn("Nothing new to pack.", run(cmd_repack, []))
+
+
+def data(content):
+    return b"data %d\n%s\n" % (len(content), content)
+
+
+class TestFastImport(BaseTestCase):
+    def test_import_stream(self):
+        lines = b"".join(b"line %d\n" % i for i in range(500))
+        edited = lines.replace(b"line 250\n", b"edited\n")
+        person = b"A U Thor <author@example.com> 1700000000 +0000"
+        stream = (
+            b"blob\nmark :1\n" + data(lines) +
+            b"commit refs/heads/master\nmark :2\ncommitter " + person + b"\n" + data(b"first") +
+            b"M 100644 :1 dir/big.txt\n"
+            b"M 644 inline small.txt\n" + data(b"small") +
+            b"\n# a comment\n"
+            b"commit refs/heads/master\nmark :3\nauthor " + person + b"\ncommitter " + person + b"\n" +
+            b"data <<EOF\nsecond\nEOF\n"
+            b"from :2\n"
+            b"M 100644 inline dir/big.txt\n" + data(edited) +
+            b"D small.txt\n"
+            b"R dir \"new dir\"\n"
+            b"tag v1\nfrom :3\ntagger " + person + b"\n" + data(b"tagged") +
+            b"reset refs/heads/old\nfrom :2\n\n"
+            b"progress done\ndone\n")
+
+        out = io.BytesIO()
+        stats = FastImport(self.repo, io.BytesIO(stream), out).run()
+        self.assertEqual(out.getvalue(), b"progress done\n")
+        self.assertEqual((stats["blob"], stats["commit"], stats["tag"]), (3, 2, 1))
+        self.assertEqual(stats["delta"], 1)
+        self.assertEqual(loose_objects(self.repo), [])
+
+        head = object_read(self.repo, resolve_ref(self.repo, "refs/heads/master"))
+        self.assertEqual(head.kvlm[None], b"second\n")
+        tree = object_read(self.repo, head.kvlm[b"tree"].decode())
+        self.assertEqual([item.path for item in tree.items], [b"new dir"])
+        subtree = object_read(self.repo, tree.items[0].sha)
+        self.assertEqual(object_read(self.repo, subtree.items[0].sha).blobdata, edited)
+
+        first = head.kvlm[b"parent"].decode()
+        self.assertEqual(resolve_ref(self.repo, "refs/heads/old"), first)
+        tree = object_read(self.repo, object_read(self.repo, first).kvlm[b"tree"].decode())
+        self.assertEqual([item.path for item in tree.items], [b"dir", b"small.txt"])
+
+        tag = object_read(self.repo, resolve_ref(self.repo, "refs/tags/v1"))
+        self.assertEqual(tag.kvlm[b"object"].decode(), resolve_ref(self.repo, "refs/heads/master"))
+
+    def test_unknown_mark(self):
+        stream = b"commit refs/heads/master\ncommitter A <a@b> 0 +0000\n" + data(b"m") + b"M 100644 :9 a\n"
+        with self.assertRaisesRegex(ValueError, "Unknown mark"):
+            FastImport(self.repo, io.BytesIO(stream)).run()
+        self.assertEqual(list((self.repo.gitdir / "objects" / "pack").glob("*")), [])
+
+    def test_restart_from_branch_tip(self):
+        commit = b"commit refs/heads/master\ncommitter A <a@b> 0 +0000\n"
+        FastImport(self.repo, io.BytesIO(commit + data(b"one"))).run()
+        first = resolve_ref(self.repo, "refs/heads/master")
+
+        stream = (commit + data(b"two") + b"from refs/heads/master^0\n"
+                  b"reset refs/heads/topic\nfrom refs/heads/master^0\n")
+        importer = FastImport(self.repo, io.BytesIO(stream))
+        importer.run()
+        self.assertEqual(importer.rejected, {})
+        second = resolve_ref(self.repo, "refs/heads/master")
+        self.assertEqual(object_read(self.repo, second).kvlm[b"parent"].decode(), first)
+        # Branches named in the stream are looked up before the refs on disk
+        self.assertEqual(resolve_ref(self.repo, "refs/heads/topic"), second)
+
+    def test_invalid_ref_names(self):
+        for command in (b"commit ../../evil", b"commit refs/heads/../../../evil",
+                        b"reset HEAD", b"commit refs/heads/.hidden", b"tag ../evil"):
+            with self.subTest(command=command):
+                stream = command + b"\nfrom 0000000000000000000000000000000000000000\n"
+                with self.assertRaisesRegex(ValueError, "Invalid ref name"):
+                    FastImport(self.repo, io.BytesIO(stream)).run()
+        self.assertFalse((self.repo.gitdir.parent.parent / "evil").exists())
+        self.assertFalse((self.repo.gitdir / "evil").exists())
+        self.assertEqual(list((self.repo.gitdir / "objects" / "pack").glob("*")), [])
+
+    def test_non_fast_forward(self):
+        def commit(message, reset=b""):
+            stream = reset + b"commit refs/heads/master\ncommitter A <a@b> 0 +0000\n" + data(message)
+            importer = FastImport(self.repo, io.BytesIO(stream))
+            importer.run()
+            return importer
+
+        commit(b"first")
+        first = resolve_ref(self.repo, "refs/heads/master")
+        self.assertEqual(commit(b"second").rejected, {})
+        second = resolve_ref(self.repo, "refs/heads/master")
+        self.assertEqual(object_read(self.repo, second).kvlm[b"parent"].decode(), first)
+
+        importer = commit(b"unrelated", b"reset refs/heads/master\n")
+        self.assertEqual(list(importer.rejected), ["refs/heads/master"])
+        self.assertEqual(importer.rejected["refs/heads/master"][0], second)
+        self.assertEqual(resolve_ref(self.repo, "refs/heads/master"), second)
+
+        stream = b"reset refs/heads/master\ncommit refs/heads/master\ncommitter A <a@b> 0 +0000\n" + data(b"forced")
+        importer = FastImport(self.repo, io.BytesIO(stream), force=True)
+        importer.run()
+        self.assertEqual(importer.rejected, {})
+        head = object_read(self.repo, resolve_ref(self.repo, "refs/heads/master"))
+        self.assertEqual(head.kvlm[None], b"forced")
@@ -0,0 +1,375 @@
+import os
+import sys
+from io import StringIO
+from unittest.mock import patch
+from tests.base import BaseTestCase, create_file, run, commit_all, age_files
+from gitlite import staging, checkout
+from gitlite.repo import resolve_ref
+from gitlite.storage import object_read
+from gitlite.maintenance import gc
+from gitlite.commands.commit import cmd_commit, cmd_write_tree
+from gitlite.commands.config import cmd_config
+from gitlite.commands.checkout import cmd_checkout
+from gitlite.commands.branch import cmd_branch
+from gitlite.commands.stage import cmd_add, cmd_status
+from gitlite.index import GitIndex, GitIndexEntry, read_index, write_index
+
+
+class TestIndex(BaseTestCase):
+    def test_roundtrip(self):
+        index = GitIndex()
+        entry = GitIndexEntry("dir/file.txt", "ab" * 20, 0o100755, (1, 2), (3, 4), 5, 6, 7, 8, 9)
+        index.add(entry)
+        index.add(GitIndexEntry("a", "cd" * 20))
+        write_index(self.repo, index)
+
+        loaded = read_index(self.repo)
+        self.assertEqual([e.path for e in loaded.sorted_entries()], ["a", "dir/file.txt"])
+        e = loaded.entries["dir/file.txt"]
+        self.assertEqual((e.sha, e.mode, e.ctime, e.mtime, e.size), ("ab" * 20, 0o100755, (1, 2), (3, 4), 9))
+
+    def test_add_and_status(self):
+        create_file("a.txt", "a")
+        create_file("sub/b.txt", "b")
+        cmd_add(["a.txt"])
+
+        output = run(cmd_status, [])
+        self.assertIn("new file:   a.txt", output)
+        self.assertIn("Untracked files:", output)
+        self.assertIn("sub/b.txt", output)
+
+        run(cmd_commit, ["-m", "one"])
+        # Only what was staged is committed; sub/b.txt stays untracked
+        tree = object_read(self.repo, object_read(self.repo, resolve_ref(self.repo, "HEAD")).kvlm[b'tree'].decode())
+        self.assertEqual([item.path for item in tree.items], [b"a.txt"])
+        output = run(cmd_status, [])
+        self.assertNotIn("Changes to be committed:", output)
+        self.assertIn("sub/b.txt", output)
+
+        create_file("a.txt", "changed")
+        output = run(cmd_status, [])
+        self.assertIn("Changes not staged for commit:", output)
+        self.assertIn("modified:   a.txt", output)
+
+        cmd_add(["."])
+        output = run(cmd_status, [])
+        self.assertIn("Changes to be committed:", output)
+        self.assertIn("modified:   a.txt", output)
+
+    def test_commit_all_skips_untracked(self):
+        create_file("a.txt", "a")
+        commit_all("one")
+        create_file("a.txt", "a2")
+        create_file("untracked.txt", "u")
+
+        with self.assertRaises(SystemExit):
+            run(cmd_commit, ["-m", "unstaged edits are not committed"])
+        self.assertEqual(self.head_files(), {"a.txt": b"a"})
+
+        run(cmd_commit, ["-a", "-m", "tracked edits"])
+        self.assertEqual(self.head_files(), {"a.txt": b"a2"})
+
+    def test_status_directory_replaced_by_file(self):
+        create_file("d/f", "x")
+        commit_all("one")
+        os.remove("d/f")
+        os.rmdir("d")
+        create_file("d", "y")
+
+        output = run(cmd_status, [])
+        self.assertIn("deleted:    d/f", output)
+        self.assertIn("\td\n", output)
+
+    def test_nothing_to_commit(self):
+        with self.assertRaises(SystemExit):
+            run(cmd_commit, ["-m", "empty"])
+        self.assertFalse((self.repo.gitdir / "refs" / "heads" / "master").exists())
+
+        create_file("a.txt", "a")
+        commit_all("one")
+        head = resolve_ref(self.repo, "HEAD")
+        with self.assertRaises(SystemExit):
+            run(cmd_commit, ["-a", "-m", "same"])
+        self.assertEqual(resolve_ref(self.repo, "HEAD"), head)
+
+    def test_missing_index_read_as_head(self):
+        # Repositories made before the index existed have commits but no index
+        create_file("a.txt", "a")
+        create_file("sub/b.txt", "b")
+        commit_all("one")
+        os.remove(self.repo.gitdir / "index")
+        self.assertIn("nothing to commit, working tree clean", run(cmd_status, []))
+
+        os.remove(self.repo.gitdir / "index")
+        create_file("a.txt", "a3")
+        status = run(cmd_status, [])
+        self.assertIn("modified:   a.txt", status)
+        self.assertNotIn("deleted", status)
+        self.assertNotIn("Untracked", status)
+
+        os.remove(self.repo.gitdir / "index")
+        run(cmd_commit, ["-a", "-m", "three"])
+        self.assertEqual(self.head_files(), {"a.txt": b"a3", "sub/b.txt": b"b"})
+
+    def head_files(self):
+        tree_sha = object_read(self.repo, resolve_ref(self.repo, "HEAD")).kvlm[b'tree'].decode()
+        return {path: object_read(self.repo, sha).blobdata
+                for path, (_, sha) in staging.read_tree_paths(self.repo, tree_sha).items()}
+
+    def test_commit_reuses_unchanged_files(self):
+        create_file("a.txt", "a")
+        create_file("b.txt", "b")
+        age_files("a.txt", "b.txt")
+        commit_all("one")
+
+        create_file("b.txt", "b2")
+        hashed = []
+        real_hash = staging.object_hash_file
+
+        def counting_hash(path, repo=None, fmt=b'blob'):
+            hashed.append(path.name)
+            return real_hash(path, repo, fmt)
+
+        with patch.object(staging, "object_hash_file", counting_hash):
+            run(cmd_commit, ["-a", "-m", "two"])
+
+        self.assertEqual(hashed, ["b.txt"])
+
+    def test_checkout_writes_index(self):
+        create_file("a.txt", "a")
+        commit_all("one")
+        cmd_branch(["feature"])
+        create_file("a.txt", "a2")
+        commit_all("two")
+
+        run(cmd_checkout, ["feature"])
+        index = read_index(self.repo)
+        self.assertEqual(list(index.entries), ["a.txt"])
+        self.assertTrue(index.entries["a.txt"].stat_matches(os.stat("a.txt")))
+        self.assertNotIn("modified", run(cmd_status, []))
+
+
+class TestCacheTree(BaseTestCase):
+    def count_tree_writes(self, fn):
+        written = []
+        real_write = staging.object_write
+
+        def counting_write(obj, repo=None):
+            written.append(obj.fmt)
+            return real_write(obj, repo)
+
+        with patch.object(staging, "object_write", counting_write):
+            fn()
+        return written.count(b'tree')
+
+    def test_only_changed_path_rebuilt(self):
+        for top in "abc":
+            for sub in "xyz":
+                create_file(f"{top}/{sub}/deep/file.txt", top + sub)
+        commit_all("one")
+
+        index = read_index(self.repo)
+        self.assertTrue(index.cache_tree.is_valid())
+        self.assertEqual(index.cache_tree.entry_count, 9)
+        self.assertEqual(index.cache_tree.children["a"].entry_count, 3)
+
+        create_file("b/y/deep/file.txt", "changed")
+        # root, b, b/y, b/y/deep
+        self.assertEqual(self.count_tree_writes(lambda: run(cmd_commit, ["-a", "-m", "two"])), 4)
+        self.assertEqual(self.count_tree_writes(lambda: run(cmd_write_tree, [])), 0)
+
+    def test_removed_file_invalidates(self):
+        create_file("a/one.txt", "1")
+        create_file("a/two.txt", "2")
+        commit_all("one")
+
+        os.remove("a/two.txt")
+        run(cmd_commit, ["-a", "-m", "two"])
+        index = read_index(self.repo)
+        self.assertEqual(index.cache_tree.children["a"].entry_count, 1)
+
+    def test_checkout_primes_cache_tree(self):
+        create_file("a/b/c.txt", "c")
+        commit_all("one")
+        cmd_branch(["feature"])
+        run(cmd_checkout, ["feature"])
+
+        index = read_index(self.repo)
+        self.assertTrue(index.cache_tree.find(["a", "b"]).is_valid())
+        self.assertEqual(self.count_tree_writes(lambda: run(cmd_write_tree, [])), 0)
+
+
+class TestParallelSnapshot(BaseTestCase):
+    def test_threads_do_not_change_tree(self):
+        for i in range(40):
+            create_file(f"d{i % 4}/f{i}.txt", f"content {i}\n" * (i + 1))
+
+        cmd_config(["core.threads", "1"])
+        cmd_add(["."])
+        serial = run(cmd_write_tree, []).strip()
+
+        os.remove(self.repo.gitdir / "index")
+        cmd_config(["core.threads", "8"])
+        cmd_add(["."])
+        parallel = run(cmd_write_tree, []).strip()
+
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(read_index(self.repo).entries), 40)
+
+
+class TestIncrementalCheckout(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            create_file(f"keep/f{i}.txt", f"keep {i}\n")
+        create_file("change.txt", "v1\n")
+        create_file("gone/old.txt", "old\n")
+        commit_all("one")
+        cmd_branch(["feature"])
+
+        create_file("change.txt", "v2\n")
+        os.remove("gone/old.txt")
+        os.rmdir("gone")
+        create_file("new/dir/added.txt", "added\n")
+        commit_all("two")
+
+    def checkout(self, target):
+        written = []
+        real_write = checkout._write_blob
+
+        def counting_write(repo, sha, item_path):
+            written.append(item_path.relative_to(self.repo.worktree).as_posix())
+            return real_write(repo, sha, item_path)
+
+        with patch.object(checkout, "_write_blob", counting_write):
+            run(cmd_checkout, [target])
+        return sorted(written)
+
+    def assert_index_matches(self, tree_sha):
+        index = read_index(self.repo)
+        expected = staging.read_tree_paths(self.repo, tree_sha)
+        self.assertEqual({p: e.sha for p, e in index.entries.items()},
+                         {p: sha for p, (_, sha) in expected.items()})
+        self.assertEqual(index.cache_tree.sha, tree_sha)
+        self.assertEqual(index.cache_tree.entry_count, len(expected))
+        for name, node in index.cache_tree.children.items():
+            self.assertEqual(node.entry_count, sum(p.startswith(name + "/") for p in expected))
+
+    def test_only_changed_files_touched(self):
+        self.assertEqual(self.checkout("feature"), ["change.txt", "gone/old.txt"])
+        self.assertFalse(os.path.exists("new"))
+        with open("change.txt") as f:
+            self.assertEqual(f.read(), "v1\n")
+        self.assert_index_matches(self.repo_tree("feature"))
+        self.assertNotIn("modified", run(cmd_status, []))
+
+        self.assertEqual(self.checkout("master"), ["change.txt", "new/dir/added.txt"])
+        self.assertFalse(os.path.exists("gone"))
+        self.assert_index_matches(self.repo_tree("master"))
+
+    def test_missing_index_treated_as_head(self):
+        os.remove(self.repo.gitdir / "index")
+        self.assertEqual(self.checkout("feature"), ["change.txt", "gone/old.txt"])
+        self.assert_index_matches(self.repo_tree("feature"))
+
+    def test_local_changes_to_other_files_kept(self):
+        create_file("keep/f0.txt", "local edit\n")
+        self.checkout("feature")
+        with open("keep/f0.txt") as f:
+            self.assertEqual(f.read(), "local edit\n")
+
+    def test_file_and_directory_swap(self):
+        os.remove("change.txt")
+        create_file("change.txt/inner.txt", "now a directory\n")
+        commit_all("three")
+
+        self.assertEqual(self.checkout("feature"), ["change.txt", "gone/old.txt"])
+        self.assertTrue(os.path.isfile("change.txt"))
+        self.assert_index_matches(self.repo_tree("feature"))
+
+        self.checkout("master")
+        self.assertTrue(os.path.isfile("change.txt/inner.txt"))
+        self.assert_index_matches(self.repo_tree("master"))
+
+    def assert_checkout_refused(self, target, message):
+        head = (self.repo.gitdir / "HEAD").read_text()
+        stderr = StringIO()
+        with patch.object(sys, "stderr", stderr), self.assertRaises(SystemExit) as raised:
+            self.checkout(target)
+        self.assertEqual(raised.exception.code, 1)
+        self.assertIn(message, stderr.getvalue())
+        self.assertEqual((self.repo.gitdir / "HEAD").read_text(), head)
+
+    def test_local_changes_block_checkout(self):
+        create_file("change.txt", "local edit\n")
+        self.assert_checkout_refused("feature", "Your local changes to the following files would be overwritten")
+        with open("change.txt") as f:
+            self.assertEqual(f.read(), "local edit\n")
+
+        # Staged changes count too, even when the working tree matches HEAD
+        cmd_add(["change.txt"])
+        create_file("change.txt", "v2\n")
+        self.assert_checkout_refused("feature", "\tchange.txt\n")
+
+    def test_untracked_file_blocks_checkout(self):
+        create_file("gone/old.txt", "untracked\n")
+        self.assert_checkout_refused("feature", "untracked working tree files would be overwritten")
+        with open("gone/old.txt") as f:
+            self.assertEqual(f.read(), "untracked\n")
+
+    def test_edited_file_kept_when_directory_replaces_it(self):
+        os.remove("change.txt")
+        create_file("change.txt/inner.txt", "now a directory\n")
+        commit_all("three")
+        self.checkout("feature")
+
+        create_file("change.txt", "local edit\n")
+        self.assert_checkout_refused("master", "\tchange.txt\n")
+        with open("change.txt") as f:
+            self.assertEqual(f.read(), "local edit\n")
+
+    def test_untracked_files_kept_when_file_replaces_directory(self):
+        os.remove("change.txt")
+        create_file("change.txt/inner.txt", "now a directory\n")
+        commit_all("three")
+        create_file("change.txt/untracked.txt", "mine\n")
+
+        self.assert_checkout_refused("feature", "would lose untracked files in them:\n\tchange.txt\n")
+        # Nothing was deleted before giving up
+        self.assertTrue(os.path.isfile("change.txt/inner.txt"))
+        self.assertTrue(os.path.isfile("new/dir/added.txt"))
+        self.assert_index_matches(self.repo_tree("master"))
+
+    def repo_tree(self, branch):
+        commit = object_read(self.repo, resolve_ref(self.repo, branch))
+        return commit.kvlm[b'tree'].decode()
+
+
+class TestParallelCheckout(BaseTestCase):
+    def test_workers_write_same_files_and_index(self):
+        for i in range(30):
+            create_file(f"d{i % 3}/f{i}.txt", f"content {i}\n" * (i * 50 + 1))
+        commit_all("one")
+        gc(self.repo)
+        tree_sha = object_read(self.repo, resolve_ref(self.repo, "HEAD")).kvlm[b'tree'].decode()
+
+        results = []
+        for workers in ("1", "4"):
+            cmd_config(["checkout.workers", workers])
+            cmd_config(["checkout.thresholdForParallelism", "1"])
+            for i in range(30):
+                os.remove(f"d{i % 3}/f{i}.txt")
+
+            index = GitIndex()
+            count = checkout.checkout_tree(self.repo, object_read(self.repo, tree_sha),
+                                           self.repo.worktree, index, tree_sha)
+            files = {}
+            for i in range(30):
+                with open(f"d{i % 3}/f{i}.txt") as f:
+                    files[i] = f.read()
+            results.append((count, files, {p: e.sha for p, e in index.entries.items()},
+                            index.cache_tree.sha))
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1][1][7], "content 7\n" * 351)
+        self.assertEqual(results[1][3], tree_sha)
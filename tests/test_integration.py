@@ -49,6 +49,7 @@ def test_workflow():
     
     # 3. Commit 1
     print("[3] Commit 1")
+    run_gitlite(["add", "hello.txt"])
     res = run_gitlite(["commit", "-m", "First Commit"])
     assert "[detached HEAD" in res.stdout or "refs/heads/master" in res.stdout
     commit1_sha = res.stdout.split()[1].strip("[]")
@@ -61,7 +62,7 @@ def test_workflow():
         
     # 5. Commit 2
     print("[5] Commit 2")
-    res = run_gitlite(["commit", "-m", "Second Commit"])
+    res = run_gitlite(["commit", "-a", "-m", "Second Commit"])
     commit2_sha = res.stdout.split()[1].strip("[]")
     print(f"    Commit 2 SHA: {commit2_sha}")
     
@@ -0,0 +1,418 @@
+import hashlib
+import random
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from tests.base import BaseTestCase, make_delta
+from unittest.mock import patch
+from gitlite.storage import object_read, object_read_raw, object_open, object_write, object_read_many, object_info
+from gitlite.objects.blob import GitBlob
+from gitlite.pack.packfile import GitPack
+from gitlite.pack.cache import DeltaBaseCache
+from gitlite.cache import ObjectCache
+from gitlite.pack.delta import create_delta, patch_delta
+from gitlite.pack.types import OBJ_BLOB, OBJ_TREE, OBJ_TAG, OBJ_OFS_DELTA
+
+TYPE_NAMES = {1: b'commit', 2: b'tree', 3: b'blob', 4: b'tag'}
+
+
+def encode_header(type_num, size):
+    byte = (type_num << 4) | (size & 15)
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 127
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+
+def encode_ofs(distance):
+    out = bytearray([distance & 127])
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.insert(0, 0x80 | (distance & 127))
+        distance >>= 7
+    return bytes(out)
+
+
+def write_test_pack(pack_dir, name, objects):
+    """Write a pack and v2 index.
+
+    `objects` is a list of (type_num, data, base_pos); when base_pos is set the
+    object is stored as an OFS_DELTA against objects[base_pos]. Returns the SHAs.
+    """
+    pack_dir.mkdir(parents=True, exist_ok=True)
+    body = bytearray(b'PACK' + struct.pack(">II", 2, len(objects)))
+    offsets = []
+    shas = []
+    crcs = []
+
+    for type_num, data, base_pos in objects:
+        offset = len(body)
+        if base_pos is None:
+            entry = encode_header(type_num, len(data)) + zlib.compress(data)
+        else:
+            delta = make_delta(objects[base_pos][1], data)
+            entry = (encode_header(OBJ_OFS_DELTA, len(delta))
+                     + encode_ofs(offset - offsets[base_pos])
+                     + zlib.compress(delta))
+        body += entry
+        offsets.append(offset)
+        crcs.append(zlib.crc32(entry))
+        full = TYPE_NAMES[type_num] + b' ' + str(len(data)).encode() + b'\x00' + data
+        shas.append(hashlib.sha1(full).hexdigest())
+
+    pack_sha = hashlib.sha1(body).digest()
+    (pack_dir / f"{name}.pack").write_bytes(bytes(body) + pack_sha)
+
+    order = sorted(range(len(objects)), key=lambda i: shas[i])
+    idx = bytearray(b'\377tOc' + struct.pack(">I", 2))
+    for first in range(256):
+        idx += struct.pack(">I", sum(1 for s in shas if int(s[:2], 16) <= first))
+    for i in order:
+        idx += bytes.fromhex(shas[i])
+    for i in order:
+        idx += struct.pack(">I", crcs[i])
+    for i in order:
+        idx += struct.pack(">I", offsets[i])
+    idx += pack_sha
+    idx += hashlib.sha1(idx).digest()
+    (pack_dir / f"{name}.idx").write_bytes(bytes(idx))
+
+    return shas
+
+
+class TestPackRegistry(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pack_dir = self.repo.gitdir / "objects" / "pack"
+
+    def test_read_from_multiple_packs(self):
+        shas_a = write_test_pack(self.pack_dir, "pack-a", [(OBJ_BLOB, b"alpha", None)])
+        shas_b = write_test_pack(self.pack_dir, "pack-b", [(OBJ_BLOB, b"beta", None)])
+
+        self.assertEqual(object_read(self.repo, shas_a[0]).blobdata, b"alpha")
+        self.assertEqual(object_read(self.repo, shas_b[0]).blobdata, b"beta")
+        self.assertEqual(len(self.repo.packs.packs), 2)
+
+    def test_indexes_loaded_once_and_hits_ordered(self):
+        shas_a = write_test_pack(self.pack_dir, "pack-a", [(OBJ_BLOB, b"alpha", None)])
+        write_test_pack(self.pack_dir, "pack-b", [(OBJ_BLOB, b"beta", None)])
+
+        object_read(self.repo, shas_a[0])
+        packs = list(self.repo.packs.packs)
+        self.assertEqual(self.repo.packs.packs[0].idx_path.name, "pack-a.idx")
+
+        object_read(self.repo, shas_a[0])
+        self.assertEqual(sorted(map(id, self.repo.packs.packs)), sorted(map(id, packs)))
+
+    def test_new_pack_picked_up(self):
+        write_test_pack(self.pack_dir, "pack-a", [(OBJ_BLOB, b"alpha", None)])
+        self.assertIsNone(object_read(self.repo, "0" * 40))
+
+        shas = write_test_pack(self.pack_dir, "pack-b", [(OBJ_BLOB, b"late", None)])
+        self.repo.packs.refresh(force=True)
+        self.assertEqual(object_read(self.repo, shas[0]).blobdata, b"late")
+
+    def test_open_handles_bounded(self):
+        self.repo.packs.max_open = 2
+        shas = []
+        for i in range(4):
+            shas += write_test_pack(self.pack_dir, f"pack-{i}", [(OBJ_BLOB, f"blob {i}".encode(), None)])
+
+        for sha in shas:
+            self.assertIsNotNone(object_read(self.repo, sha))
+
+        still_open = [p for p in self.repo.packs.packs if p.f_idx or p.f_pack]
+        self.assertLessEqual(len(still_open), 2)
+
+    def test_ofs_delta(self):
+        base = b"line\n" * 50
+        target = base + b"extra\n"
+        shas = write_test_pack(self.pack_dir, "pack-d", [
+            (OBJ_BLOB, base, None),
+            (OBJ_BLOB, target, 0),
+        ])
+        self.assertEqual(object_read(self.repo, shas[1]).blobdata, target)
+
+    def test_object_open_packed(self):
+        base = bytes(range(256)) * 600
+        target = base + b"extra\n"
+        shas = write_test_pack(self.pack_dir, "pack-s", [
+            (OBJ_BLOB, base, None),
+            (OBJ_BLOB, target, 0),
+        ])
+        for sha, data in zip(shas, [base, target]):
+            with object_open(self.repo, sha) as reader:
+                self.assertEqual(reader.fmt, b"blob")
+                self.assertEqual(reader.size, len(data))
+                first = reader.read(100)
+                self.assertEqual(first + reader.read(), data)
+
+
+    def test_read_many(self):
+        base = b"line\n" * 50
+        shas = write_test_pack(self.pack_dir, "pack-r", [
+            (OBJ_BLOB, base, None),
+            (OBJ_BLOB, base + b"one\n", 0),
+            (OBJ_BLOB, base + b"two\n", 0),
+        ])
+        loose = object_write(GitBlob(b"loose"), self.repo)
+        requested = [shas[2], "0" * 40, loose, shas[0], shas[1], shas[2]]
+
+        reads = []
+        real_read = GitPack.read_compressed_data
+
+        def counting_read(pack, pos, size):
+            reads.append(pos)
+            return real_read(pack, pos, size)
+
+        with patch.object(GitPack, "read_compressed_data", counting_read):
+            results = list(object_read_many(self.repo, requested))
+
+        self.assertEqual([sha for sha, _, _ in results], [loose, shas[0], shas[1], shas[2], "0" * 40])
+        self.assertEqual([data for _, _, data in results],
+                         [b"loose", base, base + b"one\n", base + b"two\n", None])
+        # The base once, then the two deltas
+        self.assertEqual(len(reads), 3)
+
+
+    def test_object_info(self):
+        base = b"tag data\n" * 50
+        shas = write_test_pack(self.pack_dir, "pack-i", [
+            (OBJ_TAG, base, None),
+            (OBJ_TAG, base + b"one\n", 0),
+            (OBJ_TAG, base + b"one\ntwo\n", 1),
+        ])
+        loose = object_write(GitBlob(b"loose"), self.repo)
+
+        # Neither the deltas nor their base are inflated
+        with patch.object(GitPack, "read_compressed_data", side_effect=AssertionError):
+            self.assertEqual(object_info(self.repo, shas[2]), (OBJ_TAG, len(base) + 8))
+            self.assertEqual(object_info(self.repo, shas[0]), (OBJ_TAG, len(base)))
+        self.assertEqual(object_info(self.repo, loose), (OBJ_BLOB, 5))
+        self.assertEqual(object_info(self.repo, "0" * 40), (None, None))
+
+
+class TestGitPack(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pack_dir = self.repo.gitdir / "objects" / "pack"
+        base = b"".join(b"row %d\n" % i for i in range(200))
+        self.objects = [
+            (OBJ_BLOB, base, None),
+            (OBJ_BLOB, base + b"tail\n", 0),
+            (OBJ_BLOB, b"x" * 70000, None),
+        ]
+        self.shas = write_test_pack(self.pack_dir, "pack-m", self.objects)
+
+    def check_pack(self, pack):
+        for sha, (type_num, data, _) in zip(self.shas, self.objects):
+            offset = pack.find_offset(sha)
+            self.assertIsNotNone(offset)
+            self.assertEqual(pack.get_raw_object(offset), (type_num, data))
+        self.assertIsNone(pack.find_offset("f" * 40))
+        pack.close()
+
+    def test_mmap_mode(self):
+        pack = GitPack(self.pack_dir / "pack-m.idx")
+        pack.load_index()
+        self.assertIsNotNone(pack.idx_view)
+        self.check_pack(pack)
+        self.assertIsNone(pack.idx_view)
+
+    def test_file_mode(self):
+        pack = GitPack(self.pack_dir / "pack-m.idx", use_mmap=False)
+        pack.load_index()
+        self.assertIsNone(pack.idx_view)
+        self.check_pack(pack)
+
+    def test_threads_share_a_pack(self):
+        for use_mmap in (True, False):
+            pack = GitPack(self.pack_dir / "pack-m.idx", use_mmap=use_mmap)
+            expected = {sha: data for sha, (_, data, _) in zip(self.shas, self.objects)}
+
+            def read(sha):
+                for _ in range(20):
+                    pack.delta_cache.clear()
+                    _, data = pack.get_raw_object(pack.find_offset(sha))
+                    if data != expected[sha]:
+                        return False
+                    # Closing under the other threads' feet reopens the pack
+                    pack.close()
+                return True
+
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                self.assertTrue(all(pool.map(read, self.shas * 4)))
+
+
+class TestDeltaBaseCache(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pack_dir = self.repo.gitdir / "objects" / "pack"
+
+    def test_deep_chain_without_recursion(self):
+        objects = [(OBJ_BLOB, b"v0\n", None)]
+        for i in range(1, 1100):
+            objects.append((OBJ_BLOB, objects[-1][1] + b"v%d\n" % i, i - 1))
+        shas = write_test_pack(self.pack_dir, "pack-deep", objects)
+
+        obj = object_read(self.repo, shas[-1])
+        self.assertEqual(obj.blobdata, objects[-1][1])
+
+    def test_shared_chain_hits_cache(self):
+        objects = [(OBJ_BLOB, b"base\n" * 20, None)]
+        for i in range(1, 10):
+            objects.append((OBJ_BLOB, objects[-1][1] + b"v%d\n" % i, i - 1))
+        shas = write_test_pack(self.pack_dir, "pack-chain", objects)
+
+        cache = self.repo.packs.delta_cache
+        object_read(self.repo, shas[-1])
+        hits = cache.hits
+        # Past the object cache, which would answer without the pack
+        self.repo.object_cache.clear()
+        object_read(self.repo, shas[-1])
+        self.assertGreater(cache.hits, hits)
+        self.assertEqual(object_read(self.repo, shas[5]).blobdata, objects[5][1])
+
+    def test_eviction_by_size(self):
+        cache = DeltaBaseCache(max_bytes=10)
+        cache.put(("p", 1), OBJ_BLOB, b"12345")
+        cache.put(("p", 2), OBJ_BLOB, b"12345")
+        cache.put(("p", 3), OBJ_BLOB, b"123")
+        self.assertIsNone(cache.get(("p", 1)))
+        self.assertEqual(cache.get(("p", 3)), (OBJ_BLOB, b"123"))
+        self.assertLessEqual(cache.total_bytes, 10)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
+class TestObjectCache(BaseTestCase):
+    def test_repeated_reads_hit_cache(self):
+        sha = object_write(GitBlob(b"hello"), self.repo)
+        self.assertEqual(object_read(self.repo, sha).blobdata, b"hello")
+        (self.repo.gitdir / "objects" / sha[:2] / sha[2:]).unlink()
+        self.assertEqual(object_read(self.repo, sha).blobdata, b"hello")
+
+        stats = self.repo.object_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["blobs"]["entries"], 1)
+        self.assertEqual(stats["objects"]["entries"], 0)
+
+    def test_callers_cannot_change_cached_data(self):
+        pack_dir = self.repo.gitdir / "objects" / "pack"
+        base = b"".join(b"row %d\n" % i for i in range(200))
+        target = base + b"tail\n"
+        base_sha, sha = write_test_pack(pack_dir, "pack-c", [(OBJ_BLOB, base, None), (OBJ_BLOB, target, 0)])
+        for name in (sha, base_sha, sha, base_sha):
+            blob = object_read(self.repo, name)
+            blob.blobdata += b"X"
+        self.assertEqual(object_read_raw(self.repo, sha), (OBJ_BLOB, target))
+        self.assertEqual(object_read_raw(self.repo, base_sha), (OBJ_BLOB, base))
+
+        # Nor can they change a delta base cached by the pack
+        self.repo.object_cache.clear()
+        pack = self.repo.packs.packs[0]
+        _, data = pack.get_raw_object(pack.find_offset(base_sha))
+        self.assertIsInstance(data, bytes)
+
+    def test_uncached_blob_not_copied(self):
+        pack_dir = self.repo.gitdir / "objects" / "pack"
+        data = b"x" * 1000
+        (sha,) = write_test_pack(pack_dir, "pack-d", [(OBJ_BLOB, data, None)])
+        pack, offset = self.repo.packs.find(sha)
+        # Handed back as inflated: a plain blob goes into no cache here
+        self.assertIsInstance(pack.get_raw_object(offset)[1], bytearray)
+
+        small = ObjectCache()
+        buf = bytearray(b"abc")
+        small.put("s", OBJ_BLOB, buf)
+        buf += b"X"
+        self.assertEqual(small.get("s"), (OBJ_BLOB, b"abc"))
+
+    def test_separate_budgets(self):
+        cache = ObjectCache(max_bytes=10, max_blob_bytes=6)
+        cache.put("t1", OBJ_TREE, b"12345")
+        cache.put("b1", OBJ_BLOB, b"12345")
+        cache.put("b2", OBJ_BLOB, b"123")
+        cache.put("big", OBJ_BLOB, b"1234567")
+        self.assertIsNone(cache.get("b1"))
+        self.assertIsNone(cache.get("big"))
+        self.assertEqual(cache.get("t1"), (OBJ_TREE, b"12345"))
+        self.assertEqual(cache.get("b2"), (OBJ_BLOB, b"123"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (2, 2, 1))
+        self.assertEqual(stats["blobs"]["bytes"], 3)
+
+    def test_size_from_config(self):
+        (self.repo.gitdir / "config").write_text("[core]\n\tobjectCacheSize = 2k\n\tblobCacheSize = 0\n")
+        sha = object_write(GitBlob(b"hello"), self.repo)
+        object_read(self.repo, sha)
+        stats = self.repo.object_cache.stats()
+        self.assertEqual(stats["objects"]["limit"], 2048)
+        self.assertEqual(stats["blobs"]["entries"], 0)
+
+
+class TestReadCompressedData(BaseTestCase):
+    def test_large_object_inflated_in_pieces(self):
+        pack_dir = self.repo.gitdir / "objects" / "pack"
+        data = b"\0" * (3 * 1024 * 1024) + b"end"
+        shas = write_test_pack(pack_dir, "pack-big", [(OBJ_BLOB, data, None)])
+
+        pack = GitPack(pack_dir / "pack-big.idx")
+        type_num, out = pack.get_raw_object(pack.find_offset(shas[0]))
+        self.assertEqual(len(out), len(data))
+        self.assertEqual(out, data)
+        pack.close()
+
+    def test_size_mismatch_detected(self):
+        pack_dir = self.repo.gitdir / "objects" / "pack"
+        shas = write_test_pack(pack_dir, "pack-s", [(OBJ_BLOB, b"0123456789", None)])
+
+        pack = GitPack(pack_dir / "pack-s.idx")
+        offset = pack.find_offset(shas[0])
+        _, _, _, pos = pack.read_entry_header(offset)
+        with self.assertRaises(Exception):
+            pack.read_compressed_data(offset + pos, 5)
+        with self.assertRaises(Exception):
+            pack.read_compressed_data(offset + pos, 20)
+        pack.close()
+
+
+class TestCreateDelta(BaseTestCase):
+    def check(self, base, target, max_size=None):
+        delta = create_delta(base, target, max_size)
+        self.assertEqual(patch_delta(base, delta), target)
+        return delta
+
+    def test_random_edits(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            base = bytes(rng.choice(b"ab\n") for _ in range(rng.randint(0, 2000)))
+            target = bytearray(base)
+            for _ in range(rng.randint(0, 8)):
+                pos = rng.randint(0, len(target))
+                if rng.random() < 0.5:
+                    target[pos:pos] = rng.randbytes(rng.randint(1, 300))
+                else:
+                    del target[pos:pos + rng.randint(1, 100)]
+            self.check(base, bytes(target))
+
+    def test_small_edit_gives_small_delta(self):
+        base = b"".join(b"line %d\n" % i for i in range(10000))
+        target = base.replace(b"line 5000\n", b"changed\n")
+        self.assertLess(len(self.check(base, target)), 64)
+
+    def test_copies_longer_than_one_instruction(self):
+        base = random.Random(1).randbytes(200000)
+        target = b"head" + base + b"tail"
+        self.assertLess(len(self.check(base, target)), 64)
+
+    def test_max_size(self):
+        base = b"a" * 100
+        target = random.Random(2).randbytes(1000)
+        self.assertIsNone(create_delta(base, target, max_size=100))
+        self.check(b"", target)
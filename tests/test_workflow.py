@@ -2,6 +2,7 @@ import sys
 from io import StringIO
 from tests.base import BaseTestCase, create_file
 from gitlite.commands.commit import cmd_commit
+from gitlite.commands.stage import cmd_add
 from gitlite.commands.inspect import cmd_log, cmd_ls_tree
 from gitlite.commands.branch import cmd_branch
 from gitlite.commands.checkout import cmd_checkout
@@ -21,6 +22,7 @@ class TestWorkflow(BaseTestCase):
         out = StringIO()
         sys.stdout = out
         try:
+            cmd_add(["hello.txt"])
             cmd_commit(["-m", "Commit 1"])
         finally:
             sys.stdout = saved_stdout
@@ -35,7 +37,7 @@ class TestWorkflow(BaseTestCase):
         out = StringIO()
         sys.stdout = out
         try:
-            cmd_commit(["-m", "Commit 2"])
+            cmd_commit(["-a", "-m", "Commit 2"])
         finally:
             sys.stdout = saved_stdout
             
@@ -68,6 +70,7 @@ class TestWorkflow(BaseTestCase):
         saved_stdout = sys.stdout
         sys.stdout = StringIO()
         try:
+            cmd_add(["f"])
             cmd_commit(["-m", "msg"])
             cmd_tag(["-a", "-m", "tm", "v1"])
         finally:
@@ -83,6 +86,7 @@ class TestWorkflow(BaseTestCase):
         saved_stdout = sys.stdout
         sys.stdout = StringIO()
         try:
+            cmd_add(["."])
             cmd_commit(["-m", "ignore"])
         finally:
             sys.stdout = saved_stdout
@@ -106,6 +110,7 @@ class TestWorkflow(BaseTestCase):
         saved_stdout = sys.stdout
         sys.stdout = StringIO()
         try:
+            cmd_add(["subdir"])
             cmd_commit(["-m", "subdir"])
         finally:
             sys.stdout = saved_stdout
@@ -120,4 +125,12 @@ class TestWorkflow(BaseTestCase):
             
         output = out.getvalue()
         self.assertIn("subdir", output)
-        self.assertIn("tree", output)
\ No newline at end of file
+        self.assertIn("tree", output)
+
+        out = StringIO()
+        sys.stdout = out
+        try:
+            cmd_ls_tree(["-l", "HEAD"])
+        finally:
+            sys.stdout = saved_stdout
+        self.assertRegex(out.getvalue(), r"040000 tree [0-9a-f]{40}       -\tsubdir")
\ No newline at end of file